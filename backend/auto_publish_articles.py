@@ -12,6 +12,8 @@ from dotenv import load_dotenv
 import sys
 import logging
 
+from translit import slugify
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -32,27 +34,6 @@ CATEGORIES = [
     {"id": "care", "name": "Уход за экипировкой"}
 ]
 
-# Transliteration map
-TRANSLIT_MAP = {
-    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
-    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
-    'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
-}
-
-def transliterate(text):
-    """Convert Cyrillic to Latin"""
-    import re
-    result = []
-    for char in text.lower():
-        result.append(TRANSLIT_MAP.get(char, char))
-    
-    slug = ''.join(result)
-    slug = re.sub(r'[^a-z0-9]+', '-', slug)
-    return slug.strip('-')
-
-
 async def generate_topic_with_ai(category_id):
     """Use AI to generate a relevant article topic"""
     try:
@@ -211,7 +192,7 @@ async def publish_articles():
                 continue
             
             # Create slug
-            slug = transliterate(article_data['title'])
+            slug = slugify(article_data['title'])
             
             # Check if article with this slug already exists
             existing = await db.articles.find_one({"slug": slug})
@@ -0,0 +1,101 @@
+"""
+Benchmark: per-request CPU of the product list endpoint before/after fast_json
+Run: python bench_serialization.py [products] [requests]
+
+Serves the same in-memory list of product documents (2,000 by default)
+through two routes of a throwaway FastAPI app:
+
+  before  - [Product(**p) for p in docs] validated again via response_model
+  after   - ModelSerializer(Product) + orjson, as used by GET /api/products
+
+and reports CPU time (time.process_time) per request for each.
+"""
+import sys
+import time
+import uuid
+import random
+from datetime import datetime, timezone
+from typing import List
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from models import Product
+from fast_json import ModelSerializer, json_response
+
+
+def make_products(count: int) -> List[dict]:
+    """Synthetic product documents shaped like the production catalog"""
+    categories = ["jersey", "pants", "training", "jacket"]
+    docs = []
+    for i in range(count):
+        variant_id = str(uuid.uuid4())
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "name": f"Хоккейная форма модель {i}",
+            "category": random.choice(categories),
+            "description": "Игровая форма из дышащей ткани с сублимационной печатью. " * 3,
+            "base_price": float(random.randint(1500, 25000)),
+            "images": [f"/api/uploads/{uuid.uuid4()}.webp" for _ in range(3)],
+            "variants": [{"id": variant_id, "name": "Викинги", "technical_image": f"/api/uploads/{uuid.uuid4()}.png"}],
+            "product_images": [
+                {"url": f"/api/uploads/{uuid.uuid4()}.webp", "variant_id": variant_id, "size_category": "adults"}
+                for _ in range(4)
+            ],
+            "features": ["Дышащая ткань", "Усиленные швы", "Сублимация"],
+            "size_categories": ["kids", "teens", "adults"],
+            "status": "active",
+            "is_featured": False,
+            "is_active": True,
+            "size_category_images": {"kids": [], "teens": [], "adults": []},
+            "detailed_description": "<p>Подробное описание</p>" * 20,
+            "specifications": {"Материал": "полиэстер", "Плотность": "160 г/м²", "Страна": "Россия"},
+            "main_features": ["Лёгкая", "Прочная"],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        })
+    return docs
+
+
+def build_app(docs: List[dict]) -> FastAPI:
+    app = FastAPI()
+    serializer = ModelSerializer(Product)
+
+    @app.get("/before", response_model=List[Product])
+    async def before():
+        return [Product(**doc) for doc in docs]
+
+    @app.get("/after")
+    async def after():
+        return json_response(serializer.dumps(docs))
+
+    return app
+
+
+def measure(client: TestClient, path: str, requests: int) -> float:
+    client.get(path)  # warm up
+    start = time.process_time()
+    for _ in range(requests):
+        response = client.get(path)
+        assert response.status_code == 200
+    return (time.process_time() - start) / requests
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    docs = make_products(count)
+    client = TestClient(build_app(docs))
+
+    print("=" * 60)
+    print(f"GET product list: {count} products, {requests} requests each")
+    print("=" * 60)
+    before = measure(client, "/before", requests)
+    after = measure(client, "/after", requests)
+    print(f"before (Pydantic + response_model): {before * 1000:8.1f} ms CPU/request")
+    print(f"after  (ModelSerializer + orjson):  {after * 1000:8.1f} ms CPU/request")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+In-process cache for catalog reads (GET /api/products, /api/products/{id})
+
+Entries are bounded in number and expire after a TTL. Within a process,
+product write endpoints invalidate entries precisely; writes made by another
+worker process are noticed through the shared collection versions (see
+http_cache.CollectionVersions), which clear the cache when the products
+version moves, so a cached body never outlives the ETag it was served with
+by more than ETAG_SYNC_INTERVAL.
+
+A read that misses queries the database before storing its result; a write
+invalidating the cache in the meantime would leave that stale result cached
+under the new version. Readers therefore take `generation` before the query
+and pass it to set_list/set_item, which skip the store if any invalidation
+happened since.
+"""
+import logging
+from typing import Any, Dict, Hashable, Iterable, Optional, Set
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class _ListEntry:
+    """Cached listing together with what it depends on"""
+    __slots__ = ("value", "category", "ids")
+
+    def __init__(self, value: Any, category: Optional[str], ids: Set[str]):
+        self.value = value
+        self.category = category  # None = listing spans all categories
+        self.ids = ids
+
+
+class CatalogCache:
+    """Per-query-shape listing entries plus per-id product entries"""
+
+    def __init__(self, max_lists: int = 256, max_items: int = 4096, ttl: float = 300):
+        self._lists: TTLCache = TTLCache(maxsize=max_lists, ttl=ttl)
+        self._items: TTLCache = TTLCache(maxsize=max_items, ttl=ttl)
+        self.generation = 0  # Bumped by every invalidation
+        self.stats_counters: Dict[str, int] = {
+            "list_hits": 0,
+            "list_misses": 0,
+            "item_hits": 0,
+            "item_misses": 0,
+            "invalidations": 0,
+            "stale_fills": 0,
+        }
+
+    # ---- listings ----
+
+    def get_list(self, key: Hashable) -> Any:
+        """Return a cached listing or None"""
+        entry = self._lists.get(key, _MISSING)
+        if entry is _MISSING:
+            self.stats_counters["list_misses"] += 1
+            return None
+        self.stats_counters["list_hits"] += 1
+        return entry.value
+
+    def set_list(
+        self, key: Hashable, value: Any, category: Optional[str], ids: Iterable[str], generation: int
+    ) -> None:
+        """
+        Cache a listing
+
+        Args:
+            key: Hashable description of the query shape
+            value: Value to return on hit
+            category: Category filter of the query (None if unfiltered)
+            ids: Ids of the products contained in the listing
+            generation: `generation` read before the listing was queried
+        """
+        if self._stale(generation):
+            return
+        self._lists[key] = _ListEntry(value, category, set(ids))
+
+    # ---- single products ----
+
+    def get_item(self, product_id: str) -> Any:
+        """Return a cached product or None"""
+        value = self._items.get(product_id, _MISSING)
+        if value is _MISSING:
+            self.stats_counters["item_misses"] += 1
+            return None
+        self.stats_counters["item_hits"] += 1
+        return value
+
+    def set_item(self, product_id: str, value: Any, generation: int) -> None:
+        """Cache a product; `generation` as read before the product was queried"""
+        if self._stale(generation):
+            return
+        self._items[product_id] = value
+
+    def _stale(self, generation: int) -> bool:
+        if generation == self.generation:
+            return False
+        self.stats_counters["stale_fills"] += 1
+        return True
+
+    # ---- invalidation ----
+
+    def invalidate_products(self, product_ids: Iterable[str], categories: Iterable[Optional[str]]) -> None:
+        """
+        Drop every entry a write to the given products can affect
+
+        Args:
+            product_ids: Ids of created/updated/deleted products
+            categories: Categories of those products before and after the write
+        """
+        ids = set(product_ids)
+        cats = {c for c in categories if c is not None}
+        self.generation += 1
+
+        for product_id in ids:
+            self._items.pop(product_id, None)
+
+        stale = [
+            key for key, entry in list(self._lists.items())
+            if entry.category is None or entry.category in cats or not entry.ids.isdisjoint(ids)
+        ]
+        for key in stale:
+            self._lists.pop(key, None)
+
+        self.stats_counters["invalidations"] += 1
+        logger.debug(f"Catalog cache: invalidated {len(ids)} items and {len(stale)} listings")
+
+    def drop_lists(self, kind: str) -> None:
+        """Drop every listing whose key starts with `kind` (e.g. "page")"""
+        self.generation += 1
+        stale = [key for key in list(self._lists.keys()) if isinstance(key, tuple) and key[:1] == (kind,)]
+        for key in stale:
+            self._lists.pop(key, None)
+        self.stats_counters["invalidations"] += 1
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._lists.clear()
+        self._items.clear()
+        self.stats_counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current sizes"""
+        return {
+            **self.stats_counters,
+            "lists_cached": len(self._lists),
+            "items_cached": len(self._items),
+        }
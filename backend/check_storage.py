@@ -0,0 +1,76 @@
+"""
+Round-trip check of the configured upload storage
+Run: python check_storage.py [--create-bucket]
+
+Writes, lists, downloads and deletes one test object through the driver
+selected by STORAGE_BACKEND. To try the S3 driver without a cloud account,
+start MinIO locally and point the driver at it:
+
+    docker run -p 9000:9000 -e MINIO_ROOT_USER=minio -e MINIO_ROOT_PASSWORD=minio123 \
+        minio/minio server /data
+    STORAGE_BACKEND=s3 S3_ENDPOINT_URL=http://localhost:9000 S3_BUCKET=avk-uploads \
+        AWS_ACCESS_KEY_ID=minio AWS_SECRET_ACCESS_KEY=minio123 \
+        python check_storage.py --create-bucket
+"""
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+from dotenv import load_dotenv
+
+from storage import S3Storage, create_storage
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+UPLOAD_DIR = ROOT_DIR / "uploads"
+
+
+async def check_storage(create_bucket: bool):
+    storage = create_storage(UPLOAD_DIR)
+    temp_dir = UPLOAD_DIR / ".tmp"
+    temp_dir.mkdir(parents=True, exist_ok=True)
+
+    print("=" * 60)
+    print(f"Checking storage backend: {os.environ.get('STORAGE_BACKEND', 'local')}")
+    print("=" * 60)
+
+    if create_bucket and isinstance(storage, S3Storage):
+        try:
+            await asyncio.to_thread(storage.client.create_bucket, Bucket=storage.bucket)
+            print(f"✓ Bucket {storage.bucket} created")
+        except storage.client.exceptions.BucketAlreadyOwnedByYou:
+            print(f"✓ Bucket {storage.bucket} already exists")
+
+    key = f"healthcheck/{uuid.uuid4()}.txt"
+    payload = os.urandom(256 * 1024)
+    source = temp_dir / f"{uuid.uuid4()}.part"
+    source.write_bytes(payload)
+
+    await storage.put_file(key, source, "text/plain")
+    print(f"✓ put {key}")
+
+    if not await storage.exists(key):
+        print("❌ Object not found after upload")
+        sys.exit(1)
+    print("✓ exists")
+
+    listed = [k async for k in storage.iter_keys("healthcheck/")]
+    print(f"{'✓' if key in listed else '❌'} listed ({len(listed)} object(s) under healthcheck/)")
+
+    async with storage.local_copy(key, temp_dir) as copy:
+        same = copy.read_bytes() == payload
+    print(f"{'✓' if same else '❌'} download matches")
+
+    await storage.delete([key])
+    gone = not await storage.exists(key)
+    print(f"{'✓' if gone else '❌'} deleted")
+
+    print("=" * 60)
+    if not (same and gone and key in listed):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(check_storage(create_bucket="--create-bucket" in sys.argv))
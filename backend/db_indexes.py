@@ -0,0 +1,203 @@
+"""
+MongoDB index manifest and query shapes issued by the server
+
+ensure_indexes() is called on application startup and is idempotent:
+create_index is a no-op for an index that already exists with the same
+keys and options. verify_indexes.py explains every entry of QUERY_SHAPES
+and fails if any of them still needs a collection scan.
+"""
+import logging
+from typing import Any, Dict, List
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from idempotency import IDEMPOTENCY_TTL
+
+logger = logging.getLogger(__name__)
+
+# Documents written before the `id` field existed must not collide on null
+_HAS_ID = {"partialFilterExpression": {"id": {"$exists": True}}}
+
+# collection -> list of (keys, options)
+INDEX_MANIFEST: Dict[str, List[Any]] = {
+    "products": [
+        ([("id", ASCENDING)], {"unique": True, "name": "id_unique", **_HAS_ID}),
+        ([("category", ASCENDING), ("is_active", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+         {"name": "category_active_keyset"}),
+        ([("is_active", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+         {"name": "active_keyset"}),
+        ([("created_at", DESCENDING), ("id", DESCENDING)], {"name": "keyset"}),
+        # Catalog filters used without a category (see build_product_query)
+        ([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {"name": "status_keyset"}),
+        ([("size_categories", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+         {"name": "size_categories_keyset"}),
+        ([("base_price", ASCENDING)], {"name": "base_price"}),
+        # Legacy order items priced by product name (see price_index.py)
+        ([("name", ASCENDING)], {"name": "name"}),
+    ],
+    "orders": [
+        ([("id", ASCENDING)], {"unique": True, "name": "id_unique", **_HAS_ID}),
+        ([("created_at", DESCENDING), ("id", DESCENDING)], {"name": "keyset"}),
+        # Equality filters of the admin list first, then the keyset sort (date ranges use it too)
+        ([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {"name": "status_keyset"}),
+        ([("customer_email", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+         {"name": "customer_email_keyset"}),
+        ([("customer_phone", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+         {"name": "customer_phone_keyset"}),
+        # Amount range alone (the keyset sort is applied in memory on the matching orders)
+        ([("total_amount", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+         {"name": "total_amount_keyset"}),
+        # Orders changed while the sales rollups are rebuilt (see sales_rollups.py)
+        ([("updated_at", DESCENDING)], {"name": "updated_at"}),
+    ],
+    "articles": [
+        ([("id", ASCENDING)], {"unique": True, "name": "id_unique", **_HAS_ID}),
+        ([("slug", ASCENDING)], {"unique": True, "name": "slug_unique"}),
+        ([("is_published", ASCENDING), ("created_at", DESCENDING)], {"name": "published_created_at"}),
+        ([("category", ASCENDING), ("is_published", ASCENDING), ("created_at", DESCENDING)],
+         {"name": "category_published_created_at"}),
+    ],
+    "reviews": [
+        ([("id", ASCENDING)], {"unique": True, "name": "id_unique", **_HAS_ID}),
+    ],
+    "hockey_clubs": [
+        ([("id", ASCENDING)], {"unique": True, "name": "id_unique", **_HAS_ID}),
+        ([("order", ASCENDING)], {"name": "order"}),
+    ],
+    "site_settings": [
+        ([("key", ASCENDING)], {"unique": True, "name": "key_unique"}),
+    ],
+    "legal_pages": [
+        ([("page_type", ASCENDING)], {"unique": True, "name": "page_type_unique"}),
+    ],
+    "uploads": [
+        ([("filename", ASCENDING)], {"unique": True, "name": "filename_unique"}),
+        ([("created_at", DESCENDING), ("filename", DESCENDING)], {"name": "keyset"}),
+        ([("content_type", ASCENDING), ("created_at", DESCENDING), ("filename", DESCENDING)],
+         {"name": "content_type_keyset"}),
+        ([("uploader", ASCENDING), ("created_at", DESCENDING), ("filename", DESCENDING)],
+         {"name": "uploader_keyset"}),
+        ([("sha256", ASCENDING)], {"name": "sha256"}),
+    ],
+    "upload_jobs": [
+        ([("id", ASCENDING)], {"unique": True, "name": "id_unique"}),
+        ([("status", ASCENDING), ("run_after", ASCENDING)], {"name": "status_run_after"}),
+        ([("status", ASCENDING), ("lease_until", ASCENDING)], {"name": "status_lease_until"}),
+        # Finished jobs are deleted once expires_at has passed
+        ([("expires_at", ASCENDING)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+    ],
+    # Rollup rows (see sales_rollups.py); report queries match a day range and statuses
+    "daily_sales": [
+        ([("day", ASCENDING), ("status", ASCENDING)], {"name": "day_status"}),
+    ],
+    # _id ("<scope>:<key>") is the unique lock; keys expire IDEMPOTENCY_TTL after creation
+    "idempotency_keys": [
+        ([("created_at", ASCENDING)], {"name": "created_at_ttl", "expireAfterSeconds": int(IDEMPOTENCY_TTL.total_seconds())}),
+    ],
+}
+
+# Representative filters/sorts of every selective query the server issues.
+# Unfiltered, unsorted reads (reviews, site settings, legal pages, index and
+# price map rebuilds) scan the whole collection by design and are not listed.
+QUERY_SHAPES: List[Dict[str, Any]] = [
+    {"collection": "products", "filter": {"id": "x"}},
+    {"collection": "products", "filter": {"id": {"$in": ["x", "y"]}}},
+    {"collection": "products", "filter": {"$or": [{"id": {"$in": ["x"]}}, {"name": {"$in": ["y"]}}]}},
+    # build_product_query(): every filter alone, unsorted (full listing,
+    # count_documents, facets) and in keyset order (paginated listing)
+    *[
+        {"collection": "products", "filter": product_filter, **sort}
+        for product_filter in (
+            {},
+            {"category": "x"},
+            {"category": "x", "is_active": True},
+            {"is_active": True},
+            {"status": {"$in": ["x", "y"]}},
+            {"size_categories": {"$in": ["x", "y"]}},
+            {"base_price": {"$gte": 1, "$lt": 2}},
+            {"base_price": {"$gte": 1}},
+            {"is_active": True, "status": {"$in": ["x"]}, "size_categories": {"$in": ["y"]},
+             "base_price": {"$lt": 2}},
+        )
+        for sort in ({}, {"sort": [("created_at", -1), ("id", -1)]})
+        if product_filter or sort
+    ],
+    {"collection": "products", "filter": {}, "sort": [("created_at", 1)]},
+    {"collection": "orders", "filter": {"id": "x"}},
+    # build_order_query(): every filter alone, unsorted (count_documents) and in
+    # keyset order (admin list); the export sorts by (created_at, id) ascending
+    *[
+        {"collection": "orders", "filter": order_filter, **sort}
+        for order_filter in (
+            {},
+            {"status": {"$in": ["x", "y"]}},
+            {"created_at": {"$gte": "x", "$lt": "y"}},
+            {"created_at": {"$gte": "x"}},
+            {"customer_email": "x"},
+            {"customer_phone": "x"},
+            {"total_amount": {"$gte": 1, "$lt": 2}},
+            {"total_amount": {"$lt": 2}},
+            {"status": {"$in": ["x"]}, "created_at": {"$gte": "x", "$lt": "y"}, "total_amount": {"$gte": 1}},
+        )
+        for sort in ({}, {"sort": [("created_at", -1), ("id", -1)]}, {"sort": [("created_at", 1), ("id", 1)]})
+        if order_filter or sort
+    ],
+    {"collection": "orders", "filter": {"$or": [{"created_at": {"$gte": "x"}}, {"updated_at": {"$gte": "x"}}]}},
+    {"collection": "articles", "filter": {"id": "x"}},
+    {"collection": "articles", "filter": {"slug": "x"}},
+    {"collection": "articles", "filter": {"is_published": True}, "sort": [("created_at", -1)]},
+    {"collection": "articles", "filter": {"category": "x", "is_published": True},
+     "sort": [("created_at", -1)]},
+    {"collection": "reviews", "filter": {"id": "x"}},
+    {"collection": "hockey_clubs", "filter": {"id": "x"}},
+    {"collection": "hockey_clubs", "filter": {}, "sort": [("order", 1)]},
+    {"collection": "site_settings", "filter": {"key": "x"}},
+    {"collection": "legal_pages", "filter": {"page_type": "x"}},
+    {"collection": "uploads", "filter": {"filename": "x"}},
+    {"collection": "uploads", "filter": {}, "sort": [("created_at", -1), ("filename", -1)]},
+    {"collection": "uploads", "filter": {"content_type": {"$regex": "^image/"}},
+     "sort": [("created_at", -1), ("filename", -1)]},
+    {"collection": "uploads", "filter": {"uploader": "x"}, "sort": [("created_at", -1), ("filename", -1)]},
+    {"collection": "uploads", "filter": {"sha256": "x"}},
+    {"collection": "daily_sales", "filter": {"day": {"$gte": "x", "$lte": "y"}, "status": {"$nin": ["z"]}}},
+    {"collection": "upload_jobs", "filter": {"id": {"$in": ["x", "y"]}}},
+    {"collection": "upload_jobs", "filter": {"$or": [
+        {"status": "queued", "run_after": {"$lte": "x"}},
+        {"status": "running", "lease_until": {"$lt": "x"}},
+    ]}, "sort": [("run_after", 1)]},
+]
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """
+    Create every index from INDEX_MANIFEST that does not exist yet
+
+    A failing index (e.g. duplicates blocking a unique index) is logged and
+    skipped so that the application still starts.
+
+    Returns:
+        Mapping of collection name to the names of indexes now in place
+    """
+    created: Dict[str, List[str]] = {}
+    for collection, indexes in INDEX_MANIFEST.items():
+        for keys, options in indexes:
+            try:
+                name = await db[collection].create_index(keys, **options)
+                created.setdefault(collection, []).append(name)
+            except OperationFailure as e:
+                logger.error(f"Failed to create index {options.get('name')} on {collection}: {e}")
+    logger.info(f"Indexes ensured: {sum(len(v) for v in created.values())}")
+    return created
+
+
+def plan_stages(plan: Any) -> List[str]:
+    """Collect every stage name of an explain() plan tree"""
+    stages: List[str] = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
@@ -0,0 +1,66 @@
+"""
+Fast JSON responses for read endpoints
+
+Documents read back from MongoDB were validated when they were written, so
+read handlers can skip building a Pydantic model per document and FastAPI's
+second validation pass through response_model. ModelSerializer only projects
+documents onto the model's fields (filling defaults for missing ones) and
+encodes them with orjson.
+
+Set STRICT_RESPONSE_VALIDATION=1 to validate every response against the
+model again while debugging.
+"""
+import os
+import logging
+from typing import Any, Dict, List, Optional, Type
+import orjson
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+logger = logging.getLogger(__name__)
+
+STRICT_RESPONSE_VALIDATION = os.environ.get("STRICT_RESPONSE_VALIDATION", "0") == "1"
+
+
+class ModelSerializer:
+    """Serializes trusted MongoDB documents in the shape of a response model"""
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.fields = list(model.model_fields)
+        self.defaults: Dict[str, Any] = {
+            name: field.default
+            for name, field in model.model_fields.items()
+            if not field.is_required() and field.default_factory is None
+        }
+        self._list_adapter = TypeAdapter(List[model])
+
+    def prepare(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Project a document onto the model fields, filling simple defaults"""
+        defaults = self.defaults
+        return {name: doc.get(name, defaults.get(name)) for name in self.fields}
+
+    def dumps(self, docs: Any, many: bool = True) -> bytes:
+        """
+        Encode one document or a list of documents to JSON bytes
+
+        In strict mode the documents are validated and serialized by Pydantic.
+        """
+        if STRICT_RESPONSE_VALIDATION:
+            if many:
+                return self._list_adapter.dump_json(self._list_adapter.validate_python(docs))
+            return self.model.model_validate(docs).model_dump_json().encode("utf-8")
+        if many:
+            return orjson.dumps([self.prepare(doc) for doc in docs])
+        return orjson.dumps(self.prepare(docs))
+
+
+def json_response(body: bytes, headers: Optional[Dict[str, str]] = None, status_code: int = 200) -> Response:
+    """Wrap pre-encoded JSON bytes in a response"""
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def dumps(value: Any) -> bytes:
+    """orjson encoding for ad-hoc payloads (dicts, lists of dicts)"""
+    return orjson.dumps(value)
+
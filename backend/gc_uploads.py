@@ -0,0 +1,73 @@
+"""
+Find uploads that nothing references and quarantine/purge them
+Run: python gc_uploads.py [--dry-run] [--grace-days N] [--purge] [--purge-days N]
+
+Each run marks unreferenced uploads as orphaned, quarantines uploads that
+stayed orphaned for the grace period and restores quarantined uploads that
+are referenced again. With --purge, uploads quarantined for --purge-days
+are deleted. See upload_gc.py for the details.
+"""
+import argparse
+import asyncio
+import os
+from datetime import timedelta
+from pathlib import Path
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+from upload_gc import collect_garbage
+from storage import create_storage
+from uploads import UploadStore
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+UPLOAD_DIR = ROOT_DIR / "uploads"
+
+
+def print_names(title: str, names):
+    print(f"{title}: {len(names)}")
+    for name in names[:50]:
+        print(f"  • {name}")
+    if len(names) > 50:
+        print(f"  ... and {len(names) - 50} more")
+
+
+async def run(args):
+    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    db_name = os.environ.get('DB_NAME', 'test_database')
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    print("=" * 60)
+    print(f"Upload garbage collection in database: {db_name}{' (dry run)' if args.dry_run else ''}")
+    print("=" * 60)
+
+    report = await collect_garbage(
+        db, UploadStore(db, create_storage(UPLOAD_DIR), UPLOAD_DIR / ".tmp"),
+        grace=timedelta(days=args.grace_days),
+        purge_after=timedelta(days=args.purge_days),
+        purge=args.purge,
+        dry_run=args.dry_run
+    )
+
+    print(f"Uploads scanned:    {report.scanned}")
+    print(f"Still referenced:   {report.referenced}")
+    print_names("Newly orphaned", report.orphaned)
+    print_names("Quarantined", report.quarantined)
+    print_names("Restored", report.restored)
+    print_names("Purged", report.purged)
+    print("=" * 60)
+    if args.dry_run:
+        print("(dry run, nothing was changed)")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Orphan upload garbage collector")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--grace-days", type=float, default=7, help="Days an orphan waits before quarantine")
+    parser.add_argument("--purge", action="store_true", help="Delete uploads quarantined for --purge-days")
+    parser.add_argument("--purge-days", type=float, default=30, help="Days in quarantine before purging")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,222 @@
+"""
+Collection version counters and ETag helpers for conditional GETs
+
+Every write handler bumps the version of the collection it modified.
+Versions live in the `collection_versions` collection so that all worker
+processes agree on them; each process keeps a local copy that is refreshed
+at most once per `sync_interval` seconds, so an unchanged resource is
+answered with 304 without touching the data collections. A refresh that
+finds a version bumped by another process calls `on_change`, so that
+in-process caches of that collection are dropped before they answer a
+request carrying the new ETag.
+
+Uploaded files are immutable and served by immutable_file_response() with
+far-future caching, validators and byte-range support instead.
+"""
+import time
+import hashlib
+import logging
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Iterable, Optional, Tuple
+import aiofiles
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+REVALIDATE_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+
+class CollectionVersions:
+    """Per-collection version counters shared through MongoDB"""
+
+    def __init__(self, db, sync_interval: float = 2.0,
+                 on_change: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            db: Database holding the `collection_versions` collection
+            sync_interval: Seconds between refreshes of the local copy
+            on_change: Called with the collection name when a refresh finds
+                a version that was bumped elsewhere
+        """
+        self._db = db
+        self._sync_interval = sync_interval
+        self._on_change = on_change
+        self._versions: Dict[str, int] = {}
+        self._synced_at = 0.0
+
+    async def _sync(self) -> None:
+        if time.monotonic() - self._synced_at < self._sync_interval:
+            return
+        docs = await self._db.collection_versions.find({}).to_list(length=None)
+        versions = {doc["_id"]: doc.get("v", 0) for doc in docs}
+        changed = [name for name, v in versions.items() if self._versions.get(name, 0) != v]
+        self._versions = versions
+        self._synced_at = time.monotonic()
+        if self._on_change is not None:
+            for name in changed:
+                self._on_change(name)
+
+    async def bump(self, *names: str) -> None:
+        """Increment the version of each named collection"""
+        for name in names:
+            doc = await self._db.collection_versions.find_one_and_update(
+                {"_id": name},
+                {"$inc": {"v": 1}},
+                upsert=True,
+                return_document=True
+            )
+            version = doc.get("v", 0)
+            if version != self._versions.get(name, 0) + 1 and self._on_change is not None:
+                # Another process bumped it since the last refresh
+                self._on_change(name)
+            self._versions[name] = version
+
+    async def etag(self, names: Iterable[str], *parts: str) -> str:
+        """
+        Build a strong ETag for a response derived from the given collections
+
+        Args:
+            names: Collections the response is read from
+            parts: Anything else the representation depends on (path, query string)
+
+        Returns:
+            Quoted ETag value
+        """
+        await self._sync()
+        key = "|".join(f"{name}:{self._versions.get(name, 0)}" for name in names)
+        key += "|" + "|".join(parts)
+        return '"' + hashlib.sha1(key.encode("utf-8")).hexdigest()[:24] + '"'
+
+    async def check(self, request: Request, response: Response, *names: str) -> Optional[Response]:
+        """
+        Handle a conditional GET for a response derived from the given collections
+
+        Returns:
+            A 304 response if the client's copy is current, otherwise None
+            (the ETag is then set on `response`)
+        """
+        etag = await self.etag(names, request.url.path, request.url.query)
+        headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return None
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the If-None-Match request header against an ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+# ---- immutable files (uploads) ----
+
+# Upload URLs never change their content, so browsers may keep them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[float] = None) -> bool:
+    """
+    Evaluate If-None-Match, falling back to If-Modified-Since (RFC 9110 13.2.2)
+
+    Without a known modification time any If-Modified-Since matches: the
+    client can only have obtained a date for an immutable file by fetching it.
+    """
+    if request.headers.get("if-none-match"):
+        return etag_matches(request, etag)
+    since = request.headers.get("if-modified-since")
+    if since:
+        if last_modified is None:
+            return True
+        try:
+            return int(last_modified) <= int(parsedate_to_datetime(since).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range `Range: bytes=...` header
+
+    Returns:
+        Inclusive (start, end), or None if the header is absent, malformed or
+        asks for several ranges (the full body is sent then)
+
+    Raises:
+        HTTPException: 416 if the range lies outside the file
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = min(int(end_text), size - 1) if end_text else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start, end = max(0, size - int(end_text)), size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+async def _read_range(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def immutable_file_response(request: Request, path: Path, media_type: str, etag: str,
+                            headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Serve a file whose URL always maps to the same bytes
+
+    Sends long-lived immutable caching headers, answers conditional requests
+    with 304 and honours single byte ranges (If-Range aware) with 206.
+
+    Args:
+        etag: Quoted strong ETag identifying the bytes (and their encoding)
+        headers: Extra headers (CORS, Content-Encoding, Vary)
+    """
+    stat_result = path.stat()
+    headers = {
+        **(headers or {}),
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    if_range = request.headers.get("if-range")
+    byte_range = None
+    if not if_range or if_range in (etag, headers["Last-Modified"]):
+        byte_range = parse_range(request.headers.get("range"), stat_result.st_size)
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_read_range(path, start, end), status_code=206, media_type=media_type, headers=headers)
@@ -0,0 +1,120 @@
+"""
+Idempotency keys for non-idempotent POST endpoints
+
+A client sends `Idempotency-Key: <random string>` and reuses it when it
+retries the same request. The first request inserts the key into the
+`idempotency_keys` collection; the unique `_id` makes that insert the lock,
+so concurrent retries cannot both proceed. Once the request succeeded its
+response is stored on the key, and every retry gets that response back
+instead of repeating the side effects (order insert, e-mail, Telegram).
+
+    no key ----(insert wins)----> in_progress --(success)--> completed
+                                       |
+                                       +--(failure: key released, retry allowed)
+
+A failure after the side effect was committed must not release the key;
+create_order additionally derives the order id from the key, so even a
+takeover of a key whose response was never stored cannot insert twice.
+
+A retry that arrives while the first request is still running gets 409; a
+key reused with a different request body gets 422. Keys are removed by a
+TTL index IDEMPOTENCY_TTL after creation.
+"""
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+import orjson
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = timedelta(hours=24)
+# An in-progress key older than this belongs to a request that died; it may be taken over
+IN_PROGRESS_TIMEOUT = timedelta(seconds=60)
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(payload: Any) -> str:
+    """SHA-256 of a JSON-serializable request body, independent of key order"""
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class IdempotencyStore:
+    """Idempotency keys and the stored responses of completed requests"""
+
+    def __init__(self, db):
+        self.collection = db.idempotency_keys
+
+    async def begin(self, scope: str, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Lock a key for a new request, or find the response of an earlier one
+
+        Args:
+            scope: Endpoint the key belongs to, so keys of different endpoints never collide
+            key: Value of the Idempotency-Key header
+            fingerprint: request_fingerprint() of the request body
+
+        Returns:
+            None if the caller holds the key and must process the request,
+            otherwise the stored {"status_code", "body"} to replay
+
+        Raises:
+            HTTPException: 400 for an invalid key, 409 while the original
+                request is still in progress, 422 if the key was used with
+                a different request body
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+        key_id = f"{scope}:{key}"
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.insert_one({
+                "_id": key_id,
+                "fingerprint": fingerprint,
+                "status": "in_progress",
+                # BSON date for the TTL index (see db_indexes.py)
+                "created_at": now,
+            })
+            return None
+        except DuplicateKeyError:
+            existing = await self.collection.find_one({"_id": key_id})
+
+        if existing is None:
+            # Expired between the insert and the read; treat as a new request
+            return await self.begin(scope, key, fingerprint)
+        if existing["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        if existing["status"] == "completed":
+            return existing["response"]
+
+        created_at = existing["created_at"]
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        if created_at < now - IN_PROGRESS_TIMEOUT:
+            # The request holding the key died; the first retry to get here takes it over
+            taken = await self.collection.find_one_and_update(
+                {"_id": key_id, "status": "in_progress", "created_at": existing["created_at"]},
+                {"$set": {"created_at": now}}
+            )
+            if taken is not None:
+                logger.warning(f"Took over stale idempotency key {key_id}")
+                return None
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still in progress",
+            headers={"Retry-After": "1"}
+        )
+
+    async def complete(self, scope: str, key: str, status_code: int, body: Any) -> None:
+        """Store the response of a successful request for replay"""
+        await self.collection.update_one(
+            {"_id": f"{scope}:{key}"},
+            {"$set": {"status": "completed", "response": {"status_code": status_code, "body": body}}}
+        )
+
+    async def release(self, scope: str, key: str) -> None:
+        """Drop the key of a failed request so that a retry is processed again"""
+        await self.collection.delete_one({"_id": f"{scope}:{key}", "status": "in_progress"})
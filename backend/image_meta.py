@@ -0,0 +1,97 @@
+"""
+Layout metadata of uploaded images attached to catalog and blog responses
+
+Product and article documents reference uploads by URL. Before such a
+document is returned, ImageMetaLookup.attach() adds
+
+    "image_meta": {"<url as stored>": {"width", "height", "dominant_color", "lqip"}}
+
+for every referenced upload whose metadata is known, so the client can
+render correctly sized, coloured placeholders without extra requests.
+Metadata of an upload never changes, so lookups are cached per filename.
+Filenames without metadata (yet) are cached too, for MISS_TTL only: the
+upload job fills the metadata in shortly after the upload, and forget() /
+forget_misses() drop them as soon as it is written.
+"""
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+from cachetools import TTLCache
+from image_normalization import canonical_image_url
+
+logger = logging.getLogger(__name__)
+
+IMAGE_META_FIELDS = ("width", "height", "dominant_color", "lqip")
+
+_UPLOADS_PREFIX = "/api/uploads/"
+
+# Seconds a filename without metadata is remembered as such
+MISS_TTL = 30
+
+
+def _image_urls(doc: Dict[str, Any]) -> List[str]:
+    """Every image URL a product or article document references"""
+    urls = list(doc.get("images") or [])
+    urls += [item.get("url") for item in doc.get("product_images") or [] if isinstance(item, dict)]
+    for size_urls in (doc.get("size_category_images") or {}).values():
+        urls += size_urls if isinstance(size_urls, list) else []
+    urls += [variant.get("technical_image") for variant in doc.get("variants") or [] if isinstance(variant, dict)]
+    urls.append(doc.get("featured_image"))
+    return [url for url in urls if isinstance(url, str) and url]
+
+
+def _upload_filename(url: str) -> Optional[str]:
+    canonical = canonical_image_url(url)
+    if canonical and canonical.startswith(_UPLOADS_PREFIX):
+        return canonical[len(_UPLOADS_PREFIX):]
+    return None
+
+
+class ImageMetaLookup:
+    """Cached filename -> metadata lookups against the `uploads` collection"""
+
+    def __init__(self, db, maxsize: int = 20000, ttl: float = 3600, miss_ttl: float = MISS_TTL):
+        self.db = db
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Filenames with no metadata (not computed yet, unknown, not an image)
+        self._misses: TTLCache = TTLCache(maxsize=maxsize, ttl=miss_ttl)
+
+    async def get_many(self, filenames: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Metadata of the given uploads; unknown filenames are left out
+
+        Only filenames in neither cache are fetched, in a single $in query.
+        """
+        found: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for filename in set(filenames):
+            meta = self._cache.get(filename)
+            if meta is not None:
+                found[filename] = meta
+            elif filename not in self._misses:
+                missing.append(filename)
+
+        if missing:
+            projection = {"_id": 0, "filename": 1, **{name: 1 for name in IMAGE_META_FIELDS}}
+            async for doc in self.db.uploads.find({"filename": {"$in": missing}, "lqip": {"$ne": None}}, projection):
+                meta = {name: doc.get(name) for name in IMAGE_META_FIELDS}
+                self._cache[doc["filename"]] = found[doc["filename"]] = meta
+            for filename in missing:
+                if filename not in found:
+                    self._misses[filename] = True
+        return found
+
+    def forget(self, filename: str) -> None:
+        """Drop what is cached about an upload whose metadata was just written"""
+        self._cache.pop(filename, None)
+        self._misses.pop(filename, None)
+
+    def forget_misses(self) -> None:
+        """Drop every cached miss (metadata was written by another worker process)"""
+        self._misses.clear()
+
+    async def attach(self, docs: List[Dict[str, Any]]) -> None:
+        """Set `image_meta` on each document in place (one query for all of them)"""
+        urls_by_doc = [[(url, _upload_filename(url)) for url in _image_urls(doc)] for doc in docs]
+        metas = await self.get_many(filename for urls in urls_by_doc for _, filename in urls if filename)
+        for doc, urls in zip(docs, urls_by_doc):
+            doc["image_meta"] = {url: metas[filename] for url, filename in urls if filename in metas}
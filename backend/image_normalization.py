@@ -0,0 +1,156 @@
+"""
+Write-time canonicalization of product image structures
+
+Products carry three overlapping image representations: legacy `images`,
+legacy `size_category_images` and `product_images` bound to variants and
+size categories. normalize_product_images() canonicalizes and dedupes all of
+them and stores a ready-to-render `image_index` on the document:
+
+    {
+        "cover": "/api/uploads/a.webp",                # images[0] when present
+        "all": [...],                                  # every image, ordered
+        "by_variant": {"<variant_id>": [...]},
+        "by_size": {"kids": [...], "teens": [...], "adults": [...]},
+        "by_variant_size": {"<variant_id>": {"kids": [...]}},
+        "technical": {"<variant_id>": "/api/uploads/t.png"}
+    }
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+# Fields that feed the image index; an update touching any of them rebuilds it
+IMAGE_FIELDS = ("images", "product_images", "size_category_images", "variants")
+
+_UPLOADS_PATH_RE = re.compile(r"(?:/api)?/uploads/([^/?#]+)$")
+_API_UPLOADS_PATH_RE = re.compile(r"/api/uploads/([^/?#]+)$")
+# Hosts of this site (comma-separated); their legacy /uploads/<filename> URLs are uploads too
+SITE_HOSTS = {h.strip().lower() for h in os.environ.get("SITE_HOSTS", "").split(",") if h.strip()}
+_BARE_FILENAME_RE = re.compile(r"^[\w.-]+\.[A-Za-z0-9]+$")
+
+
+def canonical_image_url(url: Any) -> Optional[str]:
+    """
+    Canonical form of an image URL
+
+    Uploads are always referenced as /api/uploads/<filename>, whatever prefix
+    or query string they were saved with. An absolute URL is an upload if its
+    path is /api/uploads/<filename>, or /uploads/<filename> on one of
+    SITE_HOSTS; other external URLs are kept.
+
+    Returns:
+        Canonical URL, or None for empty/invalid values
+    """
+    if not isinstance(url, str):
+        return None
+    url = url.strip()
+    if not url:
+        return None
+
+    if url.startswith(("http://", "https://", "//")):
+        parts = urlsplit(url)
+        own_host = (parts.hostname or "") in SITE_HOSTS
+        match = (_UPLOADS_PATH_RE if own_host else _API_UPLOADS_PATH_RE).fullmatch(parts.path)
+        return f"/api/uploads/{match.group(1)}" if match else url
+
+    path = url.split("?")[0].split("#")[0]
+    match = _UPLOADS_PATH_RE.search(path)
+    if match:
+        return f"/api/uploads/{match.group(1)}"
+    if _BARE_FILENAME_RE.match(path):
+        return f"/api/uploads/{path}"
+    return url
+
+
+def _dedupe(urls: List[Any]) -> List[str]:
+    seen = set()
+    result = []
+    for url in urls:
+        url = canonical_image_url(url)
+        if url and url not in seen:
+            seen.add(url)
+            result.append(url)
+    return result
+
+
+def _append(index: Dict[str, List[str]], key: str, url: str) -> None:
+    urls = index.setdefault(key, [])
+    if url not in urls:
+        urls.append(url)
+
+
+def normalize_product_images(product: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Canonicalize the image fields of a product document and build image_index
+
+    Args:
+        product: Product document (or the image fields of one)
+
+    Returns:
+        Dict with the normalized image fields and `image_index`, ready to $set
+    """
+    images = _dedupe(product.get("images") or [])
+
+    product_images = []
+    seen_bindings = set()
+    for item in product.get("product_images") or []:
+        if not isinstance(item, dict):
+            continue
+        url = canonical_image_url(item.get("url"))
+        binding = (url, item.get("variant_id") or None, item.get("size_category") or None)
+        if not url or binding in seen_bindings:
+            continue
+        seen_bindings.add(binding)
+        product_images.append({"url": url, "variant_id": binding[1], "size_category": binding[2]})
+
+    size_category_images = {
+        size: _dedupe(urls if isinstance(urls, list) else [])
+        for size, urls in (product.get("size_category_images") or {}).items()
+    }
+
+    variants = []
+    technical = {}
+    for variant in product.get("variants") or []:
+        if not isinstance(variant, dict):
+            continue
+        variant = dict(variant)
+        variant["technical_image"] = canonical_image_url(variant.get("technical_image"))
+        if variant.get("id") and variant["technical_image"]:
+            technical[variant["id"]] = variant["technical_image"]
+        variants.append(variant)
+
+    by_variant: Dict[str, List[str]] = {}
+    by_size: Dict[str, List[str]] = {}
+    by_variant_size: Dict[str, Dict[str, List[str]]] = {}
+    for item in product_images:
+        if item["variant_id"]:
+            _append(by_variant, item["variant_id"], item["url"])
+        if item["size_category"]:
+            _append(by_size, item["size_category"], item["url"])
+        if item["variant_id"] and item["size_category"]:
+            _append(by_variant_size.setdefault(item["variant_id"], {}), item["size_category"], item["url"])
+    for size, urls in size_category_images.items():
+        for url in urls:
+            _append(by_size, size, url)
+
+    all_images = _dedupe(
+        images
+        + [item["url"] for item in product_images]
+        + [url for urls in size_category_images.values() for url in urls]
+    )
+
+    return {
+        "images": images,
+        "product_images": product_images,
+        "size_category_images": size_category_images,
+        "variants": variants,
+        "image_index": {
+            "cover": all_images[0] if all_images else None,
+            "all": all_images,
+            "by_variant": by_variant,
+            "by_size": by_size,
+            "by_variant_size": by_variant_size,
+            "technical": technical,
+        },
+    }
@@ -0,0 +1,243 @@
+"""
+Responsive image derivatives (WebP, optionally AVIF), on-demand transforms
+and layout metadata (size, dominant colour, LQIP placeholder) from Pillow
+
+Encoding is CPU-bound, so it runs in a ProcessPoolExecutor and never blocks
+the event loop. Functions submitted to the pool are module-level and take
+only plain arguments so that they can be pickled.
+"""
+import io
+import os
+import base64
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Width ladder of generated derivatives (never upscaled)
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+DERIVATIVE_QUALITY = {"webp": 80, "avif": 60}
+TRANSFORM_QUALITY = {"webp": 80, "avif": 60, "jpeg": 85}
+# Longest side of the blurred inline placeholder
+LQIP_SIZE = 16
+
+# Extensions Pillow can rasterize; SVG and everything else is left untouched
+RASTER_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tiff'}
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+class ImageTooLargeError(Exception):
+    """The image has more pixels than Pillow agrees to decode (decompression bomb guard)"""
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Process pool shared by all image work, created on first use"""
+    global _executor
+    if _executor is None:
+        workers = int(os.environ.get("IMAGE_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+        _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def derivative_formats() -> List[str]:
+    """WebP always; AVIF when IMAGE_AVIF=1 and Pillow was built with it"""
+    formats = ["webp"]
+    if os.environ.get("IMAGE_AVIF", "0") == "1":
+        from PIL import features
+        if features.check("avif"):
+            formats.append("avif")
+        else:
+            logger.warning("IMAGE_AVIF is set but Pillow has no AVIF support")
+    return formats
+
+
+def is_raster(filename: str) -> bool:
+    return Path(filename).suffix.lower() in RASTER_EXTENSIONS
+
+
+def read_dimensions(source_path: str) -> Optional[Tuple[int, int]]:
+    """
+    Display size of an image, read from its header only
+
+    Returns:
+        (width, height) after EXIF rotation, or None if Pillow cannot open it
+        or refuses to because of its pixel count
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(source_path) as image:
+            width, height = image.size
+            # Orientations 5-8 are rotated by 90 degrees
+            if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                width, height = height, width
+            return width, height
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return None
+
+
+def _open_normalized(source_path: str):
+    """
+    Open an image upright and in a mode every target format can encode
+
+    Raises:
+        ImageTooLargeError: The pixel count is above Pillow's MAX_IMAGE_PIXELS limit
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(source_path)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e)) from None
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    return image
+
+
+def render_derivatives(source_path: str, output_dir: str, stem: str,
+                       widths: Sequence[int], formats: Sequence[str]) -> List[Dict[str, Any]]:
+    """
+    Encode the width ladder of one image (runs in a worker process)
+
+    Widths at or above the original width are skipped; if the image is smaller
+    than every rung, a single derivative at the original width is produced.
+    Metadata (EXIF, ICC, XMP) is not copied into derivatives.
+
+    Returns:
+        [{"width", "height", "format", "name", "size"}, ...]
+    """
+    from PIL import Image
+
+    image = _open_normalized(source_path)
+    targets = [w for w in widths if w < image.width] or [image.width]
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    results = []
+    for width in targets:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            name = f"{stem}_w{width}.{fmt}"
+            path = Path(output_dir) / name
+            tmp_path = path.with_suffix(path.suffix + ".part")
+            resized.save(tmp_path, format=fmt.upper(), quality=DERIVATIVE_QUALITY.get(fmt, 80))
+            os.replace(tmp_path, path)
+            results.append({
+                "width": width,
+                "height": height,
+                "format": fmt,
+                "name": name,
+                "size": path.stat().st_size,
+            })
+    return results
+
+
+def render_transform(source_path: str, output_path: str, width: Optional[int], height: Optional[int],
+                     fit: str, fmt: str) -> int:
+    """
+    Render one on-demand transform (runs in a worker process)
+
+    fit="contain" scales the image to fit inside width x height, fit="cover"
+    crops it to exactly fill the box. Images are never upscaled.
+
+    Returns:
+        Size of the written file in bytes
+    """
+    from PIL import Image, ImageOps
+
+    image = _open_normalized(source_path)
+
+    if fit == "cover" and width and height:
+        # Shrink an oversized box keeping its aspect ratio instead of upscaling
+        scale = min(1.0, image.width / width, image.height / height)
+        box = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = ImageOps.fit(image, box, Image.LANCZOS)
+    else:
+        image.thumbnail((width or image.width, height or image.height), Image.LANCZOS)
+
+    if fmt == "jpeg" and image.mode == "RGBA":
+        image = image.convert("RGB")
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.part"
+    image.save(tmp_path, format=fmt.upper(), quality=TRANSFORM_QUALITY.get(fmt, 85))
+    os.replace(tmp_path, output_path)
+    return os.path.getsize(output_path)
+
+
+def render_image_meta(source_path: str) -> Dict[str, Any]:
+    """
+    Layout metadata of one image (runs in a worker process)
+
+    Returns:
+        {"width", "height", "dominant_color": "#rrggbb",
+         "lqip": "data:image/webp;base64,..."} where lqip is a blurred
+        preview at most LQIP_SIZE pixels wide, a few hundred bytes in size
+    """
+    from PIL import Image, ImageFilter
+
+    image = _open_normalized(source_path)
+    width, height = image.size
+
+    # Most frequent colour of a small RGB thumbnail reduced to a few buckets
+    sample = image.convert("RGB")
+    sample.thumbnail((64, 64))
+    palette_image = sample.quantize(colors=5, method=Image.Quantize.MEDIANCUT)
+    count, index = max(palette_image.getcolors())
+    r, g, b = palette_image.getpalette()[index * 3:index * 3 + 3]
+
+    preview = image.copy()
+    preview.thumbnail((LQIP_SIZE, LQIP_SIZE))
+    preview = preview.filter(ImageFilter.GaussianBlur(0.6))
+    buffer = io.BytesIO()
+    preview.save(buffer, format="WEBP", quality=30)
+
+    return {
+        "width": width,
+        "height": height,
+        "dominant_color": f"#{r:02x}{g:02x}{b:02x}",
+        "lqip": "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii"),
+    }
+
+
+async def generate_derivatives(source_path: Path, output_dir: Path, stem: str) -> List[Dict[str, Any]]:
+    """Run render_derivatives in the process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), render_derivatives,
+        str(source_path), str(output_dir), stem, DERIVATIVE_WIDTHS, derivative_formats()
+    )
+
+
+async def transform_image(source_path: Path, output_path: Path, width: Optional[int], height: Optional[int],
+                          fit: str, fmt: str) -> int:
+    """Run render_transform in the process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), render_transform,
+        str(source_path), str(output_path), width, height, fit, fmt
+    )
+
+
+async def probe_dimensions(source_path: Path) -> Optional[Tuple[int, int]]:
+    """Run read_dimensions in a thread; only the header is decoded"""
+    return await asyncio.to_thread(read_dimensions, str(source_path))
+
+
+async def extract_image_meta(source_path: Path) -> Dict[str, Any]:
+    """Run render_image_meta in the process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), render_image_meta, str(source_path))
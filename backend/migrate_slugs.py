@@ -7,29 +7,9 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
-
-# Transliteration map
-TRANSLIT_MAP = {
-    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
-    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
-    'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
-}
+from translit import slugify
 
-def transliterate(text):
-    """Convert Cyrillic text to Latin"""
-    result = []
-    for char in text.lower():
-        result.append(TRANSLIT_MAP.get(char, char))
-    
-    slug = ''.join(result)
-    # Clean up: only alphanumeric and hyphens
-    import re
-    slug = re.sub(r'[^a-z0-9]+', '-', slug)
-    slug = slug.strip('-')
-    return slug
+load_dotenv()
 
 async def migrate_slugs():
     """Update all articles with Cyrillic slugs to transliterated ones"""
@@ -52,7 +32,7 @@ async def migrate_slugs():
         has_cyrillic = any('\u0400' <= char <= '\u04FF' for char in old_slug)
         
         if has_cyrillic:
-            new_slug = transliterate(article['title'])
+            new_slug = slugify(article['title'])
             
             print(f"\n📝 Updating: {article['title'][:50]}...")
             print(f"   Old slug: {old_slug}")
@@ -2,7 +2,7 @@
 Pydantic models for orders, users, and blog
 """
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, timezone
 import uuid
 
@@ -40,7 +40,10 @@ class OrderItem(BaseModel):
     product_name: str
     quantity: int
     size_category: str  # kids, teens, adult
-    price: float
+    price: float  # Цена за штуку; пересчитывается сервером по каталогу
+    product_id: Optional[str] = None
+    variant_id: Optional[str] = None
+    product_type: Optional[str] = None  # Тип товара заявки на командный заказ (QUOTE_PRODUCT_TYPES)
 
 class Order(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -53,10 +56,23 @@ class Order(BaseModel):
     total_amount: float
     shipping_address: str
     order_notes: Optional[str] = None
-    status: str = "pending"  # pending, confirmed, processing, shipped, delivered, cancelled
+    status: str = "pending"  # quote, pending, confirmed, processing, shipped, delivered, cancelled
     created_at: datetime = Field(default_factory=lambda: datetime.now())
     updated_at: datetime = Field(default_factory=lambda: datetime.now())
 
+class OrderSummary(BaseModel):
+    """Строка таблицы заказов в админке (без позиций и адреса)"""
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str
+    customer_email: str
+    customer_name: str
+    customer_phone: str
+    total_amount: float
+    status: str = "pending"
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
 class OrderCreate(BaseModel):
     customer_email: EmailStr
     customer_name: str
@@ -100,6 +116,8 @@ class Article(BaseModel):
     seo_title: Optional[str] = None
     seo_description: Optional[str] = None
     seo_keywords: Optional[str] = None
+    # Размеры, цвет и LQIP изображений, добавляются при чтении (см. image_meta.py)
+    image_meta: Optional[Dict[str, dict]] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now())
     updated_at: datetime = Field(default_factory=lambda: datetime.now())
 
@@ -241,6 +259,11 @@ class Product(BaseModel):
     specifications: Optional[dict] = {}  # Технические характеристики (ключ-значение)
     main_features: Optional[List[str]] = []  # Основные характеристики
     
+    # Индекс изображений, вычисляется при записи (см. image_normalization.py)
+    image_index: Optional[dict] = None
+    # Размеры, цвет и LQIP изображений, добавляются при чтении (см. image_meta.py)
+    image_meta: Optional[Dict[str, dict]] = None
+    
     created_at: datetime = Field(default_factory=lambda: datetime.now())
     updated_at: datetime = Field(default_factory=lambda: datetime.now())
 
@@ -279,3 +302,20 @@ class ProductUpdate(BaseModel):
     detailed_description: Optional[str] = None
     specifications: Optional[dict] = None
     main_features: Optional[List[str]] = None
+
+class ProductCard(BaseModel):
+    """Облегченная карточка товара для списков каталога"""
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str
+    name: str
+    category: str
+    description: str
+    base_price: float
+    images: List[str] = []  # Только обложка (первое изображение)
+    image_meta: Optional[Dict[str, dict]] = None
+    size_categories: Optional[List[str]] = ["kids", "teens", "adults"]
+    status: str = "active"
+    is_featured: bool = False
+    is_active: bool = True
+    created_at: datetime = Field(default_factory=lambda: datetime.now())
@@ -0,0 +1,66 @@
+"""
+Backfill canonical image fields and image_index for existing products
+Run: python normalize_product_images.py [--dry-run]
+
+Replaces the one-off fix_image_urls.py / fix_production_images.py /
+clean_product_images.py passes: new writes are normalized by the API,
+this script brings documents written before that up to date.
+"""
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+from image_normalization import IMAGE_FIELDS, normalize_product_images
+
+load_dotenv()
+
+BATCH_SIZE = 200
+
+
+async def normalize_all(dry_run: bool):
+    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    db_name = os.environ.get('DB_NAME', 'test_database')
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    print("=" * 60)
+    print(f"Normalizing product images in database: {db_name}{' (dry run)' if dry_run else ''}")
+    print("=" * 60)
+
+    projection = {"_id": 1, "name": 1, "image_index": 1, **{field: 1 for field in IMAGE_FIELDS}}
+    batch = []
+    changed = 0
+    total = 0
+
+    async for product in db.products.find({}, projection):
+        total += 1
+        normalized = normalize_product_images(product)
+        if all(product.get(field) == normalized[field] for field in normalized):
+            continue
+
+        changed += 1
+        print(f"  ✓ {product.get('name', 'Unknown')}: {len(normalized['image_index']['all'])} images")
+        batch.append(UpdateOne({"_id": product["_id"]}, {"$set": normalized}))
+        if len(batch) >= BATCH_SIZE and not dry_run:
+            await db.products.bulk_write(batch, ordered=False)
+            batch = []
+
+    if batch and not dry_run:
+        await db.products.bulk_write(batch, ordered=False)
+
+    if changed and not dry_run:
+        # Running servers drop their cached catalog responses and ETags on the next version sync
+        await db.collection_versions.update_one({"_id": "products"}, {"$inc": {"v": 1}}, upsert=True)
+
+    print("=" * 60)
+    print(f"✓ {changed} of {total} product(s) {'would be ' if dry_run else ''}updated")
+    print("=" * 60)
+
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(normalize_all(dry_run="--dry-run" in sys.argv))
@@ -0,0 +1,131 @@
+"""
+Streaming CSV/XLSX export of orders for accounting
+
+One row per order item (orders without items get a single row with empty
+item columns), read straight from a Mongo cursor. CSV is flushed in chunks
+while the cursor is read; XLSX is built with an openpyxl write-only
+workbook, which spools rows to a temporary file instead of keeping them in
+memory, and streamed from disk once complete.
+
+Text typed by customers (names, addresses, product names) is escaped so
+that spreadsheet applications never evaluate it as a formula: in CSV with a
+leading apostrophe, in XLSX by storing it as an explicit string cell, so
+phone numbers like +7 999 ... are exported unchanged.
+"""
+import io
+import os
+import re
+import csv
+import asyncio
+import logging
+import tempfile
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = [
+    "order_id", "created_at", "status", "customer_name", "customer_email", "customer_phone",
+    "shipping_address", "order_total", "item_no", "product_name", "size_category",
+    "quantity", "price", "line_total",
+]
+
+EXPORT_PROJECTION = {
+    "_id": 0, "id": 1, "created_at": 1, "status": 1, "customer_name": 1, "customer_email": 1,
+    "customer_phone": 1, "shipping_address": 1, "total_amount": 1, "items": 1,
+}
+
+# Flush the output buffer once it grows past this many bytes
+_CHUNK_SIZE = 64 * 1024
+
+# A CSV cell starting with one of these is a formula in Excel/LibreOffice
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+# Phone numbers and plain numbers cannot carry a formula payload
+_PHONE_OR_NUMBER_RE = re.compile(r"^\+?[\d\s()-]+$")
+
+
+def safe_cell(value: Any) -> Any:
+    """Neutralize text that a spreadsheet would evaluate as a formula (CSV)"""
+    if (isinstance(value, str) and value.startswith(_FORMULA_PREFIXES)
+            and not _PHONE_OR_NUMBER_RE.match(value)):
+        return "'" + value
+    return value
+
+
+def order_rows(order: Dict[str, Any], escape: Callable[[Any], Any] = safe_cell) -> Iterator[List[Any]]:
+    """
+    Export rows of one order, one per item
+
+    Args:
+        order: Order document
+        escape: Applied to every text cell (safe_cell for CSV)
+    """
+    created_at = order.get("created_at")
+    if hasattr(created_at, "isoformat"):
+        created_at = created_at.isoformat()
+    head = [
+        order.get("id"), created_at, order.get("status"), order.get("customer_name"),
+        order.get("customer_email"), order.get("customer_phone"), order.get("shipping_address"),
+        order.get("total_amount"),
+    ]
+    items = order.get("items") or []
+    head = [escape(value) for value in head]
+    if not items:
+        yield head + [None] * 6
+    for number, item in enumerate(items, start=1):
+        quantity = item.get("quantity") or 0
+        price = item.get("price") or 0
+        yield head + [
+            number, escape(item.get("product_name")), escape(item.get("size_category")),
+            quantity, price, round(quantity * price, 2),
+        ]
+
+
+async def export_csv(cursor) -> AsyncIterator[bytes]:
+    """Yield the orders of a cursor as CSV (UTF-8 with BOM for Excel)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(EXPORT_COLUMNS)
+    async for order in cursor:
+        writer.writerows(["" if value is None else value for value in row] for row in order_rows(order))
+        if buffer.tell() >= _CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def export_xlsx(cursor) -> AsyncIterator[bytes]:
+    """Yield the orders of a cursor as an XLSX workbook"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Orders")
+    sheet.append(EXPORT_COLUMNS)
+
+    def text_cell(value: Any) -> Any:
+        # openpyxl turns only text starting with "=" into a formula; keep it a string
+        if isinstance(value, str) and value.startswith("="):
+            cell = WriteOnlyCell(sheet, value)
+            cell.data_type = "s"
+            return cell
+        return value
+
+    async for order in cursor:
+        for row in order_rows(order, text_cell):
+            sheet.append(row)
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(workbook.save, path)
+        with open(path, "rb") as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, _CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.unlink(path)
@@ -0,0 +1,73 @@
+"""
+Keyset (cursor) pagination helpers for MongoDB listings
+"""
+import base64
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(created_at: Any, item_id: str) -> str:
+    """
+    Encode the sort key of the last returned document into an opaque token
+
+    Args:
+        created_at: Value of the created_at field (ISO string or datetime)
+        item_id: Application-level id of the document
+
+    Returns:
+        URL-safe cursor string
+    """
+    if hasattr(created_at, "isoformat"):
+        created_at = created_at.isoformat()
+    raw = json.dumps([created_at, item_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return created_at, str(item_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_query(query: Dict[str, Any], cursor: Optional[str], tie_field: str = "id") -> Dict[str, Any]:
+    """
+    Extend a find() filter so it only matches documents after the cursor
+    in (created_at desc, <tie_field> desc) order
+
+    Documents without created_at (null or missing) sort after all others in
+    descending order, so they come last and page by tie_field alone.
+
+    Args:
+        tie_field: Unique field breaking ties between equal created_at values
+    """
+    if not cursor:
+        return query
+    created_at, item_id = decode_cursor(cursor)
+    if created_at is None:
+        after = {"created_at": None, tie_field: {"$lt": item_id}}
+    else:
+        after = {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, tie_field: {"$lt": item_id}},
+            # $lt compares within one BSON type and never matches null
+            {"created_at": None},
+        ]}
+    if not query:
+        return after
+    return {"$and": [query, after]}
+
+
+KEYSET_SORT = [("created_at", -1), ("id", -1)]
+# Uploads have no `id`; their public filename is unique instead
+UPLOADS_KEYSET_SORT = [("created_at", -1), ("filename", -1)]
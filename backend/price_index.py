@@ -0,0 +1,170 @@
+"""
+In-memory price map for server-side order pricing
+
+create_order must not trust item prices sent by the client. The map holds
+base_price, name and variant ids of every product, built on startup and
+refreshed per product by the catalog write hooks, so pricing an order is a
+dict lookup. Products missing from the map (a write on another app node,
+a cold map) are read with a single $in query for the whole order. Writes
+made through another node are picked up by a background rebuild when the
+shared products version moves (see schedule_rebuild); the map is also
+rebuilt once it is older than MAX_AGE, as a backstop.
+
+Variants share the price of their product; a variant id is only checked
+to belong to the product. Inactive products cannot be priced (ordered).
+
+Custom team orders from the /order form are not catalog products: their
+items carry a product_type priced from QUOTE_PRODUCT_TYPES, and the order
+is stored as a quote for a manager to confirm.
+"""
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE = 300  # seconds
+
+# Product types of custom team orders (quote requests) and their base price per piece
+QUOTE_PRODUCT_TYPES: Dict[str, Dict[str, Any]] = {
+    "jersey": {"name": "Хоккейное джерси", "base_price": 3500.0},
+    "socks": {"name": "Хоккейные гамаши", "base_price": 800.0},
+    "training": {"name": "Тренировочная форма", "base_price": 2800.0},
+    "accessories": {"name": "Чехлы для шорт", "base_price": 1200.0},
+    "outerwear": {"name": "Верхняя одежда", "base_price": 4500.0},
+}
+
+
+@dataclass
+class ResolvedPrice:
+    product_id: str
+    price: float
+    variant_id: Optional[str]
+
+
+class ProductPriceMap:
+    """product id -> price (and name -> product id for legacy clients)"""
+
+    PROJECTION = {"_id": 0, "id": 1, "name": 1, "base_price": 1, "is_active": 1, "variants.id": 1}
+
+    def __init__(self):
+        self._prices: Dict[str, float] = {}
+        self._variants: Dict[str, Set[str]] = {}
+        self._inactive: Set[str] = set()
+        self._names: Dict[str, str] = {}
+        self._product_names: Dict[str, str] = {}
+        self._ambiguous_names: Set[str] = set()
+        self._built_at: Optional[float] = None
+        self._rebuilding: Optional[asyncio.Task] = None
+        # Ids refreshed while a rebuild is reading; re-applied after its swap
+        self._refreshed_during_rebuild: Optional[Set[str]] = None
+
+    @staticmethod
+    def _name_key(name: str) -> str:
+        return " ".join(name.lower().split())
+
+    def _upsert(self, product: Dict[str, Any]) -> None:
+        if not product.get("id") or product.get("base_price") is None:
+            return
+        product_id = product["id"]
+        self._remove(product_id)
+        self._prices[product_id] = float(product["base_price"])
+        self._variants[product_id] = {v["id"] for v in product.get("variants") or [] if v.get("id")}
+        if product.get("is_active") is False:
+            self._inactive.add(product_id)
+        name = self._name_key(product.get("name") or "")
+        if not name:
+            return
+        owner = self._names.get(name)
+        if owner is not None and owner != product_id:
+            # Several products share the name: a name alone cannot be priced
+            self._ambiguous_names.add(name)
+        self._names[name] = product_id
+        self._product_names[product_id] = name
+
+    def _remove(self, product_id: str) -> None:
+        self._prices.pop(product_id, None)
+        self._variants.pop(product_id, None)
+        self._inactive.discard(product_id)
+        name = self._product_names.pop(product_id, None)
+        if name is not None and self._names.get(name) == product_id:
+            del self._names[name]
+
+    async def rebuild(self, db) -> None:
+        """Build the map from scratch from the products collection"""
+        fresh = ProductPriceMap()
+        self._refreshed_during_rebuild = set()
+        try:
+            async for product in db.products.find({}, self.PROJECTION):
+                fresh._upsert(product)
+        except BaseException:
+            self._refreshed_during_rebuild = None
+            raise
+        self._prices, self._variants, self._inactive = fresh._prices, fresh._variants, fresh._inactive
+        self._names, self._product_names = fresh._names, fresh._product_names
+        self._ambiguous_names = fresh._ambiguous_names
+        self._built_at = time.monotonic()
+        refreshed, self._refreshed_during_rebuild = self._refreshed_during_rebuild, None
+        logger.info(f"Price map built: {len(self._prices)} products")
+        if refreshed:
+            # The rebuild may have read these products before their write
+            await self.refresh(db, refreshed)
+
+    async def refresh(self, db, product_ids: Iterable[str]) -> None:
+        """Re-read the given products after a write; missing ones are removed"""
+        ids = list(product_ids)
+        if self._refreshed_during_rebuild is not None:
+            self._refreshed_during_rebuild.update(ids)
+        found = set()
+        async for product in db.products.find({"id": {"$in": ids}}, self.PROJECTION):
+            self._upsert(product)
+            found.add(product["id"])
+        for product_id in ids:
+            if product_id not in found:
+                self._remove(product_id)
+
+    def schedule_rebuild(self, db) -> None:
+        """Rebuild in the background unless a rebuild is already running"""
+        if self._rebuilding is None or self._rebuilding.done():
+            self._rebuilding = asyncio.create_task(self.rebuild(db))
+
+    async def resolve(self, db, items: List[Dict[str, Any]]) -> List[Optional[ResolvedPrice]]:
+        """
+        Catalog price of every order item, None for items that match no
+        active product (the caller must reject those)
+
+        Items are matched by product_id, or by exact (case-insensitive)
+        product name when the client sent no id. Ids missing from the map
+        (and, while the map is not built yet, names) are looked up together
+        in one query.
+        """
+        cold = self._built_at is None
+        if cold or time.monotonic() - self._built_at > MAX_AGE:
+            self.schedule_rebuild(db)
+
+        missing_ids = {item["product_id"] for item in items
+                       if item.get("product_id") and item["product_id"] not in self._prices}
+        missing_names = {item["product_name"] for item in items
+                         if cold and not item.get("product_id") and item.get("product_name")
+                         and self._name_key(item["product_name"]) not in self._names}
+        if missing_ids or missing_names:
+            query = {"$or": [{"id": {"$in": list(missing_ids)}}, {"name": {"$in": list(missing_names)}}]}
+            async for product in db.products.find(query, self.PROJECTION):
+                self._upsert(product)
+
+        resolved = []
+        for item in items:
+            product_id = item.get("product_id")
+            if not product_id:
+                name = self._name_key(item.get("product_name") or "")
+                product_id = None if name in self._ambiguous_names else self._names.get(name)
+            if product_id not in self._prices or product_id in self._inactive:
+                resolved.append(None)
+                continue
+            variant_id = item.get("variant_id")
+            if variant_id and variant_id not in self._variants.get(product_id, set()):
+                variant_id = None
+            resolved.append(ResolvedPrice(product_id, self._prices[product_id], variant_id))
+        return resolved
@@ -0,0 +1,157 @@
+"""
+Streaming NDJSON/CSV export and incremental parsing for product import
+
+Export formats round-trip: a file produced by /api/products/export can be
+edited in a spreadsheet and uploaded back to /api/products/import.
+In CSV, list and dict fields (images, variants, specifications, ...) are
+stored as JSON strings in their column. Columns missing from an import row
+leave the stored value alone; model defaults only fill them in for new
+products.
+"""
+import io
+import csv
+import json
+import uuid
+import logging
+from itertools import islice
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterator, List, Tuple
+import orjson
+from pydantic import ValidationError
+from models import ProductCreate
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_FIELDS = ["id"] + list(ProductCreate.model_fields) + ["created_at", "updated_at"]
+
+# Columns that hold JSON in CSV files
+JSON_FIELDS = {
+    "images", "variants", "product_images", "features", "size_categories",
+    "size_category_images", "specifications", "main_features",
+}
+
+EXPORT_PROJECTION = {"_id": 0, **{name: 1 for name in PRODUCT_FIELDS}}
+
+# Flush the output buffer once it grows past this many bytes
+_CHUNK_SIZE = 64 * 1024
+
+
+async def export_ndjson(cursor) -> AsyncIterator[bytes]:
+    """Yield the documents of a cursor as newline-delimited JSON"""
+    buffer = bytearray()
+    async for doc in cursor:
+        buffer += orjson.dumps(doc)
+        buffer += b"\n"
+        if len(buffer) >= _CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def _csv_value(field: str, value: Any) -> Any:
+    if value is None:
+        return ""
+    if field in JSON_FIELDS:
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+async def export_csv(cursor) -> AsyncIterator[bytes]:
+    """Yield the documents of a cursor as CSV (UTF-8 with BOM for Excel)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(PRODUCT_FIELDS)
+    async for doc in cursor:
+        writer.writerow([_csv_value(field, doc.get(field)) for field in PRODUCT_FIELDS])
+        if buffer.tell() >= _CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_ndjson_rows(stream: BinaryIO) -> Iterator[Tuple[int, Any]]:
+    """
+    Yield (line number, parsed object) pairs from an NDJSON stream
+
+    Lines that are not valid JSON yield the exception instead of a dict.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield line_number, ValueError(f"Invalid JSON: {e}")
+
+
+def iter_csv_rows(stream: BinaryIO) -> Iterator[Tuple[int, Any]]:
+    """Yield (row number, dict) pairs from a CSV stream, decoding JSON columns"""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    for row in reader:
+        row_number = reader.line_num
+        parsed: Dict[str, Any] = {}
+        try:
+            for field, value in row.items():
+                if field is None or value is None or value == "":
+                    continue
+                parsed[field] = json.loads(value) if field in JSON_FIELDS else value
+        except json.JSONDecodeError as e:
+            yield row_number, ValueError(f"Invalid JSON in column {field}: {e}")
+            continue
+        yield row_number, parsed
+    text.detach()
+
+
+def row_to_document(row: Any) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    """
+    Validate an import row and turn it into a product update
+
+    Returns:
+        (product id, fields present in the row to $set,
+         defaults of the other fields to $setOnInsert)
+
+    Raises:
+        ValueError: if the row is not a valid product
+    """
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError("Row must be an object")
+    try:
+        product = ProductCreate(**row)
+    except ValidationError as e:
+        errors = "; ".join(
+            f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+        )
+        raise ValueError(errors)
+
+    product_id = str(row.get("id") or uuid.uuid4())
+    fields = product.model_dump(exclude_unset=True)
+    defaults = {name: value for name, value in product.model_dump().items() if name not in fields}
+    return product_id, fields, defaults
+
+
+def parse_rows(rows: Iterator[Tuple[int, Any]], limit: int) -> List[Tuple[int, Any]]:
+    """
+    Read and validate up to `limit` rows (blocking, meant for asyncio.to_thread)
+
+    Returns:
+        (row number, row_to_document() result or the ValueError) pairs;
+        an empty list once the rows are exhausted
+    """
+    parsed = []
+    for row_number, row in islice(rows, limit):
+        try:
+            parsed.append((row_number, row_to_document(row)))
+        except ValueError as e:
+            parsed.append((row_number, e))
+    return parsed
@@ -0,0 +1,194 @@
+"""
+Sync the `uploads` / `upload_blobs` collections with the upload storage
+Run: python reconcile_uploads.py [--dry-run]
+
+- files still lying directly in uploads/ (uploaded before the blob store)
+  are adopted into the blob store and indexed, keeping their public name
+- with STORAGE_BACKEND=s3, blobs and derivatives still on the local disk are
+  copied to the bucket (run once after switching the backend)
+- `uploads` documents whose bytes are gone are removed
+- missing width/height, dominant colour and LQIP of raster uploads are filled in
+- blob reference counts are recomputed; unreferenced blobs are deleted
+"""
+import asyncio
+import os
+import shutil
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+from image_processing import is_raster
+from storage import LocalStorage, create_storage
+from uploads import UploadStore, content_type_of, hash_file
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+UPLOAD_DIR = ROOT_DIR / "uploads"
+
+
+async def adopt_legacy_files(db, store: UploadStore, dry_run: bool) -> int:
+    adopted = 0
+    for path in sorted(UPLOAD_DIR.iterdir()):
+        if not path.is_file() or path.name.startswith("."):
+            continue
+        if await db.uploads.find_one({"filename": path.name}, {"_id": 1}):
+            continue
+        adopted += 1
+        print(f"  + {path.name}")
+        if dry_run:
+            continue
+        received = await asyncio.to_thread(hash_file, path)
+        created_at = datetime.fromtimestamp(path.stat().st_mtime, tz=timezone.utc).isoformat()
+        await store.save(received, path.name, path.name, created_at=created_at)
+    return adopted
+
+
+async def drop_missing_documents(db, store: UploadStore, dry_run: bool) -> int:
+    missing = []
+    async for doc in db.uploads.find({}, {"_id": 0, "filename": 1, "sha256": 1}):
+        if not await store.storage.exists(store.blob_key(doc["sha256"])):
+            missing.append(doc["filename"])
+            print(f"  - {doc['filename']} (bytes missing)")
+    if missing and not dry_run:
+        await db.uploads.delete_many({"filename": {"$in": missing}})
+    return len(missing)
+
+
+async def fill_image_meta(db, store: UploadStore, dry_run: bool) -> int:
+    """Dimensions, dominant colour and LQIP of raster uploads stored before they were computed"""
+    filled = 0
+    async for doc in db.uploads.find({"lqip": None}, {"_id": 0, "filename": 1, "sha256": 1}):
+        if not is_raster(doc["filename"]):
+            continue
+        filled += 1
+        if dry_run:
+            continue
+        try:
+            await store.ensure_image_meta(doc)
+        except Exception as e:
+            print(f"  ❌ {doc['filename']}: {e}")
+            filled -= 1
+    return filled
+
+
+async def fix_blob_refcounts(db, store: UploadStore, dry_run: bool) -> int:
+    references = {
+        row["_id"]: row["count"]
+        async for row in db.uploads.aggregate([{"$group": {"_id": "$sha256", "count": {"$sum": 1}}}])
+    }
+    fixed = 0
+    async for blob in db.upload_blobs.find({}, {"refcount": 1}):
+        expected = references.pop(blob["_id"], 0)
+        if blob.get("refcount") == expected:
+            continue
+        fixed += 1
+        print(f"  ~ blob {blob['_id'][:12]}: refcount {blob.get('refcount')} -> {expected}")
+        if dry_run:
+            continue
+        if expected:
+            await db.upload_blobs.update_one({"_id": blob["_id"]}, {"$set": {"refcount": expected}})
+        else:
+            await db.upload_blobs.delete_one({"_id": blob["_id"]})
+
+    # Referenced content without a blob document (e.g. written by a crashed upload)
+    for sha256, count in references.items():
+        if not await store.storage.exists(store.blob_key(sha256)):
+            continue
+        fixed += 1
+        print(f"  ~ blob {sha256[:12]}: refcount missing -> {count}")
+        if not dry_run:
+            doc = await db.uploads.find_one({"sha256": sha256}, {"_id": 0, "size": 1})
+            await db.upload_blobs.update_one(
+                {"_id": sha256},
+                {"$set": {"refcount": count}, "$setOnInsert": {"size": (doc or {}).get("size")}},
+                upsert=True
+            )
+    return fixed
+
+
+async def delete_unreferenced_blobs(db, store: UploadStore, dry_run: bool) -> int:
+    deleted = 0
+    async for key in store.storage.iter_keys("blobs/"):
+        # Precompressed siblings (<sha>.gz, <sha>.br) share the blob's fate
+        sha256 = key.rsplit("/", 1)[1].split(".")[0]
+        if await db.upload_blobs.find_one({"_id": sha256}, {"_id": 1}):
+            continue
+        if await db.uploads.find_one({"sha256": sha256}, {"_id": 1}):
+            continue
+        deleted += 1
+        print(f"  - blob {sha256[:12]} (unreferenced)")
+        if not dry_run:
+            derived = [derived_key async for derived_key in store.storage.iter_keys(f"derived/{sha256}_w")]
+            await store.storage.delete([key] + derived)
+    return deleted
+
+
+async def copy_local_objects(db, store: UploadStore, dry_run: bool) -> int:
+    """Copy blobs and derivatives from the local upload directory to remote storage"""
+    if isinstance(store.storage, LocalStorage):
+        return 0
+    local = LocalStorage(UPLOAD_DIR)
+    copied = 0
+    for prefix in ("blobs/", "derived/"):
+        async for key in local.iter_keys(prefix):
+            if await store.storage.exists(key):
+                continue
+            copied += 1
+            print(f"  ↑ {key}")
+            if not dry_run:
+                async with local.local_copy(key, store.temp_dir) as source:
+                    temp_path = store.temp_dir / f"{key.replace('/', '_')}.upload"
+                    await asyncio.to_thread(shutil.copyfile, source, temp_path)
+                name = key.rsplit("/", 1)[1]
+                if prefix == "blobs/":
+                    doc = await db.uploads.find_one({"sha256": name.split(".")[0]}, {"_id": 0, "content_type": 1})
+                    content_type = (doc or {}).get("content_type") or "application/octet-stream"
+                else:
+                    content_type = content_type_of(name)
+                encoding = {".gz": "gzip", ".br": "br"}.get(Path(key).suffix)
+                await store.storage.put_file(key, temp_path, content_type, encoding)
+    return copied
+
+
+async def reconcile(dry_run: bool):
+    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    db_name = os.environ.get('DB_NAME', 'test_database')
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    store = UploadStore(db, create_storage(UPLOAD_DIR), UPLOAD_DIR / ".tmp")
+
+    print("=" * 60)
+    print(f"Reconciling uploads in database: {db_name}{' (dry run)' if dry_run else ''}")
+    print("=" * 60)
+
+    if not UPLOAD_DIR.exists():
+        print(f"❌ Upload directory {UPLOAD_DIR} does not exist")
+        client.close()
+        return
+
+    copied = await copy_local_objects(db, store, dry_run)
+    adopted = await adopt_legacy_files(db, store, dry_run)
+    missing = await drop_missing_documents(db, store, dry_run)
+    filled = await fill_image_meta(db, store, dry_run)
+    fixed = await fix_blob_refcounts(db, store, dry_run)
+    deleted = await delete_unreferenced_blobs(db, store, dry_run)
+
+    print("=" * 60)
+    print(f"✓ Local objects copied:      {copied}")
+    print(f"✓ Legacy files adopted:      {adopted}")
+    print(f"✓ Documents without bytes:   {missing}")
+    print(f"✓ Image meta filled in:      {filled}")
+    print(f"✓ Blob refcounts fixed:      {fixed}")
+    print(f"✓ Unreferenced blobs:        {deleted}")
+    if dry_run:
+        print("(dry run, nothing was changed)")
+    print("=" * 60)
+
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(reconcile(dry_run="--dry-run" in sys.argv))
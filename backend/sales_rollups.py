@@ -0,0 +1,241 @@
+"""
+Incrementally maintained sales rollups (the `daily_sales` collection)
+
+Every order contributes to two kinds of rollup rows, keyed by the day it
+was created and its current status:
+
+    kind "total":  _id "<day>|<status>"                    orders, revenue, items
+    kind "item":   _id "<day>|<status>|<size>|<product>"   quantity, revenue
+
+create_order adds an order with sign +1; a status change moves it from the
+old status rows to the new ones. Rows also carry the ISO week (its Monday)
+and the month of their day, so sales_report() groups by day, week or month
+with one indexed $facet aggregation over the rollups instead of the orders.
+backfill_sales.py rebuilds the collection from the order history.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from db_indexes import INDEX_MANIFEST
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("day", "week", "month")
+TOP_PRODUCTS = 20
+# Margin for clocks of app nodes running behind the one that rebuilds
+CLOCK_SKEW = timedelta(minutes=5)
+CATCH_UP_PASSES = 5
+
+# _id -> (fields set when the row is created, counters to increment)
+Increments = Dict[str, Tuple[Dict[str, Any], Dict[str, float]]]
+
+
+def _periods(day: str) -> Dict[str, str]:
+    parsed = date.fromisoformat(day)
+    monday = parsed - timedelta(days=parsed.weekday())
+    return {"day": day, "week": monday.isoformat(), "month": day[:7]}
+
+
+def order_increments(order: Dict[str, Any], sign: int = 1) -> Increments:
+    """
+    Rollup changes contributed by one order
+
+    Args:
+        order: Order document (created_at as ISO string or datetime)
+        sign: +1 to add the order, -1 to remove it
+    """
+    created_at = order["created_at"]
+    day = (created_at.isoformat() if hasattr(created_at, "isoformat") else str(created_at))[:10]
+    status = order.get("status") or "pending"
+    periods = _periods(day)
+    items = order.get("items") or []
+
+    increments: Increments = {
+        f"{day}|{status}": (
+            {**periods, "status": status, "kind": "total"},
+            {
+                "orders": sign,
+                "revenue": sign * float(order.get("total_amount") or 0),
+                "items": sign * sum(int(item.get("quantity") or 0) for item in items),
+            },
+        )
+    }
+    for item in items:
+        size = item.get("size_category") or ""
+        name = item.get("product_name") or ""
+        quantity = int(item.get("quantity") or 0)
+        fields = {**periods, "status": status, "kind": "item", "size_category": size, "product_name": name}
+        merge_increments(increments, {
+            f"{day}|{status}|{size}|{name}": (
+                fields, {"quantity": sign * quantity, "revenue": sign * quantity * float(item.get("price") or 0)}
+            )
+        })
+    return increments
+
+
+def merge_increments(into: Increments, other: Increments) -> None:
+    """Add the counters of `other` to `into` in place"""
+    for row_id, (fields, counters) in other.items():
+        if row_id not in into:
+            into[row_id] = (fields, dict(counters))
+            continue
+        merged = into[row_id][1]
+        for name, value in counters.items():
+            merged[name] = merged.get(name, 0) + value
+
+
+def increment_operations(increments: Increments) -> List[UpdateOne]:
+    return [
+        UpdateOne({"_id": row_id}, {"$setOnInsert": fields, "$inc": counters}, upsert=True)
+        for row_id, (fields, counters) in increments.items()
+    ]
+
+
+async def apply_increments(collection, increments: Increments) -> None:
+    operations = increment_operations(increments)
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+
+
+async def record_order(db, order: Dict[str, Any]) -> None:
+    """Add a newly created order to the rollups"""
+    await apply_increments(db.daily_sales, order_increments(order, 1))
+
+
+async def record_status_change(db, before: Dict[str, Any], after: Dict[str, Any]) -> None:
+    """
+    Move an order between status rows
+
+    `before` must be the document as it was replaced (find_one_and_update
+    with ReturnDocument.BEFORE), so concurrent status changes never move the
+    same contribution twice.
+    """
+    increments = order_increments(before, -1)
+    merge_increments(increments, order_increments(after, 1))
+    await apply_increments(db.daily_sales, increments)
+
+
+async def sales_report(db, date_from: str, date_to: str, granularity: str = "day",
+                       statuses: Optional[List[str]] = None,
+                       exclude_statuses: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Sales between two days (both inclusive) from the rollups
+
+    Returns:
+        {"series": [{"period", "orders", "revenue", "items"}], "by_status": [...],
+         "by_size": [...], "top_products": [...]}
+    """
+    match: Dict[str, Any] = {"day": {"$gte": date_from, "$lte": date_to}}
+    if statuses:
+        match["status"] = {"$in": statuses}
+    elif exclude_statuses:
+        match["status"] = {"$nin": exclude_statuses}
+
+    def totals(key: str) -> List[Dict[str, Any]]:
+        return [
+            {"$match": {"kind": "total"}},
+            {"$group": {"_id": key, "orders": {"$sum": "$orders"}, "revenue": {"$sum": "$revenue"},
+                        "items": {"$sum": "$items"}}},
+            {"$sort": {"_id": 1}},
+        ]
+
+    def items(key: str) -> List[Dict[str, Any]]:
+        return [
+            {"$match": {"kind": "item"}},
+            {"$group": {"_id": key, "quantity": {"$sum": "$quantity"}, "revenue": {"$sum": "$revenue"}}},
+            {"$sort": {"revenue": -1}},
+        ]
+
+    pipeline = [
+        {"$match": match},
+        {"$facet": {
+            "series": totals(f"${granularity}"),
+            "by_status": totals("$status"),
+            "by_size": items("$size_category"),
+            "top_products": items("$product_name") + [{"$limit": TOP_PRODUCTS}],
+        }},
+    ]
+    result = (await db.daily_sales.aggregate(pipeline).to_list(length=1))[0]
+
+    def rows(facet: str, key: str) -> List[Dict[str, Any]]:
+        return [
+            {key: row.pop("_id"), **{name: round(value, 2) for name, value in row.items()}}
+            for row in result[facet]
+            if any(row[name] for name in row if name != "_id")
+        ]
+
+    return {
+        "series": rows("series", "period"),
+        "by_status": rows("by_status", "status"),
+        "by_size": rows("by_size", "size_category"),
+        "top_products": rows("top_products", "product_name"),
+    }
+
+
+async def rebuild_rollups(db, batch_size: int = 1000, target: str = "daily_sales_rebuild") -> Dict[str, int]:
+    """
+    Recompute the rollups from every order into `target`, then swap it in
+
+    Orders are read in batches and their increments merged in memory, so
+    each batch costs one bulk write no matter how many orders it holds.
+    The status each order was counted with is remembered. Before the swap,
+    orders created or updated since the rebuild started are read again and
+    moved from the counted status to their current one, until a pass finds
+    no more changes (at most CATCH_UP_PASSES). The swap is a single
+    renameCollection with dropTarget; only a change landing between the
+    last pass and the rename is left to the next rebuild.
+
+    Returns:
+        {"orders": orders read, "rows": rollup rows written, "caught_up": orders re-applied}
+    """
+    staging = db[target]
+    await staging.drop()
+    projection = {"_id": 0, "id": 1, "created_at": 1, "status": 1, "total_amount": 1, "items": 1}
+    # order id -> status it is counted with in `staging`
+    counted: Dict[str, str] = {}
+    counts = defaultdict(int)
+
+    async def count_orders(cursor, counter: str) -> int:
+        """Bring the orders of a cursor up to date in staging; returns how many changed"""
+        batch: Increments = {}
+        changed = 0
+        async for order in cursor:
+            if not order.get("created_at"):
+                continue
+            status = order.get("status") or "pending"
+            previous = counted.get(order["id"])
+            if previous == status:
+                continue
+            if previous is not None:
+                merge_increments(batch, order_increments({**order, "status": previous}, -1))
+            merge_increments(batch, order_increments(order, 1))
+            counted[order["id"]] = status
+            counts[counter] += 1
+            changed += 1
+            if changed % batch_size == 0:
+                await apply_increments(staging, batch)
+                batch = {}
+        await apply_increments(staging, batch)
+        return changed
+
+    # created_at/updated_at are ISO strings from the local clock of the app node
+    since = (datetime.now() - CLOCK_SKEW).isoformat()
+    await count_orders(db.orders.find({}, projection).batch_size(batch_size), "orders")
+    for _ in range(CATCH_UP_PASSES):
+        next_since = (datetime.now() - CLOCK_SKEW).isoformat()
+        recent = {"$or": [{"created_at": {"$gte": since}}, {"updated_at": {"$gte": since}}]}
+        if not await count_orders(db.orders.find(recent, projection), "caught_up"):
+            break
+        since = next_since
+
+    counts["rows"] = await staging.count_documents({})
+    if counts["rows"]:
+        # Indexes do not survive the rename from the target's side
+        for keys, options in INDEX_MANIFEST["daily_sales"]:
+            await staging.create_index(keys, **options)
+        await staging.rename("daily_sales", dropTarget=True)
+    else:
+        await db.daily_sales.delete_many({})
+    return dict(counts)
@@ -0,0 +1,371 @@
+"""
+In-memory inverted index for product search and typeahead
+
+Terms are Russian stems transliterated to Latin, so "джерси", "Джерси" and
+"dzhersi" land on the same posting list. Latin queries are additionally
+transliterated back to Cyrillic and stemmed, so "hokkeynaya" finds
+"хоккейная". The index is built once on startup and then updated per
+product on every catalog write; queries never touch MongoDB. Writes made by
+another worker process are picked up by a background rebuild when the shared
+products version moves (see schedule_rebuild).
+"""
+import re
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, List, Optional, Set
+from translit import TRANSLIT_MAP
+
+logger = logging.getLogger(__name__)
+
+# Latin -> Cyrillic, longest sequences first
+_REVERSE_TRANSLIT = sorted(
+    ((lat, cyr) for cyr, lat in TRANSLIT_MAP.items() if lat and cyr not in 'ёэы'),
+    key=lambda pair: -len(pair[0])
+)
+_REVERSE_TRANSLIT += [('x', 'кс'), ('w', 'в'), ('q', 'к'), ('c', 'к'), ('j', 'дж'), ('h', 'х')]
+
+# Field weights: a hit in the name outranks a hit in the description
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "main_features": 2.0,
+    "features": 2.0,
+    "description": 1.0,
+    "specifications": 1.0,
+}
+
+PREFIX_WEIGHT = 0.5
+MAX_PREFIX_TERMS = 64
+
+_TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+_LATIN_RE = re.compile(r"^[a-z]+$")
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+_VOWELS = "аеиоуыэюя"
+_PERFECTIVE_GERUND_1 = ("вшись", "вши", "в")
+_PERFECTIVE_GERUND_2 = ("ившись", "ывшись", "ивши", "ывши", "ив", "ыв")
+_REFLEXIVE = ("ся", "сь")
+_ADJECTIVE = ("ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий", "ый",
+              "ой", "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею")
+_PARTICIPLE_1 = ("ем", "нн", "вш", "ющ", "щ")
+_PARTICIPLE_2 = ("ивш", "ывш", "ующ")
+_VERB_1 = ("ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны", "ть", "й", "л", "н")
+_VERB_2 = ("ейте", "уйте", "ила", "ыла", "ена", "ите", "или", "ыли", "ило", "ыло", "ено", "ует", "уют",
+           "ены", "ить", "ыть", "ишь", "ей", "уй", "ил", "ыл", "им", "ым", "ен", "ят", "ит", "ыт", "ую", "ю")
+_NOUN = ("иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ие", "ье", "еи", "ии", "ей", "ой",
+         "ий", "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья", "а", "е", "и", "й", "о", "у",
+         "ы", "ь", "ю", "я")
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+
+def _strip(word: str, endings: Iterable[str], preceded_by: str = "") -> Optional[str]:
+    """Remove the first matching ending (optionally required to follow а/я)"""
+    for ending in endings:
+        if word.endswith(ending):
+            stem = word[:-len(ending)]
+            if preceded_by and (not stem or stem[-1] not in preceded_by):
+                continue
+            return stem
+    return None
+
+
+def _strip_group(word: str, group_1: Iterable[str], group_2: Iterable[str]) -> Optional[str]:
+    stem = _strip(word, group_2)
+    if stem is None:
+        stem = _strip(word, group_1, preceded_by="ая")
+    return stem
+
+
+def stem_russian(word: str) -> str:
+    """
+    Light Snowball-style Russian stemmer
+
+    Args:
+        word: Lowercase Cyrillic word
+
+    Returns:
+        Word with its inflectional ending removed
+    """
+    word = word.replace("ё", "е")
+    rv_start = next((i + 1 for i, ch in enumerate(word) if ch in _VOWELS), len(word))
+    head, rv = word[:rv_start], word[rv_start:]
+    if not rv:
+        return word
+
+    # Step 1
+    stem = _strip_group(rv, _PERFECTIVE_GERUND_1, _PERFECTIVE_GERUND_2)
+    if stem is None:
+        rv = _strip(rv, _REFLEXIVE) or rv
+        stem = _strip(rv, _ADJECTIVE)
+        if stem is not None:
+            stem = _strip_group(stem, _PARTICIPLE_1, _PARTICIPLE_2) or stem
+        else:
+            stem = _strip_group(rv, _VERB_1, _VERB_2)
+            if stem is None:
+                stem = _strip(rv, _NOUN)
+    rv = stem if stem is not None else rv
+
+    # Step 2
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    # Step 3 (derivational suffixes, only on long enough words)
+    if len(rv) > 4:
+        rv = _strip(rv, _DERIVATIONAL) or rv
+
+    # Step 4
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    else:
+        superlative = _strip(rv, _SUPERLATIVE)
+        if superlative is not None:
+            rv = superlative
+            if rv.endswith("нн"):
+                rv = rv[:-1]
+        elif rv.endswith("ь"):
+            rv = rv[:-1]
+
+    return head + rv
+
+
+def transliterate(word: str) -> str:
+    """Convert Cyrillic to Latin"""
+    return "".join(TRANSLIT_MAP.get(ch, ch) for ch in word)
+
+
+def detransliterate(word: str) -> str:
+    """Best-effort Latin -> Cyrillic conversion"""
+    result = []
+    i = 0
+    while i < len(word):
+        for lat, cyr in _REVERSE_TRANSLIT:
+            if word.startswith(lat, i):
+                result.append(cyr)
+                i += len(lat)
+                break
+        else:
+            result.append(word[i])
+            i += 1
+    return "".join(result)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens (Latin, Cyrillic and digits)"""
+    return _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+
+
+def word_terms(word: str) -> Set[str]:
+    """
+    Canonical index terms for a single word
+
+    Every term is in transliterated Latin form, so Cyrillic and Latin
+    spellings of the same word share terms.
+    """
+    if _CYRILLIC_RE.search(word):
+        return {transliterate(stem_russian(word))}
+    terms = {word}
+    if _LATIN_RE.match(word) and len(word) > 2:
+        terms.add(transliterate(stem_russian(detransliterate(word))))
+    return terms
+
+
+def surface_form(word: str) -> str:
+    """Unstemmed transliterated word, used for prefix matching"""
+    return transliterate(word) if _CYRILLIC_RE.search(word) else word
+
+
+def _field_text(product: Dict[str, Any], field: str) -> str:
+    value = product.get(field)
+    if not value:
+        return ""
+    if isinstance(value, dict):
+        return " ".join(f"{k} {v}" for k, v in value.items() if isinstance(v, (str, int, float)))
+    if isinstance(value, list):
+        return " ".join(str(v) for v in value if isinstance(v, (str, int, float)))
+    return str(value)
+
+
+def product_card(product: Dict[str, Any]) -> Dict[str, Any]:
+    """Subset of a product document returned in search results"""
+    return {
+        "id": product["id"],
+        "name": product.get("name", ""),
+        "category": product.get("category", ""),
+        "description": product.get("description", ""),
+        "base_price": product.get("base_price", 0),
+        "images": (product.get("images") or [])[:1],
+        "size_categories": product.get("size_categories"),
+        "status": product.get("status", "active"),
+        "is_featured": product.get("is_featured", False),
+        "is_active": product.get("is_active", True),
+        "created_at": product.get("created_at"),
+    }
+
+
+class ProductSearchIndex:
+    """Inverted index over product text fields with prefix lookup"""
+
+    # Fields needed to (re)index a product
+    PROJECTION = {
+        "_id": 0, "id": 1, "name": 1, "category": 1, "description": 1, "base_price": 1,
+        "images": {"$slice": 1}, "size_categories": 1, "status": 1, "is_featured": 1,
+        "is_active": 1, "created_at": 1, "features": 1, "main_features": 1, "specifications": 1,
+    }
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._terms: List[str] = []  # sorted keys of _postings
+        self._doc_terms: Dict[str, Set[str]] = {}
+        self._cards: Dict[str, Dict[str, Any]] = {}
+        self._bulk = False  # While True, _terms is left unsorted (sorted once by rebuild)
+        self._rebuilding: Optional[asyncio.Task] = None
+        # Ids refreshed while a rebuild is reading; re-applied after its swap
+        self._refreshed_during_rebuild: Optional[Set[str]] = None
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    # ---- maintenance ----
+
+    def _add_posting(self, term: str, product_id: str, weight: float) -> None:
+        postings = self._postings.get(term)
+        if postings is None:
+            postings = self._postings[term] = {}
+            if self._bulk:
+                self._terms.append(term)
+            else:
+                insort(self._terms, term)
+        if weight > postings.get(product_id, 0):
+            postings[product_id] = weight
+
+    def _drop_term(self, term: str, product_id: str) -> None:
+        postings = self._postings.get(term)
+        if postings is None:
+            return
+        postings.pop(product_id, None)
+        if not postings:
+            del self._postings[term]
+            i = bisect_left(self._terms, term)
+            if i < len(self._terms) and self._terms[i] == term:
+                del self._terms[i]
+
+    def upsert(self, product: Dict[str, Any]) -> None:
+        """Index (or re-index) a single product document"""
+        product_id = product["id"]
+        self.remove(product_id)
+
+        terms: Set[str] = set()
+        for field, weight in FIELD_WEIGHTS.items():
+            for word in tokenize(_field_text(product, field)):
+                for term in word_terms(word) | {surface_form(word)}:
+                    self._add_posting(term, product_id, weight)
+                    terms.add(term)
+
+        self._doc_terms[product_id] = terms
+        self._cards[product_id] = product_card(product)
+
+    def remove(self, product_id: str) -> None:
+        """Remove a product from the index"""
+        for term in self._doc_terms.pop(product_id, ()):
+            self._drop_term(term, product_id)
+        self._cards.pop(product_id, None)
+
+    async def rebuild(self, db) -> None:
+        """Build the index from scratch from the products collection"""
+        fresh = ProductSearchIndex()
+        fresh._bulk = True
+        self._refreshed_during_rebuild = set()
+        try:
+            async for product in db.products.find({}, self.PROJECTION):
+                if product.get("id"):
+                    fresh.upsert(product)
+        except BaseException:
+            self._refreshed_during_rebuild = None
+            raise
+        # Sorting once is O(T log T); inserting each new term in order was O(T^2)
+        fresh._terms = sorted(fresh._postings)
+        self._postings, self._terms = fresh._postings, fresh._terms
+        self._doc_terms, self._cards = fresh._doc_terms, fresh._cards
+        refreshed, self._refreshed_during_rebuild = self._refreshed_during_rebuild, None
+        logger.info(f"Search index built: {len(self._cards)} products, {len(self._terms)} terms")
+        if refreshed:
+            # The rebuild may have read these products before their write
+            await self.refresh(db, refreshed)
+
+    def schedule_rebuild(self, db) -> None:
+        """Rebuild in the background unless a rebuild is already running"""
+        if self._rebuilding is None or self._rebuilding.done():
+            self._rebuilding = asyncio.create_task(self.rebuild(db))
+
+    async def refresh(self, db, product_ids: Iterable[str]) -> None:
+        """Re-read the given products after a write; missing ones are removed"""
+        ids = list(product_ids)
+        if self._refreshed_during_rebuild is not None:
+            self._refreshed_during_rebuild.update(ids)
+        found = set()
+        async for product in db.products.find({"id": {"$in": ids}}, self.PROJECTION):
+            self.upsert(product)
+            found.add(product["id"])
+        for product_id in ids:
+            if product_id not in found:
+                self.remove(product_id)
+
+    # ---- queries ----
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        i = bisect_left(self._terms, prefix)
+        matched = []
+        while i < len(self._terms) and self._terms[i].startswith(prefix) and len(matched) < MAX_PREFIX_TERMS:
+            matched.append(self._terms[i])
+            i += 1
+        return matched
+
+    def search(self, query: str, limit: int = 10, prefix: bool = True,
+               include_inactive: bool = False) -> List[Dict[str, Any]]:
+        """
+        Find products matching every word of the query
+
+        Args:
+            query: Free-text query in Russian or Latin transliteration
+            limit: Maximum number of results
+            prefix: Treat the last word as a prefix (typeahead)
+            include_inactive: Also return unpublished products
+
+        Returns:
+            Product cards ordered by relevance
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+
+        scores: Optional[Dict[str, float]] = None
+        for position, word in enumerate(words):
+            word_scores: Dict[str, float] = {}
+            for term in word_terms(word):
+                for product_id, weight in self._postings.get(term, {}).items():
+                    word_scores[product_id] = max(word_scores.get(product_id, 0), weight)
+
+            if prefix and position == len(words) - 1:
+                for term in self._prefix_terms(surface_form(word)):
+                    for product_id, weight in self._postings[term].items():
+                        partial = weight * PREFIX_WEIGHT
+                        if partial > word_scores.get(product_id, 0):
+                            word_scores[product_id] = partial
+
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {pid: s + word_scores[pid] for pid, s in scores.items() if pid in word_scores}
+            if not scores:
+                return []
+
+        results = []
+        for product_id, score in scores.items():
+            card = self._cards.get(product_id)
+            if card is None or (not include_inactive and not card.get("is_active", True)):
+                continue
+            results.append((score, card))
+
+        results.sort(key=lambda pair: (-pair[0], pair[1]["name"]))
+        return [card for _, card in results[:limit]]
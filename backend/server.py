@@ -1,6 +1,6 @@
-from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException, Depends, Request
+from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException, Depends, Request, Response, Query, Header
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -9,15 +9,16 @@ import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional
+import re
 import uuid
-from datetime import datetime, timezone
+import hashlib
+from datetime import datetime, timedelta, timezone
 import shutil
-import aiofiles
 from models import (
-    Order, OrderCreate, OrderUpdate, 
+    Order, OrderCreate, OrderUpdate, OrderSummary,
     Article, ArticleCreate, ArticleUpdate, 
     AIGenerateRequest, 
-    Product, ProductCreate, ProductUpdate,
+    Product, ProductCard, ProductCreate, ProductUpdate,
     User, UserCreate, UserUpdate, UserLogin, UserResponse, Token,
     ForgotPasswordRequest, ResetPasswordRequest
 )
@@ -26,6 +27,27 @@ from auth_utils import (
     get_current_user, get_admin_user, get_staff_user, get_customer_user
 )
 from email_service import EmailService
+from pagination import encode_cursor, keyset_query, KEYSET_SORT, UPLOADS_KEYSET_SORT
+from catalog_cache import CatalogCache
+from http_cache import CollectionVersions, immutable_file_response
+from db_indexes import ensure_indexes
+from search_index import ProductSearchIndex
+from fast_json import ModelSerializer, json_response, dumps as json_dumps
+import asyncio
+from uploads import receive_multipart_upload, UploadStore, PRECOMPRESSED_EXTENSIONS
+from storage import create_storage
+from image_meta import ImageMetaLookup
+from upload_jobs import UploadJobQueue
+from idempotency import IdempotencyStore, request_fingerprint
+from price_index import ProductPriceMap, QUOTE_PRODUCT_TYPES
+from sales_rollups import GRANULARITIES, record_order, record_status_change, sales_report
+from image_processing import ImageTooLargeError, shutdown_executor, is_raster, transform_image
+from transform_cache import TransformCache, normalize_transform
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+import product_io
+import order_export
+from image_normalization import IMAGE_FIELDS, normalize_product_images
 from telegram_service import TelegramService
 from fastapi import BackgroundTasks
 
@@ -38,9 +60,61 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# In-process catalog cache, invalidated by product write endpoints
+catalog_cache = CatalogCache(
+    max_lists=int(os.environ.get("CATALOG_CACHE_MAX_LISTS", "256")),
+    max_items=int(os.environ.get("CATALOG_CACHE_MAX_ITEMS", "4096")),
+    ttl=float(os.environ.get("CATALOG_CACHE_TTL", "300")),
+)
+
+def on_version_changed(name: str) -> None:
+    """Drop cached reads of a collection that another worker process wrote to"""
+    if name in ("products", "uploads"):
+        # Catalog bodies embed the image metadata of uploads (image_meta)
+        catalog_cache.clear()
+        if name == "uploads":
+            image_meta_lookup.forget_misses()
+        if name == "products":
+            product_search_index.schedule_rebuild(db)
+            price_map.schedule_rebuild(db)
+    elif name in ("reviews", "site_settings"):
+        catalog_cache.drop_lists("page")
+
+
+# Version counters behind the ETags of public read endpoints
+collection_versions = CollectionVersions(
+    db,
+    sync_interval=float(os.environ.get("ETAG_SYNC_INTERVAL", "2")),
+    on_change=on_version_changed,
+)
+
+# In-memory full-text index over the catalog, updated by product writes
+product_search_index = ProductSearchIndex()
+
 # Create uploads directory
 UPLOAD_DIR = ROOT_DIR / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
+# In-progress uploads are written here first (same filesystem -> atomic rename)
+UPLOAD_TMP_DIR = UPLOAD_DIR / ".tmp"
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE_MB", "25")) * 1024 * 1024
+# Content-addressed storage behind /api/uploads/<filename>, on local disk or S3
+upload_storage = create_storage(UPLOAD_DIR)
+# Size/colour/LQIP of uploads, attached to product and article responses
+image_meta_lookup = ImageMetaLookup(db)
+upload_store = UploadStore(db, upload_storage, UPLOAD_TMP_DIR, on_image_meta=image_meta_lookup.forget)
+# Derivatives and metadata are produced after the upload request returns
+upload_jobs = UploadJobQueue(db, upload_store, workers=int(os.environ.get("UPLOAD_JOB_WORKERS", "2")))
+# Disk LRU of on-demand resized images (/api/uploads/<filename>?w=&h=)
+transform_cache = TransformCache(
+    UPLOAD_DIR / ".cache" / "transforms",
+    max_bytes=int(os.environ.get("TRANSFORM_CACHE_MB", "512")) * 1024 * 1024
+)
+
+# Catalog prices used to price incoming orders, updated by product writes
+price_map = ProductPriceMap()
+
+# Responses of POST requests retried with the same Idempotency-Key
+idempotency_store = IdempotencyStore(db)
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -169,41 +243,131 @@ async def get_status_checks():
     return status_checks
 
 # ==================== FILE UPLOAD API ====================
-@api_router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}, "uploader": {"type": "string"}},
+        }}},
+    }
+}
+
+
+@api_router.post("/upload", openapi_extra=UPLOAD_FORM_SCHEMA)
+async def upload_file(request: Request):
     try:
+        # Parse the body as it streams in, so the size limit applies before it is spooled anywhere;
+        # identical content is stored only once
+        form = await receive_multipart_upload(request, UPLOAD_TMP_DIR, MAX_UPLOAD_SIZE)
+        received = form.upload
+        
         # Generate unique filename
-        file_extension = Path(file.filename).suffix
+        file_extension = Path(form.filename).suffix
         unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
         
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        upload_doc = await upload_store.save(received, unique_filename, form.filename, form.fields.get("uploader"))
+        
+        # Responsive WebP/AVIF sizes, dominant colour and LQIP are produced by
+        # the job queue; poll /api/uploads/jobs/{job_id} for the result
+        job = await upload_jobs.enqueue(upload_doc)
         
         # Return URL with /api prefix so it routes through our endpoint
         file_url = f"/api/uploads/{unique_filename}"
-        return {"url": file_url, "filename": unique_filename}
+        return {
+            "url": file_url,
+            "filename": unique_filename,
+            "size": received.size,
+            "sha256": received.sha256,
+            "width": upload_doc["width"],
+            "height": upload_doc["height"],
+            "job_id": job["id"],
+            "job_status": job["status"]
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
+@api_router.get("/uploads/jobs")
+async def get_upload_jobs(ids: str = Query(..., description="Comma-separated job ids")):
+    """Status of several upload processing jobs at once (bulk uploads)"""
+    job_ids = [job_id for job_id in ids.split(",") if job_id][:100]
+    return await upload_jobs.get(job_ids)
+
+@api_router.get("/uploads/jobs/{job_id}")
+async def get_upload_job(job_id: str):
+    """
+    Status of an upload processing job
+    
+    Returns status (queued/running/done/failed), progress (0..1), the
+    attempts so far, the last error and the result of every completed step.
+    """
+    jobs = await upload_jobs.get([job_id])
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs[0]
+
 @api_router.get("/uploads")
-async def get_uploaded_files():
-    """Get list of all uploaded files"""
+async def get_uploaded_files(
+    response: Response,
+    mime: str = Query("image/", description="Content type prefix, empty for all files"),
+    uploader: Optional[str] = None,
+    q: Optional[str] = Query(None, description="Substring of the original file name"),
+    quarantined: bool = Query(False, description="List uploads quarantined by the garbage collector instead"),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None
+):
+    """
+    List uploaded files from the `uploads` collection, newest first
+    
+    With `limit` the listing is keyset-paginated on (created_at, filename)
+    descending; the next page token is returned in X-Next-Cursor and the total
+    number of matching files in X-Total-Count. Files still lying directly in
+    the upload directory are listed once reconcile_uploads.py has indexed them.
+    Uploads quarantined by gc_uploads.py are only listed with quarantined=true.
+    """
     try:
-        files = []
-        if UPLOAD_DIR.exists():
-            for file_path in sorted(UPLOAD_DIR.iterdir(), key=lambda x: x.stat().st_mtime, reverse=True):
-                if file_path.is_file() and file_path.suffix.lower() in ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg']:
-                    stat = file_path.stat()
-                    files.append({
-                        "filename": file_path.name,
-                        "url": f"/api/uploads/{file_path.name}",
-                        "size": stat.st_size,
-                        "uploadedAt": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc).isoformat()
-                    })
-        return files
+        query = {"quarantined_at": {"$ne": None} if quarantined else None}
+        if mime:
+            query["content_type"] = {"$regex": f"^{re.escape(mime)}"}
+        if uploader:
+            query["uploader"] = uploader
+        if q:
+            query["original_name"] = {"$regex": re.escape(q), "$options": "i"}
+        
+        if limit is not None and not cursor:
+            response.headers["X-Total-Count"] = str(await db.uploads.count_documents(query))
+        
+        find = db.uploads.find(
+            keyset_query(query, cursor, tie_field="filename"), {"_id": 0}
+        ).sort(UPLOADS_KEYSET_SORT)
+        if limit is None:
+            docs = await find.to_list(length=None)
+        else:
+            docs = await find.limit(limit + 1).to_list(length=limit + 1)
+            if len(docs) > limit:
+                docs = docs[:limit]
+                response.headers["X-Next-Cursor"] = encode_cursor(docs[-1]["created_at"], docs[-1]["filename"])
+        
+        return [
+            {
+                "filename": doc["filename"],
+                "url": f"/api/uploads/{doc['filename']}",
+                "size": doc.get("size", 0),
+                "uploadedAt": doc.get("created_at"),
+                "content_type": doc.get("content_type"),
+                "width": doc.get("width"),
+                "height": doc.get("height"),
+                "sha256": doc.get("sha256"),
+                "original_name": doc.get("original_name"),
+                "uploader": doc.get("uploader"),
+            }
+            for doc in docs
+        ]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get files: {str(e)}")
 
@@ -211,19 +375,9 @@ async def get_uploaded_files():
 async def delete_uploaded_file(filename: str):
     """Delete an uploaded file"""
     try:
-        file_path = UPLOAD_DIR / filename
-        
-        # Check if file exists
-        if not file_path.exists():
+        if not await upload_store.delete(filename):
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Check if it's actually a file (not a directory)
-        if not file_path.is_file():
-            raise HTTPException(status_code=400, detail="Invalid file")
-        
-        # Delete the file
-        file_path.unlink()
-        
         return {"success": True, "message": f"File {filename} deleted successfully"}
     except HTTPException:
         raise
@@ -231,8 +385,18 @@ async def delete_uploaded_file(filename: str):
         raise HTTPException(status_code=500, detail=f"Failed to delete file: {str(e)}")
 
 # ==================== REVIEWS API ====================
+async def on_reviews_changed() -> None:
+    """Hook called by review write endpoints"""
+    await collection_versions.bump("reviews")
+    # Product pages embed the review summary
+    catalog_cache.drop_lists("page")
+
 @api_router.get("/reviews", response_model=List[Review])
-async def get_reviews():
+async def get_reviews(request: Request, response: Response):
+    not_modified = await collection_versions.check(request, response, "reviews")
+    if not_modified:
+        return not_modified
+    
     reviews = await db.reviews.find({}, {"_id": 0}).to_list(1000)
     for review in reviews:
         if isinstance(review.get('created_at'), str):
@@ -245,6 +409,7 @@ async def create_review(review: ReviewCreate):
     doc = review_obj.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     await db.reviews.insert_one(doc)
+    await on_reviews_changed()
     return review_obj
 
 @api_router.put("/reviews/{review_id}", response_model=Review)
@@ -262,6 +427,7 @@ async def update_review(review_id: str, review_update: ReviewUpdate):
     if not result:
         raise HTTPException(status_code=404, detail="Review not found")
     
+    await on_reviews_changed()
     result.pop('_id', None)
     if isinstance(result.get('created_at'), str):
         result['created_at'] = datetime.fromisoformat(result['created_at'])
@@ -272,16 +438,25 @@ async def delete_review(review_id: str):
     result = await db.reviews.delete_one({"id": review_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Review not found")
+    await on_reviews_changed()
     return {"message": "Review deleted successfully"}
 
 # ==================== SITE SETTINGS API ====================
 @api_router.get("/site-settings")
-async def get_site_settings():
+async def get_site_settings(request: Request, response: Response):
+    not_modified = await collection_versions.check(request, response, "site_settings")
+    if not_modified:
+        return not_modified
+    
     settings = await db.site_settings.find({}, {"_id": 0}).to_list(1000)
     return settings
 
 @api_router.get("/site-settings/{key}")
-async def get_site_setting(key: str):
+async def get_site_setting(key: str, request: Request, response: Response):
+    not_modified = await collection_versions.check(request, response, "site_settings")
+    if not_modified:
+        return not_modified
+    
     setting = await db.site_settings.find_one({"key": key}, {"_id": 0})
     if not setting:
         return {"key": key, "value": ""}
@@ -302,11 +477,17 @@ async def update_site_setting(setting: SiteSettingsUpdate):
         doc['updated_at'] = doc['updated_at'].isoformat()
         await db.site_settings.insert_one(doc)
     
+    await collection_versions.bump("site_settings")
+    catalog_cache.drop_lists("page")
     return {"message": "Setting updated successfully"}
 
 # ==================== LEGAL PAGES API ====================
 @api_router.get("/legal-pages/{page_type}")
-async def get_legal_page(page_type: str):
+async def get_legal_page(page_type: str, request: Request, response: Response):
+    not_modified = await collection_versions.check(request, response, "legal_pages")
+    if not_modified:
+        return not_modified
+    
     page = await db.legal_pages.find_one({"page_type": page_type}, {"_id": 0})
     if not page:
         # Return default content
@@ -340,16 +521,25 @@ async def update_legal_page(page_type: str, page_update: LegalPageUpdate):
         doc['updated_at'] = doc['updated_at'].isoformat()
         await db.legal_pages.insert_one(doc)
     
+    await collection_versions.bump("legal_pages")
     return {"message": "Legal page updated successfully"}
 
 @api_router.get("/legal-pages")
-async def get_all_legal_pages():
+async def get_all_legal_pages(request: Request, response: Response):
+    not_modified = await collection_versions.check(request, response, "legal_pages")
+    if not_modified:
+        return not_modified
+    
     pages = await db.legal_pages.find({}, {"_id": 0}).to_list(1000)
     return pages
 
 # ==================== HOCKEY CLUBS API ====================
 @api_router.get("/hockey-clubs", response_model=List[HockeyClub])
-async def get_hockey_clubs():
+async def get_hockey_clubs(request: Request, response: Response):
+    not_modified = await collection_versions.check(request, response, "hockey_clubs")
+    if not_modified:
+        return not_modified
+    
     clubs = await db.hockey_clubs.find({}, {"_id": 0}).sort("order", 1).to_list(1000)
     
     # Convert ISO string timestamps back to datetime objects
@@ -371,6 +561,7 @@ async def create_hockey_club(club_data: HockeyClubCreate):
     doc['updated_at'] = doc['updated_at'].isoformat()
     
     await db.hockey_clubs.insert_one(doc)
+    await collection_versions.bump("hockey_clubs")
     return club_obj
 
 @api_router.put("/hockey-clubs/{club_id}")
@@ -389,6 +580,7 @@ async def update_hockey_club(club_id: str, club_update: HockeyClubUpdate):
         {"$set": update_data}
     )
     
+    await collection_versions.bump("hockey_clubs")
     return {"message": "Hockey club updated successfully"}
 
 @api_router.delete("/hockey-clubs/{club_id}")
@@ -396,47 +588,108 @@ async def delete_hockey_club(club_id: str):
     result = await db.hockey_clubs.delete_one({"id": club_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Hockey club not found")
+    await collection_versions.bump("hockey_clubs")
     return {"message": "Hockey club deleted successfully"}
 
+UPLOAD_MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.avif': 'image/avif',
+    '.svg': 'image/svg+xml',
+}
+
+UPLOAD_CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, OPTIONS",
+    "Access-Control-Allow-Headers": "*",
+    "Cross-Origin-Resource-Policy": "cross-origin",
+}
+
+
+@api_router.get("/uploads/derived/{name}")
+async def serve_upload_derivative(name: str, request: Request):
+    """Serve a generated responsive derivative (WebP/AVIF)"""
+    media_type = UPLOAD_MIME_TYPES.get(Path(name).suffix.lower(), 'application/octet-stream')
+    # Derivative names embed the blob hash and width: the bytes never change
+    return await upload_storage.response(
+        request, upload_store.derived_key(name), media_type, f'"{name}"', UPLOAD_CORS_HEADERS
+    )
+
+
+def upload_etag(content_id: str, suffix: str = "") -> str:
+    return '"' + hashlib.sha1(content_id.encode("utf-8")).hexdigest()[:24] + suffix + '"'
+
+
 # Custom static files endpoint with CORS support - через API router
 @api_router.get("/uploads/{filename}")
-async def serve_upload(filename: str):
-    file_path = UPLOAD_DIR / filename
-    if not file_path.exists():
+async def serve_upload(
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, description="Target width in pixels"),
+    h: Optional[int] = Query(None, ge=1, description="Target height in pixels"),
+    fit: Optional[str] = Query(None, description="contain (default) or cover"),
+    fmt: Optional[str] = Query(None, description="webp, avif, jpeg or png"),
+):
+    """
+    Serve an upload with immutable caching, 304 revalidation and byte ranges
+    
+    SVGs are sent precompressed (br/gzip) when the client accepts it.
+    """
+    storage_key = await upload_store.resolve(filename)
+    if storage_key is None:
         raise HTTPException(status_code=404, detail="File not found")
+    content_id = upload_store.content_id(filename, storage_key)
     
-    # Determine MIME type based on extension
-    extension = file_path.suffix.lower()
-    mime_types = {
-        '.jpg': 'image/jpeg',
-        '.jpeg': 'image/jpeg',
-        '.png': 'image/png',
-        '.gif': 'image/gif',
-        '.webp': 'image/webp',
-        '.svg': 'image/svg+xml',
-    }
-    media_type = mime_types.get(extension, 'application/octet-stream')
+    # Resize/convert on demand; non-raster files (SVG) are always served as-is
+    spec = normalize_transform(filename, w, h, fit, fmt) if is_raster(filename) else None
+    if spec is not None:
+        key = spec.key(content_id)
+        
+        async def render(output: Path) -> int:
+            async with upload_store.local_copy(storage_key) as source:
+                return await transform_image(source, output, spec.width, spec.height, spec.fit, spec.fmt)
+        
+        try:
+            transformed = await transform_cache.get(key, spec.fmt, render)
+        except ImageTooLargeError:
+            raise HTTPException(status_code=422, detail="Image is too large to transform")
+        except Exception as e:
+            logger.error(f"Error transforming upload {filename}: {str(e)}")
+            raise HTTPException(status_code=500, detail="Image transform failed")
+        return immutable_file_response(
+            request, transformed, UPLOAD_MIME_TYPES[f".{spec.fmt}"], upload_etag(key), UPLOAD_CORS_HEADERS
+        )
     
-    return FileResponse(
-        file_path,
-        media_type=media_type,
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, OPTIONS",
-            "Access-Control-Allow-Headers": "*",
-            "Cross-Origin-Resource-Policy": "cross-origin",
-        }
-    )
+    # Determine MIME type based on the public filename (blobs have no extension)
+    extension = Path(filename).suffix.lower()
+    media_type = UPLOAD_MIME_TYPES.get(extension, 'application/octet-stream')
+    
+    headers = dict(UPLOAD_CORS_HEADERS)
+    etag = upload_etag(content_id)
+    if extension in PRECOMPRESSED_EXTENSIONS:
+        headers["Vary"] = "Accept-Encoding"
+        compressed = await upload_store.precompressed(filename, storage_key, request.headers.get("accept-encoding", ""))
+        if compressed is not None:
+            storage_key, encoding = compressed
+            headers["Content-Encoding"] = encoding
+            etag = upload_etag(content_id, f"-{encoding}")
+    
+    return await upload_storage.response(request, storage_key, media_type, etag, headers)
 
 # OPTIONS handler for CORS preflight
 @api_router.options("/uploads/{filename}")
 async def serve_upload_options(filename: str):
-    return {
-        "Allow": "GET, OPTIONS",
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Methods": "GET, OPTIONS",
-        "Access-Control-Allow-Headers": "*",
-    }
+    return Response(status_code=204, headers={
+        **UPLOAD_CORS_HEADERS,
+        "Allow": "GET, HEAD, OPTIONS",
+        "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
+        "Access-Control-Allow-Headers": "Range, If-None-Match, If-Modified-Since, If-Range",
+        "Access-Control-Expose-Headers": "Content-Length, Content-Range, Content-Encoding, ETag, Last-Modified",
+        "Access-Control-Max-Age": "86400",
+    })
 
 app.add_middleware(
     CORSMiddleware,
@@ -459,51 +712,277 @@ logger = logging.getLogger(__name__)
 # ORDERS API - New endpoints for order management and email notifications
 # ============================================================================
 
+async def price_order_items(order: OrderCreate) -> List[dict]:
+    """
+    Order items with catalog prices
+    
+    Items are resolved by product_id (or by name from older clients) against
+    the in-memory price map. Items of a custom team order carry a product_type
+    instead and are priced from QUOTE_PRODUCT_TYPES. Prices sent by the client
+    are never used.
+    
+    Raises:
+        HTTPException: 422 if an item matches no active product or product type
+    """
+    items = [item.model_dump() for item in order.items]
+    catalog_items = [item for item in items if not item.get("product_type")]
+    catalog_prices = iter(await price_map.resolve(db, catalog_items))
+    unknown = []
+    for item in items:
+        if item.get("product_type"):
+            product_type = QUOTE_PRODUCT_TYPES.get(item["product_type"])
+            if product_type is None:
+                unknown.append(item["product_name"])
+                continue
+            item.update(product_name=product_type["name"], product_id=None, variant_id=None,
+                        price=product_type["base_price"])
+            continue
+        price = next(catalog_prices)
+        if price is None:
+            unknown.append(item["product_name"])
+            continue
+        item.update(product_id=price.product_id, variant_id=price.variant_id, price=price.price)
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Товары не найдены в каталоге или недоступны: {', '.join(unknown)}"
+        )
+    return items
+
+
+@api_router.get("/orders/quote-types", response_model=dict)
+async def get_quote_product_types():
+    """Product types and base prices of custom team orders (the /order form)"""
+    return {
+        "product_types": [
+            {"id": type_id, "name": product_type["name"], "base_price": product_type["base_price"]}
+            for type_id, product_type in QUOTE_PRODUCT_TYPES.items()
+        ]
+    }
+
+
+# Order ids derived from Idempotency-Key values (uuid5 namespace)
+IDEMPOTENT_ORDER_NAMESPACE = uuid.UUID("5b0e6c2e-8f3a-4f6d-9a51-2d7c4b8e1f03")
+
+
 @api_router.post("/orders", response_model=dict, status_code=201)
-async def create_order(order: OrderCreate, background_tasks: BackgroundTasks):
+async def create_order(
+    order: OrderCreate,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """
     Create a new order and send confirmation email
+    
+    With an Idempotency-Key header, a retry of the same order (double click,
+    flaky connection) returns the original response with an
+    Idempotent-Replayed header instead of creating another order.
     """
+    if idempotency_key is not None:
+        fingerprint = request_fingerprint(order.model_dump(mode="json"))
+        replay = await idempotency_store.begin("orders", idempotency_key, fingerprint)
+        if replay is not None:
+            return json_response(
+                json_dumps(replay["body"]), status_code=replay["status_code"],
+                headers={"Idempotent-Replayed": "true"}
+            )
+    
+    inserted = False
     try:
-        # Create order object
+        # Price items from the catalog and recompute the total server-side
+        items = await price_order_items(order)
+        total_amount = round(sum(item["quantity"] * item["price"] for item in items), 2)
+        if abs(total_amount - order.total_amount) > 0.01:
+            logger.warning(f"Order total {order.total_amount} sent by the client recomputed as {total_amount}")
+        
+        # Create order object; with an idempotency key the order id is derived from
+        # the key and the request, so the unique id index rejects a second insert
+        # Custom team orders are quotes until a manager confirms the details
+        is_quote = any(item.get("product_type") for item in items)
         order_data = Order(
-            **order.model_dump(),
-            status="pending"
+            **{**order.model_dump(), "items": items, "total_amount": total_amount},
+            status="quote" if is_quote else "pending"
         )
+        if idempotency_key is not None:
+            order_data.id = str(uuid.uuid5(IDEMPOTENT_ORDER_NAMESPACE, f"{idempotency_key}:{fingerprint}"))
         
         # Convert to dict for MongoDB (serialize datetime)
         order_dict = order_data.model_dump()
         order_dict['created_at'] = order_dict['created_at'].isoformat()
         order_dict['updated_at'] = order_dict['updated_at'].isoformat()
+        if total_amount != order.total_amount:
+            order_dict['client_total_amount'] = order.total_amount
         
-        # Save to database
-        await db.orders.insert_one(order_dict)
+        # Save to database; from here on the idempotency key must not be released
+        try:
+            await db.orders.insert_one(order_dict)
+            created = True
+        except DuplicateKeyError:
+            if idempotency_key is None:
+                raise
+            # An earlier attempt with this key (whose response was never stored) created it
+            logger.warning(f"Order {order_data.id} already exists for its Idempotency-Key")
+            created = False
+        inserted = True
         
-        # Send order notifications in background (email to admin + telegram)
-        background_tasks.add_task(OrderEmailService.send_new_order_notification, order_data)
-        background_tasks.add_task(TelegramService.send_order_notification, order_data)
+        if created:
+            # Sales rollups are repairable with backfill_sales.py, so a failure must not fail the order
+            try:
+                await record_order(db, order_dict)
+            except Exception as e:
+                logger.error(f"Failed to add order {order_data.id} to sales rollups: {str(e)}")
+            
+            # Send order notifications in background (email to admin + telegram)
+            background_tasks.add_task(OrderEmailService.send_new_order_notification, order_data)
+            background_tasks.add_task(TelegramService.send_order_notification, order_data)
         
-        return {
+        result = {
             "success": True,
             "message": "Заказ создан успешно",
             "order_id": order_data.id
         }
+        if idempotency_key is not None:
+            try:
+                await idempotency_store.complete("orders", idempotency_key, 201, result)
+            except Exception as e:
+                # The key stays in progress: retries get 409, and once it is taken
+                # over the derived order id makes the insert a duplicate
+                logger.error(f"Failed to store the response of order {order_data.id} for replay: {str(e)}")
+        return result
+    except HTTPException:
+        if idempotency_key is not None and not inserted:
+            await idempotency_store.release("orders", idempotency_key)
+        raise
     except Exception as e:
         logger.error(f"Error creating order: {str(e)}")
+        if idempotency_key is not None and not inserted:
+            await idempotency_store.release("orders", idempotency_key)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+order_serializer = ModelSerializer(Order)
+order_summary_serializer = ModelSerializer(OrderSummary)
+
+# Table view of the admin order list: no items, address or notes
+ORDER_SUMMARY_PROJECTION = {"_id": 0, **{name: 1 for name in OrderSummary.model_fields}}
+
+
+def build_order_query(
+    status: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    email: Optional[str] = None,
+    phone: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+) -> dict:
+    """Build the find() filter for admin order listing parameters"""
+    query = {}
+    statuses = _split_values(status)
+    if statuses:
+        query['status'] = {"$in": statuses}
+    # created_at is stored as an ISO string, so date prefixes compare correctly
+    created_at = {}
+    if date_from:
+        created_at["$gte"] = date_from
+    if date_to:
+        created_at["$lt"] = date_to
+    if created_at:
+        query['created_at'] = created_at
+    if email:
+        query['customer_email'] = email.strip()
+    if phone:
+        query['customer_phone'] = phone.strip()
+    amount = {}
+    if min_amount is not None:
+        amount["$gte"] = min_amount
+    if max_amount is not None:
+        amount["$lt"] = max_amount
+    if amount:
+        query['total_amount'] = amount
+    return query
+
+
 @api_router.get("/orders", response_model=List[Order])
-async def get_orders(skip: int = 0, limit: int = 100):
-    """Get all orders (admin only in production)"""
+async def get_orders(
+    response: Response,
+    status: Optional[str] = None,
+    date_from: Optional[str] = Query(None, description="ISO date/time, inclusive"),
+    date_to: Optional[str] = Query(None, description="ISO date/time, exclusive"),
+    email: Optional[str] = None,
+    phone: Optional[str] = None,
+    min_amount: Optional[float] = Query(None, ge=0),
+    max_amount: Optional[float] = Query(None, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|table)$")
+):
+    """
+    Get orders, newest first (admin only in production)
+    
+    `status` accepts comma-separated values; `email` and `phone` match
+    exactly; `min_amount`/`max_amount` bound `total_amount` (inclusive lower,
+    exclusive upper bound). The listing is keyset-paginated on (created_at, id)
+    descending: the token for the next page is returned in X-Next-Cursor and
+    the total number of matching orders (first page only) in X-Total-Count.
+    `view=table` leaves out items, address and notes.
+    """
     try:
-        orders = await db.orders.find().skip(skip).limit(limit).to_list(length=limit)
-        return [Order(**order) for order in orders]
+        query = build_order_query(status, date_from, date_to, email, phone, min_amount, max_amount)
+        
+        if not cursor:
+            if query:
+                total = await db.orders.count_documents(query)
+            else:
+                total = await db.orders.estimated_document_count()
+            response.headers["X-Total-Count"] = str(total)
+        
+        projection = ORDER_SUMMARY_PROJECTION if view == "table" else {"_id": 0}
+        serializer = order_summary_serializer if view == "table" else order_serializer
+        orders = await db.orders.find(
+            keyset_query(query, cursor), projection
+        ).sort(KEYSET_SORT).limit(limit + 1).to_list(length=limit + 1)
+        
+        if len(orders) > limit:
+            orders = orders[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(orders[-1]["created_at"], orders[-1]["id"])
+        
+        return json_response(serializer.dumps(orders), dict(response.headers))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching orders: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@api_router.get("/orders/export")
+async def export_orders(
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    status: Optional[str] = None,
+    date_from: Optional[str] = Query(None, description="ISO date/time, inclusive"),
+    date_to: Optional[str] = Query(None, description="ISO date/time, exclusive")
+):
+    """
+    Stream orders as CSV or XLSX for accounting, one row per order item
+    
+    Filters match GET /orders; rows are ordered by creation time. Orders
+    are read from a cursor, so memory use does not grow with the export.
+    """
+    query = build_order_query(status, date_from, date_to)
+    cursor = db.orders.find(query, order_export.EXPORT_PROJECTION).sort([("created_at", 1), ("id", 1)])
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    if format == "xlsx":
+        body = order_export.export_xlsx(cursor)
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        body, media_type = order_export.export_csv(cursor), "text/csv; charset=utf-8"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="orders-{timestamp}.{format}"'}
+    )
+
+
 @api_router.get("/orders/{order_id}", response_model=Order)
 async def get_order(order_id: str):
     """Get order by ID"""
@@ -523,22 +1002,28 @@ async def get_order(order_id: str):
 async def update_order(order_id: str, order_update: OrderUpdate, background_tasks: BackgroundTasks):
     """Update order status and send notification email"""
     try:
-        order = await db.orders.find_one({"id": order_id})
-        if not order:
-            raise HTTPException(status_code=404, detail="Заказ не найден")
-        
-        old_status = order.get("status")
         update_data = {k: v for k, v in order_update.model_dump().items() if v is not None}
         update_data["updated_at"] = datetime.now().isoformat()
         
-        await db.orders.update_one(
+        # The document as it was replaced: concurrent updates each see their own old status
+        order = await db.orders.find_one_and_update(
             {"id": order_id},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
         )
+        if not order:
+            raise HTTPException(status_code=404, detail="Заказ не найден")
+        
+        old_status = order.get("status")
         
-        # If status changed, send email and telegram notifications
+        # If status changed, update sales rollups and send email and telegram notifications
         if "status" in update_data and update_data["status"] != old_status:
-            updated_order = await db.orders.find_one({"id": order_id})
+            updated_order = {**order, **update_data}
+            try:
+                await record_status_change(db, order, updated_order)
+            except Exception as e:
+                logger.error(f"Failed to move order {order_id} in sales rollups: {str(e)}")
             order_obj = Order(**updated_order)
             background_tasks.add_task(
                 EmailService.send_order_status_update,
@@ -564,16 +1049,52 @@ async def update_order(order_id: str, order_update: OrderUpdate, background_task
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@api_router.get("/analytics/sales", response_model=dict)
+async def get_sales_analytics(
+    date_from: Optional[str] = Query(None, alias="from", pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    date_to: Optional[str] = Query(None, alias="to", pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    granularity: str = Query("day", pattern=f"^({'|'.join(GRANULARITIES)})$"),
+    status: Optional[str] = Query(None, description="Comma-separated statuses (default: all but cancelled)")
+):
+    """
+    Sales report answered from the `daily_sales` rollups (see sales_rollups.py)
+    
+    `from` and `to` are inclusive days (default: the last 30 days). Returns a
+    series of orders/revenue/items per day, week (keyed by its Monday) or
+    month, plus totals per status, per size category and the top products.
+    """
+    try:
+        date_to = date_to or datetime.now().date().isoformat()
+        date_from = date_from or (datetime.fromisoformat(date_to) - timedelta(days=29)).date().isoformat()
+        if date_from > date_to:
+            raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+        
+        statuses = _split_values(status)
+        report = await sales_report(
+            db, date_from, date_to, granularity,
+            statuses=statuses, exclude_statuses=None if statuses else ["cancelled"]
+        )
+        return {"from": date_from, "to": date_to, "granularity": granularity, **report}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error building sales report: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ============================================================================
 # BLOG/ARTICLES API - For SEO content management
 # ============================================================================
 
+article_serializer = ModelSerializer(Article)
+
+
 @api_router.post("/articles", response_model=dict, status_code=201)
 async def create_article(article: ArticleCreate):
     """Create new blog article"""
     try:
         article_data = Article(**article.model_dump())
-        article_dict = article_data.model_dump()
+        article_dict = article_data.model_dump(exclude={"image_meta"})
         article_dict['created_at'] = article_dict['created_at'].isoformat()
         article_dict['updated_at'] = article_dict['updated_at'].isoformat()
         
@@ -604,8 +1125,9 @@ async def get_articles(
         if published_only:
             query["is_published"] = True
         
-        articles = await db.articles.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(length=limit)
-        return [Article(**article) for article in articles]
+        articles = await db.articles.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(length=limit)
+        await image_meta_lookup.attach(articles)
+        return json_response(article_serializer.dumps(articles))
     except Exception as e:
         logger.error(f"Error fetching articles: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -618,6 +1140,7 @@ async def get_article(article_id: str):
         article = await db.articles.find_one({"id": article_id})
         if not article:
             raise HTTPException(status_code=404, detail="Статья не найдена")
+        await image_meta_lookup.attach([article])
         return Article(**article)
     except HTTPException:
         raise
@@ -633,6 +1156,7 @@ async def get_article_by_slug(slug: str):
         article = await db.articles.find_one({"slug": slug})
         if not article:
             raise HTTPException(status_code=404, detail="Статья не найдена")
+        await image_meta_lookup.attach([article])
         return Article(**article)
     except HTTPException:
         raise
@@ -847,12 +1371,35 @@ async def generate_article_with_ai(request: AIGenerateRequest):
 # PRODUCTS API - CRUD endpoints for product management
 # ============================================================================
 
+async def on_products_changed(product_ids: List[str], categories: List[Optional[str]]) -> None:
+    """Hook called by every product write endpoint after the write succeeded"""
+    catalog_cache.invalidate_products(product_ids, categories)
+    await collection_versions.bump("products")
+    await product_search_index.refresh(db, product_ids)
+    await price_map.refresh(db, product_ids)
+
+
+async def on_catalog_replaced() -> None:
+    """Hook called after bulk changes where per-product invalidation is not worth it"""
+    catalog_cache.clear()
+    await collection_versions.bump("products")
+    await product_search_index.rebuild(db)
+    await price_map.rebuild(db)
+
+
+@api_router.get("/cache/stats", response_model=dict)
+async def get_cache_stats():
+    """Hit/miss counters of the in-process caches"""
+    return {"catalog": catalog_cache.stats(), "transforms": transform_cache.stats()}
+
+
 @api_router.post("/products", response_model=dict, status_code=201)
 async def create_product(product: ProductCreate):
     """Create a new product"""
     try:
         # Convert to dict and prepare for MongoDB
         product_dict = product.model_dump()
+        product_dict.update(normalize_product_images(product_dict))
         product_dict['id'] = str(uuid.uuid4())
         product_dict['created_at'] = datetime.now(timezone.utc).isoformat()
         product_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
@@ -864,6 +1411,8 @@ async def create_product(product: ProductCreate):
         
         logger.info(f"Product created with id: {product_dict['id']}")
         
+        await on_products_changed([product_dict['id']], [product_dict['category']])
+        
         return {
             "success": True,
             "message": "Товар успешно создан",
@@ -874,33 +1423,391 @@ async def create_product(product: ProductCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@api_router.get("/products", response_model=List[Product])
-async def get_products(category: Optional[str] = None, is_active: Optional[bool] = None):
-    """Get all products with optional filters"""
+# Read-path serializers (documents are trusted, see fast_json)
+product_serializer = ModelSerializer(Product)
+product_card_serializer = ModelSerializer(ProductCard)
+
+# Lightweight projection for catalog list views (no descriptions, specs or galleries)
+PRODUCT_CARD_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "name": 1,
+    "category": 1,
+    "description": 1,
+    "base_price": 1,
+    "images": {"$slice": 1},
+    "size_categories": 1,
+    "status": 1,
+    "is_featured": 1,
+    "is_active": 1,
+    "created_at": 1,
+}
+
+
+# Lower bounds of the base_price facet buckets; the last bucket is open-ended
+PRICE_BUCKET_BOUNDARIES = [0, 2000, 5000, 10000, 20000]
+
+
+def _split_values(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+
+def _price_filter(min_price: Optional[float], max_price: Optional[float]) -> dict:
+    price = {}
+    if min_price is not None:
+        price["$gte"] = min_price
+    if max_price is not None:
+        price["$lt"] = max_price
+    return {"base_price": price} if price else {}
+
+
+def build_product_query(
+    category: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    status: Optional[str] = None,
+    size: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None
+) -> dict:
+    """Build the find() filter for catalog listing parameters"""
+    query = {}
+    if category:
+        query['category'] = category
+    if is_active is not None:
+        query['is_active'] = is_active
+    statuses = _split_values(status)
+    if statuses:
+        query['status'] = {"$in": statuses}
+    sizes = _split_values(size)
+    if sizes:
+        query['size_categories'] = {"$in": sizes}
+    query.update(_price_filter(min_price, max_price))
+    return query
+
+
+@api_router.get("/products/facets", response_model=dict)
+async def get_product_facets(
+    request: Request,
+    response: Response,
+    category: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    status: Optional[str] = None,
+    size: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0)
+):
+    """
+    Facet counts for the catalog filters, computed in one $facet aggregation
+    
+    Each facet is counted with every filter applied except its own, so the UI
+    can show how many products each alternative value would yield.
+    """
     try:
-        # Build query
-        query = {}
-        if category:
-            query['category'] = category
-        if is_active is not None:
-            query['is_active'] = is_active
+        not_modified = await collection_versions.check(request, response, "products")
+        if not_modified:
+            return not_modified
+        
+        cache_key = ("facets", category, is_active, status, size, min_price, max_price)
+        cached = catalog_cache.get_list(cache_key)
+        if cached is not None:
+            return cached
+        generation = catalog_cache.generation
         
-        products = await db.products.find(query).to_list(length=None)
-        return [Product(**product) for product in products]
+        base = {"is_active": is_active} if is_active is not None else {}
+        filters = {
+            "category": {"category": category} if category else {},
+            "status": build_product_query(status=status),
+            "size": build_product_query(size=size),
+            "price": _price_filter(min_price, max_price),
+        }
+        
+        def match_except(facet: str) -> dict:
+            return {"$match": {k: v for name, f in filters.items() if name != facet for k, v in f.items()}}
+        
+        pipeline = [
+            {"$match": base},
+            {"$facet": {
+                "category": [match_except("category"), {"$sortByCount": "$category"}],
+                "status": [match_except("status"), {"$sortByCount": "$status"}],
+                "size": [
+                    match_except("size"),
+                    {"$unwind": "$size_categories"},
+                    {"$sortByCount": "$size_categories"},
+                ],
+                "price": [
+                    match_except("price"),
+                    {"$bucket": {
+                        "groupBy": "$base_price",
+                        # An infinite last boundary closes the open-ended bucket, so only
+                        # products without a usable price fall into the default
+                        "boundaries": PRICE_BUCKET_BOUNDARIES + [float("inf")],
+                        "default": "unknown",
+                        "output": {"count": {"$sum": 1}},
+                    }},
+                ],
+                "total": [match_except(""), {"$count": "count"}],
+            }},
+        ]
+        result = (await db.products.aggregate(pipeline).to_list(length=1))[0]
+        
+        price_buckets = []
+        price_unknown = 0
+        for bucket in result["price"]:
+            if bucket["_id"] == "unknown":
+                price_unknown = bucket["count"]
+                continue
+            upper_index = PRICE_BUCKET_BOUNDARIES.index(bucket["_id"]) + 1
+            upper = PRICE_BUCKET_BOUNDARIES[upper_index] if upper_index < len(PRICE_BUCKET_BOUNDARIES) else None
+            price_buckets.append({"min": bucket["_id"], "max": upper, "count": bucket["count"]})
+        
+        facets = {
+            "total": result["total"][0]["count"] if result["total"] else 0,
+            "category": {b["_id"]: b["count"] for b in result["category"] if b["_id"] is not None},
+            "status": {b["_id"]: b["count"] for b in result["status"] if b["_id"] is not None},
+            "size": {b["_id"]: b["count"] for b in result["size"] if b["_id"] is not None},
+            "price": price_buckets,
+            # Products whose base_price is missing, not a number or negative
+            "price_unknown": price_unknown,
+        }
+        # The category facet ignores the category filter, so any write can change it
+        catalog_cache.set_list(cache_key, facets, None, (), generation)
+        return facets
+    except Exception as e:
+        logger.error(f"Error computing product facets: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.get("/products")
+async def get_products(
+    request: Request,
+    response: Response,
+    category: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    status: Optional[str] = None,
+    size: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|card)$")
+):
+    """
+    Get products with optional filters
+    
+    `status` and `size` accept comma-separated values; `min_price`/`max_price`
+    bound `base_price` (inclusive lower, exclusive upper bound).
+    Without `limit` the whole matching catalog is returned (legacy behaviour).
+    With `limit` the listing is keyset-paginated on (created_at, id) descending;
+    the token for the next page is returned in the X-Next-Cursor header and the
+    total number of matching products in X-Total-Count.
+    `view=card` returns lightweight ProductCard objects for list views.
+    """
+    try:
+        not_modified = await collection_versions.check(request, response, "products", "uploads")
+        if not_modified:
+            return not_modified
+        
+        query = build_product_query(category, is_active, status, size, min_price, max_price)
+        
+        cache_key = ("products", category, is_active, status, size, min_price, max_price, limit, cursor, view)
+        cached = catalog_cache.get_list(cache_key)
+        if cached is not None:
+            body, headers = cached
+            return json_response(body, {**response.headers, **headers})
+        generation = catalog_cache.generation
+        
+        projection = PRODUCT_CARD_PROJECTION if view == "card" else {"_id": 0}
+        serializer = product_card_serializer if view == "card" else product_serializer
+        headers = {}
+        
+        if limit is None:
+            products = await db.products.find(query, projection).to_list(length=None)
+        else:
+            # Count only on the first page; later pages reuse the client's total
+            if not cursor:
+                if query:
+                    total = await db.products.count_documents(query)
+                else:
+                    total = await db.products.estimated_document_count()
+                headers["X-Total-Count"] = str(total)
+            
+            products = await db.products.find(
+                keyset_query(query, cursor), projection
+            ).sort(KEYSET_SORT).limit(limit + 1).to_list(length=limit + 1)
+            
+            if len(products) > limit:
+                products = products[:limit]
+                last = products[-1]
+                headers["X-Next-Cursor"] = encode_cursor(last.get("created_at"), last["id"])
+        
+        await image_meta_lookup.attach(products)
+        body = serializer.dumps(products)
+        catalog_cache.set_list(cache_key, (body, headers), category, (p.get("id") for p in products), generation)
+        return json_response(body, {**response.headers, **headers})
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching products: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@api_router.get("/products/export")
+async def export_products(format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    """Stream the whole catalog as NDJSON or CSV straight from a cursor"""
+    cursor = db.products.find({}, product_io.EXPORT_PROJECTION).sort("created_at", 1)
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    if format == "csv":
+        body, media_type = product_io.export_csv(cursor), "text/csv; charset=utf-8"
+    else:
+        body, media_type = product_io.export_ndjson(cursor), "application/x-ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="products-{timestamp}.{format}"'}
+    )
+
+
+# Rows per bulk_write round trip during import
+IMPORT_BATCH_SIZE = 500
+# Row errors returned in the import report (the count is always exact)
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
+
+@api_router.post("/products/import", response_model=dict)
+async def import_products(file: UploadFile = File(...), format: Optional[str] = Query(None, pattern="^(ndjson|csv)$")):
+    """
+    Upsert products from an NDJSON or CSV file (as produced by /products/export)
+    
+    Rows are parsed incrementally and written with batched bulk_write keyed
+    on `id`; rows without an id create new products. Columns missing from a
+    row keep their stored values. Invalid rows are skipped and reported with
+    their line number.
+    """
+    try:
+        if format is None:
+            format = "csv" if (file.filename or "").lower().endswith(".csv") else "ndjson"
+        rows = product_io.iter_csv_rows(file.file) if format == "csv" else product_io.iter_ndjson_rows(file.file)
+        
+        errors = []
+        error_count = 0
+        upserted = modified = 0
+        # (row number, product id, fields to $set, defaults to $setOnInsert)
+        batch = []
+        
+        def report(row_number: int, message: str) -> None:
+            nonlocal error_count
+            error_count += 1
+            if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                errors.append({"row": row_number, "error": message})
+        
+        async def flush() -> None:
+            nonlocal upserted, modified
+            if not batch:
+                return
+            # Rows changing only some image fields are normalized together with the stored ones
+            touched = [product_id for _, product_id, fields, _ in batch if any(f in fields for f in IMAGE_FIELDS)]
+            current = {}
+            if touched:
+                async for doc in db.products.find(
+                    {"id": {"$in": touched}}, {"_id": 0, "id": 1, **{field: 1 for field in IMAGE_FIELDS}}
+                ):
+                    current[doc.pop("id")] = doc
+            
+            operations = []
+            for _, product_id, fields, defaults in batch:
+                if any(field in fields for field in IMAGE_FIELDS):
+                    images = {field: defaults.get(field) for field in IMAGE_FIELDS}
+                    images.update(current.get(product_id, {}))
+                    images.update({k: v for k, v in fields.items() if k in IMAGE_FIELDS})
+                    fields.update(normalize_product_images(images))
+                    defaults = {k: v for k, v in defaults.items() if k not in fields}
+                else:
+                    defaults.update(normalize_product_images(defaults))
+                fields["updated_at"] = now
+                operations.append(UpdateOne(
+                    {"id": product_id},
+                    {"$set": fields, "$setOnInsert": {**defaults, "created_at": now}},
+                    upsert=True
+                ))
+            try:
+                result = await db.products.bulk_write(operations, ordered=False)
+                upserted += result.upserted_count
+                modified += result.modified_count
+            except BulkWriteError as e:
+                details = e.details
+                upserted += details.get("nUpserted", 0)
+                modified += details.get("nModified", 0)
+                for write_error in details.get("writeErrors", []):
+                    report(batch[write_error["index"]][0], write_error.get("errmsg", "Write failed"))
+            batch.clear()
+        
+        now = datetime.now(timezone.utc).isoformat()
+        while True:
+            # Reading and validating rows is CPU-bound: keep it off the event loop
+            parsed = await asyncio.to_thread(product_io.parse_rows, rows, IMPORT_BATCH_SIZE)
+            if not parsed:
+                break
+            for row_number, result in parsed:
+                if isinstance(result, ValueError):
+                    report(row_number, str(result))
+                    continue
+                batch.append((row_number, *result))
+            await flush()
+        
+        if upserted or modified:
+            await on_catalog_replaced()
+        
+        logger.info(f"Product import: {upserted} created, {modified} updated, {error_count} errors")
+        
+        return {
+            "success": error_count == 0,
+            "created": upserted,
+            "updated": modified,
+            "error_count": error_count,
+            "errors": errors
+        }
+    except Exception as e:
+        logger.error(f"Error importing products: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.get("/products/search")
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=50),
+    prefix: bool = True,
+    include_inactive: bool = False
+):
+    """
+    Full-text product search over name, description, features and specifications
+    
+    Understands Russian word forms and Latin transliteration; with `prefix`
+    the last word is matched as a prefix for typeahead. Served entirely from
+    the in-memory index.
+    """
+    return product_search_index.search(q, limit=limit, prefix=prefix, include_inactive=include_inactive)
+
+
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
+async def get_product(product_id: str, request: Request, response: Response):
     """Get a single product by ID"""
     try:
-        product = await db.products.find_one({"id": product_id})
-        if not product:
-            raise HTTPException(status_code=404, detail="Товар не найден")
+        not_modified = await collection_versions.check(request, response, "products", "uploads")
+        if not_modified:
+            return not_modified
+        
+        body = catalog_cache.get_item(product_id)
+        if body is None:
+            generation = catalog_cache.generation
+            product = await db.products.find_one({"id": product_id}, {"_id": 0})
+            if not product:
+                raise HTTPException(status_code=404, detail="Товар не найден")
+            
+            await image_meta_lookup.attach([product])
+            body = product_serializer.dumps(product, many=False)
+            catalog_cache.set_item(product_id, body, generation)
         
-        return Product(**product)
+        return json_response(body, dict(response.headers))
     except HTTPException:
         raise
     except Exception as e:
@@ -908,6 +1815,101 @@ async def get_product(product_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Same-category products shown on a product page
+RELATED_PRODUCTS_LIMIT = 4
+# Latest reviews embedded in the product page summary
+PAGE_REVIEWS_LIMIT = 3
+
+
+@api_router.get("/products/{product_id}/page")
+async def get_product_page(product_id: str, request: Request, response: Response):
+    """
+    Everything the product page needs in one response
+    
+    Product with related products (one $lookup aggregation), review summary
+    and site settings are fetched concurrently; the assembled payload is
+    cached until the product, its category, reviews or settings change.
+    """
+    try:
+        not_modified = await collection_versions.check(request, response, "products", "uploads", "reviews", "site_settings")
+        if not_modified:
+            return not_modified
+        
+        cache_key = ("page", product_id)
+        cached = catalog_cache.get_list(cache_key)
+        if cached is not None:
+            return json_response(cached, dict(response.headers))
+        generation = catalog_cache.generation
+        
+        related_projection = {k: v for k, v in PRODUCT_CARD_PROJECTION.items() if k != "_id"}
+        product_pipeline = [
+            {"$match": {"id": product_id}},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": "products",
+                "let": {"category": "$category", "product_id": "$id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$and": [
+                        {"$eq": ["$category", "$$category"]},
+                        {"$eq": ["$is_active", True]},
+                        {"$ne": ["$id", "$$product_id"]},
+                    ]}}},
+                    {"$sort": {"created_at": -1, "id": -1}},
+                    {"$limit": RELATED_PRODUCTS_LIMIT},
+                    {"$project": {"_id": 0, **related_projection}},
+                ],
+                "as": "related",
+            }},
+            {"$project": {"_id": 0}},
+        ]
+        reviews_pipeline = [
+            {"$facet": {
+                "stats": [{"$group": {"_id": None, "count": {"$sum": 1}, "average": {"$avg": "$rating"}}}],
+                "latest": [
+                    {"$sort": {"created_at": -1}},
+                    {"$limit": PAGE_REVIEWS_LIMIT},
+                    {"$project": {"_id": 0}},
+                ],
+            }},
+        ]
+        
+        products, reviews, settings = await asyncio.gather(
+            db.products.aggregate(product_pipeline).to_list(length=1),
+            db.reviews.aggregate(reviews_pipeline).to_list(length=1),
+            db.site_settings.find({}, {"_id": 0, "key": 1, "value": 1}).to_list(length=1000),
+        )
+        
+        if not products:
+            raise HTTPException(status_code=404, detail="Товар не найден")
+        
+        product = products[0]
+        related = product.pop("related", [])
+        review_stats = reviews[0]["stats"][0] if reviews and reviews[0]["stats"] else {"count": 0, "average": None}
+        await image_meta_lookup.attach([product] + related)
+        
+        body = json_dumps({
+            "product": product_serializer.prepare(product),
+            "related": [product_card_serializer.prepare(p) for p in related],
+            "reviews": {
+                "count": review_stats["count"],
+                "average_rating": round(review_stats["average"], 2) if review_stats["average"] is not None else None,
+                "latest": reviews[0]["latest"] if reviews else [],
+            },
+            "site_settings": {s["key"]: s.get("value") for s in settings if "key" in s},
+        })
+        
+        catalog_cache.set_list(
+            cache_key, body, product.get("category"), [product_id] + [p["id"] for p in related if "id" in p],
+            generation
+        )
+        return json_response(body, dict(response.headers))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching product page: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @api_router.put("/products/{product_id}", response_model=dict)
 async def update_product(product_id: str, product_update: ProductUpdate):
     """Update a product"""
@@ -922,6 +1924,17 @@ async def update_product(product_id: str, product_update: ProductUpdate):
         if not update_data:
             raise HTTPException(status_code=400, detail="No fields to update")
         
+        # Any change to an image field rebuilds the stored image index
+        if any(field in update_data for field in IMAGE_FIELDS):
+            current = await db.products.find_one(
+                {"id": product_id},
+                {"_id": 0, **{field: 1 for field in IMAGE_FIELDS}}
+            )
+            if not current:
+                raise HTTPException(status_code=404, detail="Товар не найден")
+            current.update({k: v for k, v in update_data.items() if k in IMAGE_FIELDS})
+            update_data.update(normalize_product_images(current))
+        
         update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
         
         logger.info(f"Updating product {product_id} with fields: {list(update_data.keys())}")
@@ -929,14 +1942,18 @@ async def update_product(product_id: str, product_update: ProductUpdate):
         logger.info(f"Variants: {len(update_data.get('variants', []))}, Detailed description length: {len(update_data.get('detailed_description', ''))}, Main features: {len(update_data.get('main_features', []))}, Specifications: {len(update_data.get('specifications', {}))}")
         logger.info(f"Full update data: {update_data}")
         
-        result = await db.products.update_one(
+        # Fetch the previous category in the same round trip for cache invalidation
+        previous = await db.products.find_one_and_update(
             {"id": product_id},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={"_id": 0, "category": 1}
         )
         
-        if result.matched_count == 0:
+        if not previous:
             raise HTTPException(status_code=404, detail="Товар не найден")
         
+        await on_products_changed([product_id], [previous.get('category'), update_data.get('category')])
+        
         logger.info(f"Product {product_id} updated successfully")
         
         return {
@@ -954,11 +1971,16 @@ async def update_product(product_id: str, product_update: ProductUpdate):
 async def delete_product(product_id: str):
     """Delete a product"""
     try:
-        result = await db.products.delete_one({"id": product_id})
+        deleted = await db.products.find_one_and_delete(
+            {"id": product_id},
+            projection={"_id": 0, "category": 1}
+        )
         
-        if result.deleted_count == 0:
+        if not deleted:
             raise HTTPException(status_code=404, detail="Товар не найден")
         
+        await on_products_changed([product_id], [deleted.get('category')])
+        
         logger.info(f"Product {product_id} deleted")
         
         return {
@@ -981,8 +2003,11 @@ class BulkActionRequest(BaseModel):
 async def bulk_action_products(request: BulkActionRequest):
     """Bulk actions on products"""
     try:
+        categories = await db.products.distinct("category", {"id": {"$in": request.product_ids}})
+        
         if request.action == "delete":
             result = await db.products.delete_many({"id": {"$in": request.product_ids}})
+            await on_products_changed(request.product_ids, categories)
             logger.info(f"Deleted {result.deleted_count} products")
             return {
                 "success": True,
@@ -1006,6 +2031,7 @@ async def bulk_action_products(request: BulkActionRequest):
                     {"id": {"$in": request.product_ids}},
                     {"$set": update_data}
                 )
+                await on_products_changed(request.product_ids, categories)
                 logger.info(f"Updated {result.modified_count} products to {request.action}")
                 return {
                     "success": True,
@@ -1071,6 +2097,36 @@ app.include_router(api_router)
 # APPLICATION LIFECYCLE EVENTS
 # ============================================================================
 
+@app.on_event("startup")
+async def create_db_indexes():
+    await ensure_indexes(db)
+
+
+@app.on_event("startup")
+async def build_search_index():
+    await product_search_index.rebuild(db)
+
+
+@app.on_event("startup")
+async def build_price_map():
+    await price_map.rebuild(db)
+
+
+@app.on_event("startup")
+async def start_upload_workers():
+    upload_jobs.start()
+
+
+@app.on_event("shutdown")
+async def stop_upload_workers():
+    await upload_jobs.stop()
+
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+
+@app.on_event("shutdown")
+async def shutdown_image_workers():
+    shutdown_executor()
@@ -0,0 +1,292 @@
+"""
+Object storage behind uploads: the local filesystem or an S3-compatible service
+
+The driver is selected with STORAGE_BACKEND=local|s3. Objects are addressed
+by relative keys ("blobs/ab/<sha256>", "derived/<name>"); the local driver
+maps them under uploads/, the S3 driver under S3_PREFIX in S3_BUCKET.
+S3_ENDPOINT_URL points the S3 driver at MinIO or any other S3-compatible
+server, so several app nodes can share one store. Image processing needs
+files on disk; local_copy() provides one for either driver.
+
+S3 settings:
+    S3_BUCKET, S3_PREFIX (default "uploads"), S3_ENDPOINT_URL, S3_REGION,
+    S3_SERVE_MODE = redirect (default) | proxy,
+    S3_PUBLIC_URL (redirect to a public bucket/CDN URL instead of presigning),
+    S3_PRESIGN_TTL (seconds, default 3600)
+Credentials come from the usual AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY.
+"""
+import os
+import shutil
+import asyncio
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, Optional
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
+from http_cache import IMMUTABLE_CACHE_CONTROL, immutable_file_response, not_modified
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class Storage(ABC):
+    """Interface shared by the storage drivers"""
+
+    @abstractmethod
+    async def put_file(self, key: str, source: Path, content_type: str,
+                       content_encoding: Optional[str] = None) -> None:
+        """Store a local file under `key`; the local file is consumed"""
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        """Whether an object is stored under `key`"""
+
+    @abstractmethod
+    async def delete(self, keys: Iterable[str]) -> None:
+        """Delete objects; missing keys are ignored"""
+
+    @abstractmethod
+    async def download(self, key: str, destination: Path) -> None:
+        """Copy an object's bytes to a local file"""
+
+    @abstractmethod
+    def iter_keys(self, prefix: str) -> AsyncIterator[str]:
+        """Every stored key starting with `prefix`"""
+
+    @abstractmethod
+    async def response(self, request: Request, key: str, media_type: str, etag: str,
+                       headers: Dict[str, str]) -> Response:
+        """
+        HTTP response serving an immutable object
+
+        Raises:
+            HTTPException: 404 if the object does not exist
+        """
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Path of the object on this machine, if the driver stores it locally"""
+        return None
+
+    @asynccontextmanager
+    async def local_copy(self, key: str, temp_dir: Path) -> AsyncIterator[Path]:
+        """A readable local file with the object's bytes, for image processing"""
+        path = self.local_path(key)
+        if path is not None:
+            yield path
+            return
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = temp_dir / f"{uuid.uuid4()}.download"
+        try:
+            await self.download(key, temp_path)
+            yield temp_path
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+
+class LocalStorage(Storage):
+    """Objects are files under a root directory (the historical layout)"""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def local_path(self, key: str) -> Path:
+        return self.root / key
+
+    async def put_file(self, key: str, source: Path, content_type: str,
+                       content_encoding: Optional[str] = None) -> None:
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, path)
+
+    async def exists(self, key: str) -> bool:
+        return (self.root / key).is_file()
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            (self.root / key).unlink(missing_ok=True)
+
+    async def download(self, key: str, destination: Path) -> None:
+        await asyncio.to_thread(shutil.copyfile, self.root / key, destination)
+
+    async def iter_keys(self, prefix: str) -> AsyncIterator[str]:
+        base = self.root / prefix.rsplit("/", 1)[0] if "/" in prefix else self.root
+        if not base.is_dir():
+            return
+        for path in base.rglob("*"):
+            key = path.relative_to(self.root).as_posix()
+            if key.startswith(prefix) and path.is_file() and not path.name.endswith(".part"):
+                yield key
+
+    async def response(self, request: Request, key: str, media_type: str, etag: str,
+                       headers: Dict[str, str]) -> Response:
+        path = self.root / key
+        if not path.is_file():
+            raise HTTPException(status_code=404, detail="File not found")
+        return immutable_file_response(request, path, media_type, etag, headers)
+
+
+class S3Storage(Storage):
+    """Objects in an S3 bucket (AWS, MinIO, Yandex Object Storage, ...)"""
+
+    def __init__(self, bucket: str, prefix: str = "uploads", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, serve_mode: str = "redirect",
+                 public_url: Optional[str] = None, presign_ttl: int = 3600):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.serve_mode = serve_mode
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.presign_ttl = presign_ttl
+        # Path-style addressing works with MinIO and other self-hosted servers
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path" if endpoint_url else "auto"}),
+        )
+        # Files above 8 MB are sent as multipart uploads, 4 parts at a time
+        self.transfer_config = TransferConfig(
+            multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024, max_concurrency=4
+        )
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    @staticmethod
+    def _is_missing(error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    async def put_file(self, key: str, source: Path, content_type: str,
+                       content_encoding: Optional[str] = None) -> None:
+        extra = {"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL}
+        if content_encoding:
+            extra["ContentEncoding"] = content_encoding
+        await asyncio.to_thread(
+            self.client.upload_file, str(source), self.bucket, self._key(key),
+            ExtraArgs=extra, Config=self.transfer_config
+        )
+        source.unlink(missing_ok=True)
+
+    async def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if self._is_missing(e):
+                return False
+            raise
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        objects = [{"Key": self._key(key)} for key in keys]
+        # DeleteObjects accepts at most 1000 keys per request
+        for start in range(0, len(objects), 1000):
+            await asyncio.to_thread(
+                self.client.delete_objects,
+                Bucket=self.bucket, Delete={"Objects": objects[start:start + 1000], "Quiet": True}
+            )
+
+    async def download(self, key: str, destination: Path) -> None:
+        await asyncio.to_thread(
+            self.client.download_file, self.bucket, self._key(key), str(destination), Config=self.transfer_config
+        )
+
+    async def iter_keys(self, prefix: str) -> AsyncIterator[str]:
+        kwargs = {"Bucket": self.bucket, "Prefix": self._key(prefix)}
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        while True:
+            page = await asyncio.to_thread(self.client.list_objects_v2, **kwargs)
+            for item in page.get("Contents", []):
+                yield item["Key"][strip:]
+            if not page.get("IsTruncated"):
+                return
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+    async def response(self, request: Request, key: str, media_type: str, etag: str,
+                       headers: Dict[str, str]) -> Response:
+        headers = {**headers, "ETag": etag}
+        if not_modified(request, etag):
+            return Response(status_code=304, headers={**headers, "Cache-Control": IMMUTABLE_CACHE_CONTROL})
+        if self.serve_mode == "proxy":
+            return await self._proxy(request, key, media_type, headers)
+
+        if self.public_url:
+            url = f"{self.public_url}/{self._key(key)}"
+            cache_control = "public, max-age=86400"
+        else:
+            url = await asyncio.to_thread(
+                self.client.generate_presigned_url, "get_object",
+                Params={"Bucket": self.bucket, "Key": self._key(key), "ResponseContentType": media_type},
+                ExpiresIn=self.presign_ttl
+            )
+            # The redirect must expire well before its signature does
+            cache_control = f"public, max-age={self.presign_ttl // 2}"
+        return RedirectResponse(url, status_code=302, headers={**headers, "Cache-Control": cache_control})
+
+    async def _proxy(self, request: Request, key: str, media_type: str, headers: Dict[str, str]) -> Response:
+        from botocore.exceptions import ClientError
+
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        byte_range = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if byte_range and (not if_range or if_range == headers["ETag"]):
+            params["Range"] = byte_range
+        try:
+            obj = await asyncio.to_thread(self.client.get_object, **params)
+        except ClientError as e:
+            if self._is_missing(e):
+                raise HTTPException(status_code=404, detail="File not found")
+            if e.response.get("Error", {}).get("Code") == "InvalidRange":
+                raise HTTPException(status_code=416, detail="Requested range not satisfiable")
+            raise
+
+        headers = {
+            **headers,
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(obj["ContentLength"]),
+        }
+        if obj.get("LastModified"):
+            headers["Last-Modified"] = obj["LastModified"].strftime("%a, %d %b %Y %H:%M:%S GMT")
+        if obj.get("ContentRange"):
+            headers["Content-Range"] = obj["ContentRange"]
+
+        async def body():
+            stream = obj["Body"]
+            try:
+                while True:
+                    chunk = await asyncio.to_thread(stream.read, STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                stream.close()
+
+        status_code = 206 if obj.get("ContentRange") else 200
+        return StreamingResponse(body(), status_code=status_code, media_type=media_type, headers=headers)
+
+
+def create_storage(upload_dir: Path) -> Storage:
+    """Storage driver configured by the STORAGE_BACKEND environment variable"""
+    backend = os.environ.get("STORAGE_BACKEND", "local").lower()
+    if backend == "local":
+        return LocalStorage(upload_dir)
+    if backend == "s3":
+        return S3Storage(
+            bucket=os.environ["S3_BUCKET"],
+            prefix=os.environ.get("S3_PREFIX", "uploads"),
+            endpoint_url=os.environ.get("S3_ENDPOINT_URL") or None,
+            region=os.environ.get("S3_REGION") or None,
+            serve_mode=os.environ.get("S3_SERVE_MODE", "redirect"),
+            public_url=os.environ.get("S3_PUBLIC_URL") or None,
+            presign_ttl=int(os.environ.get("S3_PRESIGN_TTL", "3600")),
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
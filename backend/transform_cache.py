@@ -0,0 +1,216 @@
+"""
+On-demand image transforms (/api/uploads/<filename>?w=&h=&fit=&fmt=)
+
+Transform parameters are normalized first, so equivalent requests (w=640
+vs w=0640, fit given for a single dimension, fmt omitted vs fmt equal to
+the source format) share one cache entry. Rendered files live under
+uploads/.cache/transforms/ in a disk LRU bounded by total size. Hits refresh
+the file mtime, so the directory itself is the shared state of all worker
+processes: each worker's index is rebuilt from file mtimes on startup and
+every RESCAN_INTERVAL seconds (so the size bound holds for the directory as
+a whole, not per worker), a file rendered by another worker is a hit, and
+eviction spares files used within EVICT_GRACE seconds, which a response may
+still be about to open. Concurrent requests for a transform that is still
+being rendered in this process await the same future instead of rendering
+it again.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# Largest width/height a client may request; larger values are clamped
+TRANSFORM_MAX_DIMENSION = 2560
+TRANSFORM_FITS = ("contain", "cover")
+TRANSFORM_FORMATS = ("webp", "avif", "jpeg", "png")
+
+# Seconds between rescans of the cache directory (other workers add and evict files)
+RESCAN_INTERVAL = 60
+# Files used more recently than this are never evicted
+EVICT_GRACE = 60
+# Partial renders older than this were left behind by a crashed render
+STALE_PART_AGE = 600
+
+# Source extension -> output format used when fmt is omitted
+_SOURCE_FORMATS = {'.jpg': 'jpeg', '.jpeg': 'jpeg', '.png': 'png', '.webp': 'webp'}
+
+
+@dataclass(frozen=True)
+class TransformSpec:
+    """A normalized transform request"""
+    width: Optional[int]
+    height: Optional[int]
+    fit: str
+    fmt: str
+
+    def key(self, content_id: str) -> str:
+        """Canonical cache key of this transform applied to one content"""
+        return f"{content_id}|{self.width or ''}x{self.height or ''}|{self.fit}|{self.fmt}"
+
+
+def normalize_transform(filename: str, w: Optional[int], h: Optional[int],
+                        fit: Optional[str], fmt: Optional[str]) -> Optional[TransformSpec]:
+    """
+    Validate and canonicalize transform query parameters
+
+    Returns:
+        TransformSpec, or None when no transform was requested
+
+    Raises:
+        HTTPException: 400 for an unknown fit or format
+    """
+    if not w and not h and not fmt:
+        return None
+
+    fit = (fit or "contain").lower()
+    if fit not in TRANSFORM_FITS:
+        raise HTTPException(status_code=400, detail=f"fit must be one of: {', '.join(TRANSFORM_FITS)}")
+    fmt = (fmt or _SOURCE_FORMATS.get(Path(filename).suffix.lower(), "webp")).lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in TRANSFORM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"fmt must be one of: {', '.join(TRANSFORM_FORMATS)}")
+
+    width = min(w, TRANSFORM_MAX_DIMENSION) if w else None
+    height = min(h, TRANSFORM_MAX_DIMENSION) if h else None
+    if not (width and height):
+        # Cropping needs both dimensions; with one of them, cover == contain
+        fit = "contain"
+    return TransformSpec(width=width, height=height, fit=fit, fmt=fmt)
+
+
+class TransformCache:
+    """Size-bounded disk LRU of rendered transforms with render coalescing"""
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # file name -> size, least recently used first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._scanned_at: Optional[float] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats_counters: Dict[str, int] = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        """(mtime, file name, size) of every rendered file, oldest first (blocking)"""
+        if not self.cache_dir.is_dir():
+            return []
+        files = []
+        now = time.time()
+        for path in self.cache_dir.iterdir():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.suffix == ".part":
+                if now - stat.st_mtime > STALE_PART_AGE:
+                    path.unlink(missing_ok=True)
+            elif path.is_file():
+                files.append((stat.st_mtime, path.name, stat.st_size))
+        return sorted(files)
+
+    async def _rescan(self) -> None:
+        """Rebuild the LRU index from what is on disk, including other workers' files"""
+        files = await asyncio.to_thread(self._scan)
+        self._entries = OrderedDict((name, size) for _, name, size in files)
+        self._total = sum(size for _, _, size in files)
+        self._scanned_at = time.monotonic()
+        self._evict()
+
+    def _evict(self) -> None:
+        if self._total <= self.max_bytes:
+            return
+        now = time.time()
+        # The most recent entry always stays
+        for name in list(self._entries)[:-1]:
+            if self._total <= self.max_bytes:
+                break
+            path = self.cache_dir / name
+            try:
+                if now - path.stat().st_mtime < EVICT_GRACE:
+                    # Served moments ago, maybe by another worker
+                    continue
+                path.unlink()
+                self.stats_counters["evictions"] += 1
+            except FileNotFoundError:
+                pass  # Already evicted by another worker
+            self._total -= self._entries.pop(name)
+
+    @staticmethod
+    def entry_name(key: str, fmt: str) -> str:
+        return f"{hashlib.sha256(key.encode()).hexdigest()}.{fmt}"
+
+    async def get(self, key: str, fmt: str, render: Callable[[Path], Awaitable[int]]) -> Path:
+        """
+        Path of a rendered transform, rendering it on a miss
+
+        Args:
+            key: Canonical key from TransformSpec.key()
+            fmt: Output format (file extension of the entry)
+            render: Coroutine factory writing the transform to the given path
+                and returning its size in bytes
+        """
+        if self._scanned_at is None or time.monotonic() - self._scanned_at > RESCAN_INTERVAL:
+            await self._rescan()
+
+        name = self.entry_name(key, fmt)
+        path = self.cache_dir / name
+        try:
+            # Touching the file both checks that it is still there and protects it from eviction
+            os.utime(path)
+            if name not in self._entries:
+                # Rendered by another worker
+                self._entries[name] = path.stat().st_size
+                self._total += self._entries[name]
+            self._entries.move_to_end(name)
+            self.stats_counters["hits"] += 1
+            return path
+        except FileNotFoundError:
+            # Never rendered, or evicted (possibly by another worker): render it again
+            if name in self._entries:
+                self._total -= self._entries.pop(name)
+
+        pending = self._inflight.get(name)
+        if pending is not None:
+            self.stats_counters["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        self.stats_counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[name] = future
+        try:
+            size = await render(path)
+            if name in self._entries:
+                self._total -= self._entries.pop(name)
+            self._entries[name] = size
+            self._total += size
+            self._evict()
+            future.set_result(path)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieve the exception so an unawaited future does not log a warning
+            future.exception()
+            raise
+        finally:
+            del self._inflight[name]
+        return path
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self.stats_counters,
+            "entries": len(self._entries),
+            "bytes": self._total,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,20 @@
+"""
+Cyrillic -> Latin transliteration shared by article slugs and product search
+"""
+import re
+
+TRANSLIT_MAP = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
+    'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
+}
+
+_NON_SLUG_RE = re.compile(r'[^a-z0-9]+')
+
+
+def slugify(text: str) -> str:
+    """URL slug of a title: transliterated, lowercase, words joined by hyphens"""
+    slug = ''.join(TRANSLIT_MAP.get(char, char) for char in text.lower())
+    return _NON_SLUG_RE.sub('-', slug).strip('-')
@@ -0,0 +1,143 @@
+"""
+Garbage collection of uploads that nothing references any more
+
+References are collected from every field that can hold an upload URL,
+streamed through projected cursors so only the set of referenced filenames
+is kept in memory. The `uploads` index is then streamed and each upload moves
+through three states, persisted on its document so runs are incremental:
+
+    referenced --(no reference)--> orphaned_at --(grace period)--> quarantined_at
+        ^                                                              |
+        +------------------(referenced again: restored)----------------+
+
+A quarantined upload is hidden from the media library and no longer served
+(404), but its bytes are kept, so a missed reference is noticed and restored
+by the next run. Uploads quarantined longer than the purge period are
+deleted through UploadStore.delete().
+"""
+import re
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Set
+from pymongo import UpdateOne
+from image_normalization import canonical_image_url
+
+logger = logging.getLogger(__name__)
+
+# collection -> fields that may contain upload URLs (dotted paths into arrays)
+REFERENCE_FIELDS: Dict[str, List[str]] = {
+    "products": ["images", "product_images.url", "size_category_images", "variants.technical_image"],
+    "articles": ["featured_image", "content"],
+    "site_settings": ["value"],
+    "hockey_clubs": ["logo_url"],
+}
+
+BATCH_SIZE = 500
+
+_UPLOAD_URL_RE = re.compile(r"/uploads/([\w.-]+)")
+
+
+def _strings(value: Any) -> Iterator[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _strings(item)
+
+
+def referenced_filenames(value: Any) -> Set[str]:
+    """
+    Upload filenames referenced anywhere inside a (projected) document
+
+    Whole-value URLs are canonicalized like product images; long text such
+    as article HTML is searched for every /uploads/<filename> occurrence.
+    """
+    found: Set[str] = set()
+    for text in _strings(value):
+        found.update(_UPLOAD_URL_RE.findall(text))
+        url = canonical_image_url(text) if len(text) < 2048 else None
+        if url and url.startswith("/api/uploads/"):
+            found.add(url[len("/api/uploads/"):])
+    return found
+
+
+async def collect_references(db) -> Set[str]:
+    """Set of every upload filename referenced by the catalog and the site"""
+    references: Set[str] = set()
+    for collection, fields in REFERENCE_FIELDS.items():
+        projection = {"_id": 0, **{name: 1 for name in fields}}
+        async for doc in db[collection].find({}, projection):
+            references |= referenced_filenames(doc)
+    return references
+
+
+@dataclass
+class GcReport:
+    scanned: int = 0
+    referenced: int = 0
+    orphaned: List[str] = field(default_factory=list)
+    quarantined: List[str] = field(default_factory=list)
+    restored: List[str] = field(default_factory=list)
+    purged: List[str] = field(default_factory=list)
+
+
+async def collect_garbage(db, store, grace: timedelta, purge_after: timedelta,
+                          purge: bool = False, dry_run: bool = False) -> GcReport:
+    """
+    Advance every upload through the orphan -> quarantine -> purge states
+
+    Args:
+        store: UploadStore used to delete purged uploads
+        grace: Time an upload stays orphaned (and a new upload stays
+            untouched) before it is quarantined
+        purge_after: Time an upload stays quarantined before it may be purged
+        purge: Actually delete uploads past `purge_after`
+        dry_run: Only report what would change
+    """
+    now = datetime.now(timezone.utc)
+    grace_cutoff = (now - grace).isoformat()
+    purge_cutoff = (now - purge_after).isoformat()
+    references = await collect_references(db)
+    report = GcReport()
+    batch: List[UpdateOne] = []
+
+    async def flush():
+        if batch and not dry_run:
+            await db.uploads.bulk_write(batch, ordered=False)
+        batch.clear()
+
+    projection = {"_id": 0, "filename": 1, "created_at": 1, "orphaned_at": 1, "quarantined_at": 1}
+    async for doc in db.uploads.find({}, projection):
+        report.scanned += 1
+        filename = doc["filename"]
+        orphaned_at = doc.get("orphaned_at")
+        quarantined_at = doc.get("quarantined_at")
+
+        if filename in references:
+            report.referenced += 1
+            if orphaned_at or quarantined_at:
+                report.restored.append(filename)
+                batch.append(UpdateOne({"filename": filename}, {"$unset": {"orphaned_at": "", "quarantined_at": ""}}))
+        elif quarantined_at:
+            if purge and quarantined_at < purge_cutoff:
+                report.purged.append(filename)
+        elif orphaned_at:
+            if orphaned_at < grace_cutoff:
+                report.quarantined.append(filename)
+                batch.append(UpdateOne({"filename": filename}, {"$set": {"quarantined_at": now.isoformat()}}))
+        elif (doc.get("created_at") or "") < grace_cutoff:
+            report.orphaned.append(filename)
+            batch.append(UpdateOne({"filename": filename}, {"$set": {"orphaned_at": now.isoformat()}}))
+
+        if len(batch) >= BATCH_SIZE:
+            await flush()
+    await flush()
+
+    if not dry_run:
+        for filename in report.purged:
+            await store.delete(filename)
+    return report
@@ -0,0 +1,224 @@
+"""
+Durable queue for upload post-processing
+
+POST /api/upload only stores the bytes and enqueues a job; derivatives and
+layout metadata (see UploadStore) are produced here by a small pool of
+asyncio workers, the CPU-bound parts running in the image process pool.
+Jobs live in the `upload_jobs` collection, so they survive restarts and any
+app node can pick them up:
+
+    queued --(claimed)--> running --> done
+      ^                      |
+      +---(error, backoff)---+-----(max attempts)--> failed
+
+A worker claims a job by atomically setting a lease. The lease is renewed
+after every step; a job whose lease expired (its worker died) is claimed
+again by another worker. Finished jobs are removed by a TTL index after
+JOB_RETENTION.
+"""
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# Processing steps, in order: (step name, UploadStore method)
+JOB_STEPS = [("derivatives", "ensure_derivatives"), ("image_meta", "ensure_image_meta")]
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 10      # seconds before the first retry, doubled per attempt
+BACKOFF_MAX = 600
+LEASE_SECONDS = 300
+POLL_INTERVAL = 5      # seconds between polls for jobs queued by other nodes or due for retry
+JOB_RETENTION = timedelta(days=7)
+
+# Fields returned by the status endpoint
+JOB_PROJECTION = {
+    "_id": 0, "id": 1, "filename": 1, "status": 1, "steps": 1, "completed_steps": 1,
+    "attempts": 1, "error": 1, "result": 1, "created_at": 1, "updated_at": 1,
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def backoff_delay(attempts: int) -> int:
+    """Seconds to wait before retrying a job that failed `attempts` times"""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Status document of a job with its progress as a fraction of steps done"""
+    steps = job.get("steps") or []
+    completed = job.get("completed_steps") or []
+    return {**job, "progress": round(len(completed) / len(steps), 2) if steps else 1.0}
+
+
+class UploadJobQueue:
+    """Mongo-backed job queue with a local pool of worker tasks"""
+
+    def __init__(self, db, store, workers: int = 2):
+        self.db = db
+        self.store = store
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    async def enqueue(self, upload_doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue post-processing of a freshly saved upload and wake a worker"""
+        now = _now().isoformat()
+        job = {
+            "id": str(uuid.uuid4()),
+            "filename": upload_doc["filename"],
+            "status": "queued",
+            "steps": [name for name, _ in JOB_STEPS],
+            "completed_steps": [],
+            "attempts": 0,
+            "error": None,
+            "result": {},
+            "run_after": now,
+            "lease_until": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await self.db.upload_jobs.insert_one(dict(job))
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_ids: List[str]) -> List[Dict[str, Any]]:
+        """Status of the given jobs; unknown ids are left out"""
+        jobs = await self.db.upload_jobs.find({"id": {"$in": job_ids}}, JOB_PROJECTION).to_list(length=len(job_ids))
+        return [job_status(job) for job in jobs]
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancel the workers; jobs they were running are handed back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        """Lease the next due job (or one whose worker's lease expired)"""
+        now = _now()
+        return await self.db.upload_jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_after": {"$lte": now.isoformat()}},
+                {"status": "running", "lease_until": {"$lt": now.isoformat()}},
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_until": (now + timedelta(seconds=LEASE_SECONDS)).isoformat(),
+                    "updated_at": now.isoformat(),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_after", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Upload job worker {number} failed to claim a job: {str(e)}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                # Shutting down: let the next start (or another node) redo the job
+                await self.db.upload_jobs.update_one(
+                    {"id": job["id"], "status": "running"},
+                    {"$set": {"status": "queued", "lease_until": None}, "$inc": {"attempts": -1}}
+                )
+                raise
+            except Exception as e:
+                # The lease expires and the job is retried
+                logger.error(f"Upload job worker {number} failed on job {job['id']}: {str(e)}")
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        """Run the remaining steps of a claimed job and record the outcome"""
+        job_id = job["id"]
+        if job["attempts"] > MAX_ATTEMPTS:
+            # Reclaimed after its worker died on the last attempt
+            await self._finish(job_id, "failed", {"error": job.get("error") or "Worker lost"})
+            return
+
+        upload = await self.db.uploads.find_one({"filename": job["filename"]}, {"_id": 0})
+        if upload is None:
+            await self._finish(job_id, "failed", {"error": "Upload no longer exists"})
+            return
+
+        completed = list(job.get("completed_steps") or [])
+        try:
+            for name, method in JOB_STEPS:
+                if name in completed:
+                    continue
+                result = await getattr(self.store, method)(upload)
+                completed.append(name)
+                now = _now()
+                await self.db.upload_jobs.update_one(
+                    {"id": job_id},
+                    {"$set": {
+                        f"result.{name}": result,
+                        "completed_steps": completed,
+                        "lease_until": (now + timedelta(seconds=LEASE_SECONDS)).isoformat(),
+                        "updated_at": now.isoformat(),
+                    }}
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            attempts = job["attempts"]
+            logger.error(f"Upload job {job_id} ({job['filename']}) failed on attempt {attempts}: {str(e)}")
+            if attempts >= MAX_ATTEMPTS:
+                await self._finish(job_id, "failed", {"error": str(e)})
+            else:
+                run_after = _now() + timedelta(seconds=backoff_delay(attempts))
+                await self.db.upload_jobs.update_one(
+                    {"id": job_id},
+                    {"$set": {
+                        "status": "queued",
+                        "error": str(e),
+                        "run_after": run_after.isoformat(),
+                        "lease_until": None,
+                        "updated_at": _now().isoformat(),
+                    }}
+                )
+            return
+
+        await self._finish(job_id, "done", {"error": None})
+
+    async def _finish(self, job_id: str, status: str, fields: Dict[str, Any]) -> None:
+        now = _now()
+        await self.db.upload_jobs.update_one(
+            {"id": job_id},
+            {"$set": {
+                **fields,
+                "status": status,
+                "lease_until": None,
+                "updated_at": now.isoformat(),
+                # BSON date for the TTL index (see db_indexes.py)
+                "expires_at": now + JOB_RETENTION,
+            }}
+        )
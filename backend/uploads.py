@@ -0,0 +1,506 @@
+"""
+Upload handling: streaming multipart parsing with size limits and
+on-the-fly hashing, and a content-addressed blob store behind the public
+upload filenames
+
+Every upload keeps its public name (/api/uploads/<uuid>.<ext>), recorded in
+the `uploads` collection together with the SHA-256 of its content. The bytes
+live once per distinct content under the storage key blobs/<sha[:2]>/<sha>
+(local disk or S3, see storage.py), with a reference count in
+`upload_blobs`. Uploading a file that is already stored is a metadata insert
+only. Files uploaded before the blob store existed stay directly in uploads/
+and keep resolving until reconcile_uploads.py adopts them into the blob store.
+
+Raster uploads also get responsive derivatives, generated once per blob
+under derived/<sha>_w<width>.<format>, and layout metadata (dominant colour,
+LQIP placeholder) stored on the upload document.
+"""
+import gzip
+import time
+import uuid
+import asyncio
+import shutil
+import hashlib
+import logging
+import mimetypes
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import aiofiles
+from cachetools import TTLCache
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from image_processing import (
+    ImageTooLargeError, extract_image_meta, generate_derivatives, is_raster, probe_dimensions
+)
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from a file per iteration
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Multipart framing and text fields accepted in a body on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+# Seconds a filename -> blob resolution is reused without asking the database
+RESOLVE_CACHE_TTL = 30
+# Seconds save() waits for a concurrent delete of the same blob before storing it again
+BLOB_DELETE_WAIT = 30
+
+
+@dataclass
+class ReceivedUpload:
+    """An upload fully written to a temporary file"""
+    temp_path: Path
+    size: int
+    sha256: str
+
+
+def hash_file(path: Path) -> ReceivedUpload:
+    """Describe a file already on disk as a received upload (blocking)"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            size += len(chunk)
+            digest.update(chunk)
+    return ReceivedUpload(temp_path=path, size=size, sha256=digest.hexdigest())
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large (max {max_bytes // (1024 * 1024)} MB)")
+
+
+@dataclass
+class ReceivedForm:
+    """A multipart/form-data request whose file part was written to a temporary file"""
+    upload: ReceivedUpload
+    filename: Optional[str]
+    fields: Dict[str, str]
+
+
+async def receive_multipart_upload(request: Request, temp_dir: Path, max_bytes: int,
+                                   file_field: str = "file") -> ReceivedForm:
+    """
+    Stream a multipart/form-data request body into a temporary file
+
+    The body is read from request.stream() and fed to an incremental
+    multipart parser, so nothing is spooled before the limit applies: a
+    Content-Length above the limit is rejected before the body is read, and
+    a body exceeding it anyway is cut off as soon as the file part passes
+    `max_bytes`. Memory use is bounded by the size of a received chunk. The
+    SHA-256 of the file is computed while writing.
+
+    Args:
+        request: Request with a multipart/form-data body
+        temp_dir: Directory for the temporary file
+        max_bytes: Largest accepted file
+        file_field: Form field holding the file; other text fields are returned in `fields`
+
+    Raises:
+        HTTPException: 400 for a body that is not valid multipart/form-data,
+            413 as soon as the file (or the body) is too large,
+            422 if the body has no file in `file_field`
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD:
+        raise _too_large(max_bytes)
+
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+
+    # The parser reports through synchronous callbacks; events are queued and
+    # handled after each chunk, where the file can be written asynchronously
+    events: List[Tuple[str, Any]] = []
+    header_name, header_value = bytearray(), bytearray()
+
+    def on_header_end() -> None:
+        events.append(("header", (bytes(header_name).lower(), bytes(header_value))))
+        header_name.clear()
+        header_value.clear()
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": lambda: events.append(("begin", None)),
+        "on_header_field": lambda data, start, end: header_name.extend(data[start:end]),
+        "on_header_value": lambda data, start, end: header_value.extend(data[start:end]),
+        "on_header_end": on_header_end,
+        "on_headers_finished": lambda: events.append(("headers_finished", None)),
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("end", None)),
+    })
+
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    temp_path = temp_dir / f"{uuid.uuid4()}.part"
+    digest = hashlib.sha256()
+    size = received = 0
+    filename: Optional[str] = None
+    fields: Dict[str, str] = {}
+    part_name: Optional[str] = None
+    part_filename: Optional[str] = None
+    writing = False
+    value = bytearray()
+
+    try:
+        async with aiofiles.open(temp_path, 'wb') as f:
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > max_bytes + MULTIPART_OVERHEAD:
+                    raise _too_large(max_bytes)
+                try:
+                    parser.write(chunk)
+                except MultipartParseError as e:
+                    raise HTTPException(status_code=400, detail=f"Malformed multipart body: {e}")
+
+                for event, data in events:
+                    if event == "begin":
+                        part_name, part_filename, value = None, None, bytearray()
+                    elif event == "header" and data[0] == b"content-disposition":
+                        _, disposition = parse_options_header(data[1])
+                        part_name = disposition.get(b"name", b"").decode("utf-8", "replace")
+                        if b"filename" in disposition:
+                            part_filename = disposition[b"filename"].decode("utf-8", "replace")
+                    elif event == "headers_finished":
+                        writing = filename is None and part_name == file_field and part_filename is not None
+                        if writing:
+                            filename = part_filename
+                    elif event == "data" and writing:
+                        size += len(data)
+                        if size > max_bytes:
+                            raise _too_large(max_bytes)
+                        digest.update(data)
+                        await f.write(data)
+                    elif event == "data" and part_filename is None:
+                        value.extend(data)
+                    elif event == "end":
+                        if part_name and part_filename is None:
+                            fields[part_name] = value.decode("utf-8", "replace")
+                        writing = False
+                events.clear()
+        parser.finalize()
+
+        if filename is None:
+            raise HTTPException(status_code=422, detail=f"Missing file field '{file_field}'")
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+    return ReceivedForm(
+        upload=ReceivedUpload(temp_path=temp_path, size=size, sha256=digest.hexdigest()),
+        filename=filename,
+        fields=fields,
+    )
+
+
+# Uploads worth serving precompressed (text formats); raster images are already compressed
+PRECOMPRESSED_EXTENSIONS = {'.svg'}
+_ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def _compress_file(source: str, destination: str, encoding: str) -> None:
+    """Write a br/gzip-compressed copy of a file (blocking)"""
+    with open(source, 'rb') as f:
+        data = f.read()
+    if encoding == "br":
+        import brotli
+        compressed = brotli.compress(data, quality=11)
+    else:
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    with open(destination, 'wb') as f:
+        f.write(compressed)
+
+
+def available_encodings() -> List[str]:
+    """Precompression encodings in order of preference; br needs the brotli package"""
+    try:
+        import brotli  # noqa: F401
+        return ["br", "gzip"]
+    except ImportError:
+        return ["gzip"]
+
+
+def content_type_of(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+class UploadStore:
+    """Maps public upload filenames to deduplicated content-addressed blobs"""
+
+    def __init__(self, db, storage: Storage, temp_dir: Path,
+                 on_image_meta: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            on_image_meta: Called with the filename once ensure_image_meta has
+                stored the metadata of an upload
+        """
+        self.db = db
+        self.storage = storage
+        self._on_image_meta = on_image_meta
+        # Local scratch space for rendering and downloads
+        self.temp_dir = temp_dir
+        # filename -> sha256. Dropped here when this process deletes the upload;
+        # a delete or quarantine by another process (upload_gc.py) is seen
+        # once the entry expires, after at most RESOLVE_CACHE_TTL seconds
+        self._resolved: TTLCache = TTLCache(maxsize=10000, ttl=RESOLVE_CACHE_TTL)
+        # Precompressed sibling keys known to exist
+        self._siblings: TTLCache = TTLCache(maxsize=10000, ttl=3600)
+
+    @staticmethod
+    def blob_key(sha256: str) -> str:
+        return f"blobs/{sha256[:2]}/{sha256}"
+
+    @staticmethod
+    def derived_key(name: str) -> str:
+        return f"derived/{name}"
+
+    def local_copy(self, key: str):
+        """Async context manager yielding a local file with the object's bytes"""
+        return self.storage.local_copy(key, self.temp_dir)
+
+    async def save(self, received: ReceivedUpload, filename: str, original_name: Optional[str],
+                   uploader: Optional[str] = None, created_at: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Register a received upload under a public filename
+
+        The temp file becomes the blob only if this content is not stored
+        yet; otherwise it is discarded and just a metadata document is added.
+
+        Args:
+            uploader: Free-form name of who uploaded the file
+            created_at: Upload time to record (defaults to now)
+
+        Returns:
+            The `uploads` document
+        """
+        created_at = created_at or datetime.now(timezone.utc).isoformat()
+        content_type = content_type_of(filename)
+        # Read while the bytes are still local, whatever the storage driver
+        dimensions = await probe_dimensions(received.temp_path) if is_raster(filename) else None
+
+        previous = await self.db.upload_blobs.find_one_and_update(
+            {"_id": received.sha256},
+            {
+                "$inc": {"refcount": 1},
+                "$setOnInsert": {"size": received.size, "created_at": created_at},
+            },
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        blob_key = self.blob_key(received.sha256)
+        if previous is not None and previous.get("deleting_since"):
+            # The last reference was just deleted and delete() is removing the bytes
+            await self._wait_for_blob_delete(received.sha256)
+            await self.storage.put_file(blob_key, received.temp_path, content_type)
+        elif previous is not None and await self.storage.exists(blob_key):
+            received.temp_path.unlink(missing_ok=True)
+            logger.info(f"Upload {filename} deduplicated to blob {received.sha256[:12]}")
+        else:
+            await self.storage.put_file(blob_key, received.temp_path, content_type)
+
+        doc = {
+            "filename": filename,
+            "sha256": received.sha256,
+            "size": received.size,
+            "content_type": content_type,
+            "width": dimensions[0] if dimensions else None,
+            "height": dimensions[1] if dimensions else None,
+            "original_name": original_name,
+            "uploader": uploader,
+            "created_at": created_at,
+        }
+        await self.db.uploads.insert_one(dict(doc))
+        self._resolved[filename] = received.sha256
+        return doc
+
+    async def _wait_for_blob_delete(self, sha256: str) -> None:
+        """Wait until delete() has finished removing the objects of a blob"""
+        deadline = time.monotonic() + BLOB_DELETE_WAIT
+        while time.monotonic() < deadline:
+            if await self.db.upload_blobs.find_one({"_id": sha256, "deleting_since": {"$ne": None}}, {"_id": 1}) is None:
+                return
+            await asyncio.sleep(0.1)
+        logger.warning(f"Blob {sha256[:12]} still marked as deleting after {BLOB_DELETE_WAIT}s, storing it again")
+
+    async def ensure_derivatives(self, doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Responsive derivatives of an upload, generated on first need
+
+        Derivatives belong to the blob, so a deduplicated upload reuses the
+        ones rendered for the first copy.
+
+        Returns:
+            [{"width", "height", "format", "url", "size"}, ...] (empty for non-raster
+            files and images too large to decode)
+        """
+        if not is_raster(doc["filename"]):
+            return []
+
+        sha256 = doc["sha256"]
+        blob = await self.db.upload_blobs.find_one({"_id": sha256}, {"derivatives": 1})
+        derivatives = (blob or {}).get("derivatives")
+        if not derivatives or not all([await self.storage.exists(self.derived_key(d["name"])) for d in derivatives]):
+            output_dir = self.temp_dir / f"derived-{uuid.uuid4()}"
+            try:
+                async with self.local_copy(self.blob_key(sha256)) as source:
+                    derivatives = await generate_derivatives(source, output_dir, sha256)
+                for d in derivatives:
+                    await self.storage.put_file(
+                        self.derived_key(d["name"]), output_dir / d["name"], content_type_of(d["name"])
+                    )
+            except ImageTooLargeError as e:
+                # Retrying cannot help; the original is served without derivatives
+                logger.warning(f"No derivatives for upload {doc['filename']}: {str(e)}")
+                return []
+            finally:
+                shutil.rmtree(output_dir, ignore_errors=True)
+            await self.db.upload_blobs.update_one({"_id": sha256}, {"$set": {"derivatives": derivatives}})
+
+        result = [{**d, "url": f"/api/uploads/derived/{d['name']}"} for d in derivatives]
+        await self.db.uploads.update_one({"filename": doc["filename"]}, {"$set": {"derivatives": result}})
+        return result
+
+    async def ensure_image_meta(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Width/height, dominant colour and LQIP placeholder of a raster upload
+
+        Computed once per blob in the image process pool and copied onto the
+        `uploads` document, where product and article responses pick it up.
+        The "uploads" collection version is bumped afterwards, which changes
+        the ETag of catalog responses and clears the catalog caches of every
+        worker process (see http_cache.CollectionVersions).
+
+        Returns:
+            {"width", "height", "dominant_color", "lqip"} (empty for non-raster files
+            and images too large to decode)
+        """
+        if not is_raster(doc["filename"]):
+            return {}
+
+        sha256 = doc["sha256"]
+        blob = await self.db.upload_blobs.find_one({"_id": sha256}, {"image_meta": 1})
+        meta = (blob or {}).get("image_meta")
+        if not meta:
+            try:
+                async with self.local_copy(self.blob_key(sha256)) as source:
+                    meta = await extract_image_meta(source)
+            except ImageTooLargeError as e:
+                logger.warning(f"No image metadata for upload {doc['filename']}: {str(e)}")
+                return {}
+            await self.db.upload_blobs.update_one({"_id": sha256}, {"$set": {"image_meta": meta}})
+
+        await self.db.uploads.update_one({"filename": doc["filename"]}, {"$set": meta})
+        if self._on_image_meta is not None:
+            self._on_image_meta(doc["filename"])
+        await self.db.collection_versions.update_one({"_id": "uploads"}, {"$inc": {"v": 1}}, upsert=True)
+        return meta
+
+    async def resolve(self, filename: str) -> Optional[str]:
+        """Storage key of the bytes behind a public filename, or None"""
+        sha256 = self._resolved.get(filename)
+        if sha256 is None:
+            # Quarantined uploads (see upload_gc.py) are no longer served
+            doc = await self.db.uploads.find_one(
+                {"filename": filename, "quarantined_at": None}, {"_id": 0, "sha256": 1}
+            )
+            if doc:
+                sha256 = self._resolved[filename] = doc["sha256"]
+        if sha256 is not None:
+            return self.blob_key(sha256)
+
+        # Not indexed yet: a file lying directly in the upload directory
+        if "/" not in filename and await self.storage.exists(filename):
+            return filename
+        return None
+
+    @staticmethod
+    def content_id(filename: str, key: str) -> str:
+        """
+        Identifier of the bytes behind a resolved key, for ETags and derived-content caches
+
+        Blobs are named by their SHA-256; legacy files by their (UUID) name.
+        """
+        if key.startswith("blobs/"):
+            return key.rsplit("/", 1)[1]
+        return f"legacy:{filename}"
+
+    async def precompressed(self, filename: str, key: str, accept_encoding: str) -> Optional[Tuple[str, str]]:
+        """
+        Precompressed sibling of a blob matching the client's Accept-Encoding
+
+        Siblings (<blob>.br, <blob>.gz) are written on first request and
+        removed together with the blob.
+
+        Returns:
+            (sibling key, content coding), or None to serve the blob as-is
+        """
+        if Path(filename).suffix.lower() not in PRECOMPRESSED_EXTENSIONS or not key.startswith("blobs/"):
+            return None
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+        for encoding in available_encodings():
+            if encoding not in accepted:
+                continue
+            sibling = key + _ENCODING_SUFFIXES[encoding]
+            if sibling not in self._siblings and not await self.storage.exists(sibling):
+                self.temp_dir.mkdir(parents=True, exist_ok=True)
+                compressed = self.temp_dir / f"{uuid.uuid4()}{_ENCODING_SUFFIXES[encoding]}"
+                async with self.local_copy(key) as source:
+                    await asyncio.to_thread(_compress_file, str(source), str(compressed), encoding)
+                await self.storage.put_file(sibling, compressed, content_type_of(filename), encoding)
+            self._siblings[sibling] = True
+            return sibling, encoding
+        return None
+
+    async def delete(self, filename: str) -> bool:
+        """
+        Remove a public filename; the blob goes away with its last reference
+
+        The blob document is marked with `deleting_since` while its objects
+        are removed from storage and only dropped afterwards, if its refcount
+        is still zero. A save() of the same content meanwhile revives the
+        document, waits for the mark to go away and stores the bytes again.
+
+        Returns:
+            False if no such upload exists
+        """
+        doc = await self.db.uploads.find_one_and_delete({"filename": filename})
+        self._resolved.pop(filename, None)
+        if doc is None:
+            if "/" in filename or not await self.storage.exists(filename):
+                return False
+            await self.storage.delete([filename])
+            return True
+
+        sha256 = doc["sha256"]
+        blob = await self.db.upload_blobs.find_one_and_update(
+            {"_id": sha256, "refcount": {"$gt": 0}},
+            {"$inc": {"refcount": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob is None or blob.get("refcount", 0) > 0:
+            return True
+
+        blob = await self.db.upload_blobs.find_one_and_update(
+            {"_id": sha256, "refcount": {"$lte": 0}, "deleting_since": None},
+            {"$set": {"deleting_since": datetime.now(timezone.utc).isoformat()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob is None:
+            # Revived by a save() or already being deleted
+            return True
+
+        blob_key = self.blob_key(sha256)
+        keys = [blob_key] + [blob_key + suffix for suffix in _ENCODING_SUFFIXES.values()]
+        keys += [self.derived_key(d["name"]) for d in blob.get("derivatives") or []]
+        for key in keys:
+            self._siblings.pop(key, None)
+        try:
+            await self.storage.delete(keys)
+        finally:
+            # Re-check the refcount now that the bytes are gone
+            result = await self.db.upload_blobs.delete_one({"_id": sha256, "refcount": {"$lte": 0}})
+            if not result.deleted_count:
+                await self.db.upload_blobs.update_one({"_id": sha256}, {"$unset": {"deleting_since": ""}})
+        return True
@@ -0,0 +1,62 @@
+"""
+Verify that every query shape issued by the server is served by an index
+Run: python verify_indexes.py [--apply]
+
+  --apply   create missing indexes from the manifest before verifying
+
+Exits with status 1 if any query shape still uses a COLLSCAN.
+"""
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+from db_indexes import QUERY_SHAPES, ensure_indexes, plan_stages
+
+load_dotenv()
+
+
+async def verify_indexes(apply: bool) -> int:
+    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    db_name = os.environ.get('DB_NAME', 'test_database')
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    print("=" * 80)
+    print(f"Verifying query plans in database: {db_name}")
+    print("=" * 80)
+
+    if apply:
+        await ensure_indexes(db)
+        print("✓ Index manifest applied")
+
+    failures = 0
+    for shape in QUERY_SHAPES:
+        cursor = db[shape["collection"]].find(shape["filter"])
+        if shape.get("sort"):
+            cursor = cursor.sort(shape["sort"])
+        explain = await cursor.explain()
+
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        stages = plan_stages(winning_plan)
+        label = f"{shape['collection']} {shape['filter']} sort={shape.get('sort')}"
+
+        if "COLLSCAN" in stages:
+            failures += 1
+            print(f"❌ COLLSCAN: {label}")
+        else:
+            print(f"✅ {' > '.join(stages)}: {label}")
+
+    print("=" * 80)
+    if failures:
+        print(f"❌ {failures} of {len(QUERY_SHAPES)} query shapes use a collection scan")
+    else:
+        print(f"✓ All {len(QUERY_SHAPES)} query shapes use an index")
+
+    client.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(verify_indexes(apply="--apply" in sys.argv)))
@@ -94,6 +94,7 @@ const CheckoutPage = () => {
         shipping_address: formData.deliveryAddress || '',
         order_notes: `Команда: ${formData.teamName || 'Не указана'}. ${formData.notes || ''}`,
         items: cartItems.map(item => ({
+          product_id: item.productId,
           product_name: item.name,
           quantity: item.quantity,
           price: item.price,
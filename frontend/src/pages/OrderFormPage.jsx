@@ -29,13 +29,7 @@ const OrderFormPage = () => {
   const [isSubmitted, setIsSubmitted] = useState(false);
   const [isSubmitting, setIsSubmitting] = useState(false);
 
-  const productTypes = [
-    { id: 'jersey', name: 'Хоккейное джерси', basePrice: 3500 },
-    { id: 'socks', name: 'Хоккейные гамаши', basePrice: 800 },
-    { id: 'training', name: 'Тренировочная форма', basePrice: 2800 },
-    { id: 'accessories', name: 'Чехлы для шорт', basePrice: 1200 },
-    { id: 'outerwear', name: 'Верхняя одежда', basePrice: 4500 }
-  ];
+  const [productTypes, setProductTypes] = useState([]);
 
   const sizeCategories = [
     { id: 'kids', name: 'Дети 110-140' },
@@ -48,6 +42,15 @@ const OrderFormPage = () => {
     window.scrollTo({ top: 0, behavior: 'smooth' });
   }, []);
 
+  // Product types and base prices are configured on the server, which prices the order
+  useEffect(() => {
+    const backendUrl = process.env.REACT_APP_BACKEND_URL;
+    fetch(`${backendUrl}/api/orders/quote-types`)
+      .then(response => response.json())
+      .then(data => setProductTypes(data.product_types || []))
+      .catch(error => console.error('Error loading product types:', error));
+  }, []);
+
   const addItem = () => {
     if (!currentItem.productType) {
       toast.error('Выберите тип товара');
@@ -63,10 +66,11 @@ const OrderFormPage = () => {
     const product = productTypes.find(p => p.id === currentItem.productType);
     const newItem = {
       id: Date.now(),
+      product_type: product.id,
       product_name: product.name,
       quantity: quantity,
       size_category: sizeCategories.find(s => s.id === currentItem.sizeCategory)?.name,
-      price: product.basePrice * quantity
+      price: product.base_price * quantity
     };
 
     setItems([...items, newItem]);
@@ -121,6 +125,7 @@ const OrderFormPage = () => {
         shipping_address: customerInfo.address,
         order_notes: customerInfo.notes ? `Команда: ${customerInfo.teamName}. ${customerInfo.notes}` : `Команда: ${customerInfo.teamName}`,
         items: items.map(item => ({
+          product_type: item.product_type,
           product_name: item.product_name,
           quantity: item.quantity,
           size_category: item.size_category,
@@ -159,7 +164,7 @@ const OrderFormPage = () => {
           setIsSubmitted(false);
         }, 5000);
       } else {
-        throw new Error(result.message || 'Ошибка при создании заказа');
+        throw new Error((typeof result.detail === 'string' && result.detail) || result.message || 'Ошибка при создании заказа');
       }
     } catch (error) {
       console.error('Order submission error:', error);
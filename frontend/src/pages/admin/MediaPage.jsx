@@ -8,29 +8,43 @@ import axios from 'axios';
 import ImageUploadGuidelines from '../../components/ImageUploadGuidelines';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || '';
+const PAGE_SIZE = 60;
 
 const MediaPage = () => {
   const [uploading, setUploading] = useState(false);
   const [loading, setLoading] = useState(true);
   const [uploadedFiles, setUploadedFiles] = useState([]);
   const [copiedUrl, setCopiedUrl] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [totalCount, setTotalCount] = useState(0);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   // Load existing files on mount
   useEffect(() => {
     fetchUploadedFiles();
   }, []);
 
+  const fetchPage = async (cursor) => {
+    const params = { limit: PAGE_SIZE };
+    if (cursor) params.cursor = cursor;
+    const response = await axios.get(`${BACKEND_URL}/api/uploads`, { params });
+    const files = response.data.map(file => ({
+      url: `${BACKEND_URL}${file.url}`,
+      filename: file.filename,
+      uploadedAt: file.uploadedAt,
+      size: file.size
+    }));
+    setNextCursor(response.headers['x-next-cursor'] || null);
+    if (response.headers['x-total-count'] !== undefined) {
+      setTotalCount(Number(response.headers['x-total-count']));
+    }
+    return files;
+  };
+
   const fetchUploadedFiles = async () => {
     try {
       setLoading(true);
-      const response = await axios.get(`${BACKEND_URL}/api/uploads`);
-      const files = response.data.map(file => ({
-        url: `${BACKEND_URL}${file.url}`,
-        filename: file.filename,
-        uploadedAt: file.uploadedAt,
-        size: file.size
-      }));
-      setUploadedFiles(files);
+      setUploadedFiles(await fetchPage(null));
     } catch (error) {
       console.error('Failed to fetch files:', error);
       toast.error('Ошибка при загрузке списка файлов');
@@ -39,6 +53,19 @@ const MediaPage = () => {
     }
   };
 
+  const loadMoreFiles = async () => {
+    try {
+      setLoadingMore(true);
+      const files = await fetchPage(nextCursor);
+      setUploadedFiles(prev => [...prev, ...files]);
+    } catch (error) {
+      console.error('Failed to fetch files:', error);
+      toast.error('Ошибка при загрузке списка файлов');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleFileUpload = async (event) => {
     const files = Array.from(event.target.files);
     if (files.length === 0) return;
@@ -162,7 +189,7 @@ const MediaPage = () => {
 
       {/* Uploaded Files Grid */}
       <div>
-        <h2 className="text-2xl font-semibold mb-6 text-gray-900">Загруженные файлы ({uploadedFiles.length})</h2>
+        <h2 className="text-2xl font-semibold mb-6 text-gray-900">Загруженные файлы ({totalCount})</h2>
         
         {loading ? (
           <div className="p-12 text-center border border-gray-200 rounded-md bg-gray-50">
@@ -181,7 +208,8 @@ const MediaPage = () => {
               <div key={index} className="overflow-hidden border border-gray-200 rounded-md group bg-white">
                 <div className="aspect-square bg-gray-100 relative overflow-hidden">
                   <img
-                    src={file.url}
+                    src={`${file.url}?w=400&h=400&fit=cover`}
+                    loading="lazy"
                     alt={file.filename}
                     className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300"
                   />
@@ -223,6 +251,19 @@ const MediaPage = () => {
             ))}
           </div>
         )}
+
+        {!loading && nextCursor && (
+          <div className="mt-8 text-center">
+            <Button
+              variant="outline"
+              onClick={loadMoreFiles}
+              disabled={loadingMore}
+              className="border-gray-300 hover:bg-gray-100 text-gray-900"
+            >
+              {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+            </Button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -54,6 +54,7 @@ const AdminOrdersPage = () => {
 
   const getStatusColor = (status) => {
     const colors = {
+      quote: 'bg-orange-100 text-orange-800',
       pending: 'bg-yellow-100 text-yellow-800',
       confirmed: 'bg-blue-100 text-blue-800',
       processing: 'bg-purple-100 text-purple-800',
@@ -66,6 +67,7 @@ const AdminOrdersPage = () => {
 
   const getStatusLabel = (status) => {
     const labels = {
+      quote: 'Заявка',
       pending: 'Ожидает',
       confirmed: 'Подтвержден',
       processing: 'В производстве',
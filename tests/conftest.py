@@ -0,0 +1,51 @@
+"""
+Shared fixtures: backend modules on sys.path and an in-memory MongoDB (mongomock_motor)
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# server.py reads these at import time; nothing connects until a query is made
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    from mongomock_motor import AsyncMongoMockClient
+
+    return AsyncMongoMockClient()["test_database"]
+
+
+@pytest.fixture
+def server(db, monkeypatch):
+    """The API module wired to the in-memory database, without its startup tasks"""
+    import server
+    from idempotency import IdempotencyStore
+    from price_index import ProductPriceMap
+
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server.collection_versions, "_db", db)
+    monkeypatch.setattr(server, "idempotency_store", IdempotencyStore(db))
+    monkeypatch.setattr(server, "price_map", ProductPriceMap())
+    monkeypatch.setattr(server.app.router, "on_startup", [])
+    monkeypatch.setattr(server.app.router, "on_shutdown", [])
+    return server
+
+
+@pytest.fixture
+def client(server):
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as client:
+        yield client
@@ -0,0 +1,28 @@
+from catalog_cache import CatalogCache
+
+
+def test_read_that_raced_an_invalidation_is_not_cached():
+    cache = CatalogCache()
+    generation = cache.generation  # Taken before the (slow) database query
+    cache.invalidate_products(["p1"], ["jerseys"])  # A write lands meanwhile
+
+    cache.set_list(("products", "jerseys"), "stale body", "jerseys", ["p1"], generation)
+    cache.set_item("p1", "stale body", generation)
+
+    assert cache.get_list(("products", "jerseys")) is None
+    assert cache.get_item("p1") is None
+    assert cache.stats()["stale_fills"] == 2
+
+
+def test_invalidation_drops_affected_entries_only():
+    cache = CatalogCache()
+    generation = cache.generation
+    cache.set_list(("products", "jerseys"), "jerseys", "jerseys", ["p1"], generation)
+    cache.set_list(("products", "socks"), "socks", "socks", ["p2"], generation)
+    cache.set_item("p2", "p2", generation)
+
+    cache.invalidate_products(["p1"], ["jerseys"])
+
+    assert cache.get_list(("products", "jerseys")) is None
+    assert cache.get_list(("products", "socks")) == "socks"
+    assert cache.get_item("p2") == "p2"
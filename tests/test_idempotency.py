@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from idempotency import IN_PROGRESS_TIMEOUT, IdempotencyStore, request_fingerprint
+
+
+@pytest.fixture
+def store(db):
+    return IdempotencyStore(db)
+
+
+def test_fingerprint_ignores_key_order():
+    assert request_fingerprint({"a": 1, "b": [1, 2]}) == request_fingerprint({"b": [1, 2], "a": 1})
+    assert request_fingerprint({"a": 1}) != request_fingerprint({"a": 2})
+
+
+@pytest.mark.anyio
+async def test_completed_request_is_replayed(store):
+    assert await store.begin("orders", "key-1", "fp") is None
+    await store.complete("orders", "key-1", 201, {"order_id": "o1"})
+
+    assert await store.begin("orders", "key-1", "fp") == {"status_code": 201, "body": {"order_id": "o1"}}
+    # Keys are scoped per endpoint
+    assert await store.begin("reviews", "key-1", "fp") is None
+
+
+@pytest.mark.anyio
+async def test_retry_while_in_progress_gets_409(store):
+    assert await store.begin("orders", "key-1", "fp") is None
+    with pytest.raises(HTTPException) as exc:
+        await store.begin("orders", "key-1", "fp")
+    assert exc.value.status_code == 409
+
+
+@pytest.mark.anyio
+async def test_key_reused_with_another_body_gets_422(store):
+    assert await store.begin("orders", "key-1", "fp") is None
+    await store.complete("orders", "key-1", 201, {"order_id": "o1"})
+    with pytest.raises(HTTPException) as exc:
+        await store.begin("orders", "key-1", "other")
+    assert exc.value.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_released_key_is_processed_again(store):
+    assert await store.begin("orders", "key-1", "fp") is None
+    await store.release("orders", "key-1")
+    assert await store.begin("orders", "key-1", "fp") is None
+
+
+@pytest.mark.anyio
+async def test_stale_in_progress_key_is_taken_over(db, store):
+    assert await store.begin("orders", "key-1", "fp") is None
+    stale = datetime.now(timezone.utc) - IN_PROGRESS_TIMEOUT * 2
+    await db.idempotency_keys.update_one({"_id": "orders:key-1"}, {"$set": {"created_at": stale}})
+    assert await store.begin("orders", "key-1", "fp") is None
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("key", ["", "x" * 256])
+async def test_invalid_key_gets_400(store, key):
+    with pytest.raises(HTTPException) as exc:
+        await store.begin("orders", key, "fp")
+    assert exc.value.status_code == 400
+
+
+ORDER = {
+    "customer_email": "team@example.com",
+    "customer_name": "Иван",
+    "customer_phone": "+7 999 123-45-67",
+    "shipping_address": "Санкт-Петербург",
+    "items": [{"product_type": "jersey", "product_name": "Джерси", "quantity": 10,
+               "size_category": "Взрослые", "price": 1}],
+    "total_amount": 10,
+}
+
+
+def test_order_retry_is_replayed_without_a_second_order(client, server):
+    first = client.post("/api/orders", json=ORDER, headers={"Idempotency-Key": "order-1"})
+    retry = client.post("/api/orders", json=ORDER, headers={"Idempotency-Key": "order-1"})
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json()["order_id"] == first.json()["order_id"]
+    assert client.portal.call(server.db.orders.count_documents, {}) == 1
+
+    changed = client.post("/api/orders", json={**ORDER, "customer_name": "Пётр"},
+                          headers={"Idempotency-Key": "order-1"})
+    assert changed.status_code == 422
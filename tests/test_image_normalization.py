@@ -0,0 +1,36 @@
+import pytest
+
+import image_normalization
+from image_normalization import canonical_image_url, normalize_product_images
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("/api/uploads/a.jpg", "/api/uploads/a.jpg"),
+    ("/uploads/a.jpg", "/api/uploads/a.jpg"),
+    ("/api/uploads/a.jpg?w=320#top", "/api/uploads/a.jpg"),
+    ("a.jpg", "/api/uploads/a.jpg"),
+    ("  /uploads/a.jpg  ", "/api/uploads/a.jpg"),
+    ("https://shop.example/api/uploads/a.jpg?v=2", "/api/uploads/a.jpg"),
+    ("https://cdn.other.com/uploads/a.jpg", "https://cdn.other.com/uploads/a.jpg"),
+    ("https://cdn.other.com/img/a.jpg", "https://cdn.other.com/img/a.jpg"),
+    ("", None),
+    ("   ", None),
+    (None, None),
+    (42, None),
+])
+def test_canonical_image_url(url, expected):
+    assert canonical_image_url(url) == expected
+
+
+def test_legacy_uploads_path_on_own_host(monkeypatch):
+    monkeypatch.setattr(image_normalization, "SITE_HOSTS", {"shop.example"})
+    assert canonical_image_url("https://shop.example/uploads/a.jpg") == "/api/uploads/a.jpg"
+    assert canonical_image_url("https://cdn.other.com/uploads/a.jpg") == "https://cdn.other.com/uploads/a.jpg"
+
+
+def test_normalize_dedupes_equivalent_urls():
+    result = normalize_product_images({
+        "images": ["/uploads/a.jpg", "/api/uploads/a.jpg?w=640", "https://cdn.other.com/b.jpg", ""],
+    })
+    assert result["images"] == ["/api/uploads/a.jpg", "https://cdn.other.com/b.jpg"]
+    assert result["image_index"]["cover"] == "/api/uploads/a.jpg"
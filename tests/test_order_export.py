@@ -0,0 +1,60 @@
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+from order_export import export_csv, export_xlsx, safe_cell
+
+ORDER = {
+    "id": "o1", "created_at": "2025-01-01T00:00:00", "status": "pending",
+    "customer_name": "=HYPERLINK(\"http://evil\")", "customer_email": "a@example.com",
+    "customer_phone": "+7 (999) 123-45-67", "shipping_address": "-1+2", "total_amount": 100,
+    "items": [{"product_name": "@SUM(A1)", "size_category": "adult", "quantity": 2, "price": 50}],
+}
+
+
+class Cursor:
+    def __init__(self, docs):
+        self._docs = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("=1+2", "'=1+2"),
+    ("@cmd", "'@cmd"),
+    ("-1+2", "'-1+2"),
+    ("+7 (999) 123-45-67", "+7 (999) 123-45-67"),
+    ("-42", "-42"),
+    ("Иван", "Иван"),
+    (100, 100),
+    (None, None),
+])
+def test_safe_cell(value, expected):
+    assert safe_cell(value) == expected
+
+
+@pytest.mark.anyio
+async def test_csv_escapes_formulas_but_not_phones():
+    body = b"".join([chunk async for chunk in export_csv(Cursor([ORDER]))]).decode("utf-8-sig")
+    row = body.splitlines()[1]
+    assert "'=HYPERLINK" in row and "'@SUM(A1)" in row and "'-1+2" in row
+    assert ",+7 (999) 123-45-67," in row
+
+
+@pytest.mark.anyio
+async def test_xlsx_stores_text_as_strings():
+    body = b"".join([chunk async for chunk in export_xlsx(Cursor([ORDER]))])
+    row = list(load_workbook(io.BytesIO(body))["Orders"].iter_rows(min_row=2))[0]
+    assert [cell.data_type for cell in row[3:7]] == ["s"] * 4
+    assert row[3].value == "=HYPERLINK(\"http://evil\")"
+    assert row[5].value == "+7 (999) 123-45-67"
+    assert row[6].value == "-1+2"
+    assert row[9].value == "@SUM(A1)"
@@ -0,0 +1,84 @@
+import pytest
+from fastapi import HTTPException
+
+from models import OrderCreate
+from price_index import QUOTE_PRODUCT_TYPES
+
+PRODUCTS = [
+    {"id": "p1", "name": "Хоккейное джерси Pro", "base_price": 4200, "is_active": True, "variants": [{"id": "v1"}]},
+    {"id": "p2", "name": "Гамаши", "base_price": 900, "is_active": True},
+    {"id": "p3", "name": "Снятый товар", "base_price": 100, "is_active": False},
+]
+
+
+def order(*items, total_amount=1):
+    return OrderCreate(
+        customer_email="team@example.com", customer_name="Иван", customer_phone="+7 999 123-45-67",
+        shipping_address="Санкт-Петербург", items=list(items), total_amount=total_amount,
+    )
+
+
+def item(product_name, price=1, quantity=10, **fields):
+    return {"product_name": product_name, "quantity": quantity, "size_category": "adult", "price": price, **fields}
+
+
+@pytest.fixture
+async def catalog(server):
+    await server.db.products.insert_many([dict(product) for product in PRODUCTS])
+    return server
+
+
+@pytest.mark.anyio
+async def test_client_prices_are_replaced_by_catalog_prices(catalog):
+    items = await catalog.price_order_items(order(
+        item("ignored", product_id="p1", variant_id="v1"),
+        item("Гамаши"),  # Older clients send only the name
+        item("ignored", product_id="p1", variant_id="not-a-variant"),
+    ))
+    assert [(i["product_id"], i["variant_id"], i["price"]) for i in items] == [
+        ("p1", "v1", 4200), ("p2", None, 900), ("p1", None, 4200),
+    ]
+
+
+@pytest.mark.anyio
+async def test_unknown_and_inactive_items_are_rejected(catalog):
+    with pytest.raises(HTTPException) as exc:
+        await catalog.price_order_items(order(
+            item("Джерси", product_id="p1"), item("Нет такого", product_id="missing"), item("Снятый товар"),
+        ))
+    assert exc.value.status_code == 422
+    assert "Нет такого" in exc.value.detail and "Снятый товар" in exc.value.detail
+
+
+@pytest.mark.anyio
+async def test_quote_items_are_priced_from_the_quote_table(catalog):
+    items = await catalog.price_order_items(order(item("anything", product_type="jersey")))
+    assert items[0]["price"] == QUOTE_PRODUCT_TYPES["jersey"]["base_price"]
+    assert items[0]["product_name"] == QUOTE_PRODUCT_TYPES["jersey"]["name"]
+
+    with pytest.raises(HTTPException) as exc:
+        await catalog.price_order_items(order(item("Шлем", product_type="helmet")))
+    assert exc.value.status_code == 422
+
+
+def test_order_total_is_recomputed_on_the_server(server, client):
+    client.portal.call(server.db.products.insert_many, [dict(product) for product in PRODUCTS])
+    response = client.post("/api/orders", json=order(
+        item("Джерси", product_id="p1", quantity=10), item("Гамаши", product_id="p2", quantity=20),
+        total_amount=5,
+    ).model_dump())
+    assert response.status_code == 201
+
+    stored = client.portal.call(server.db.orders.find_one, {"id": response.json()["order_id"]})
+    assert stored["total_amount"] == 10 * 4200 + 20 * 900
+    assert stored["client_total_amount"] == 5
+    assert stored["status"] == "pending"
+
+
+def test_quote_request_is_stored_as_a_quote(server, client):
+    response = client.post("/api/orders", json=order(item("Джерси", product_type="socks", quantity=12)).model_dump())
+    assert response.status_code == 201
+
+    stored = client.portal.call(server.db.orders.find_one, {"id": response.json()["order_id"]})
+    assert stored["status"] == "quote"
+    assert stored["total_amount"] == 12 * QUOTE_PRODUCT_TYPES["socks"]["base_price"]
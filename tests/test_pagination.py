@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from pagination import KEYSET_SORT, decode_cursor, encode_cursor, keyset_query
+
+
+@pytest.mark.parametrize("created_at, expected", [
+    ("2025-01-02T03:04:05+00:00", "2025-01-02T03:04:05+00:00"),
+    (datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc), "2025-01-02T03:04:05+00:00"),
+    (None, None),
+])
+def test_cursor_round_trip(created_at, expected):
+    cursor = encode_cursor(created_at, "product-1")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (expected, "product-1")
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "e30", ""])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_keyset_query_without_cursor_keeps_the_query():
+    assert keyset_query({"is_active": True}, None) == {"is_active": True}
+
+
+@pytest.mark.anyio
+async def test_pages_cover_every_document_once(db):
+    # Equal created_at values (ties broken by id) and documents without created_at
+    docs = [{"id": f"p{i:02d}", "created_at": f"2025-01-{1 + i // 3:02d}T00:00:00"} for i in range(10)]
+    docs += [{"id": "q1", "created_at": None}, {"id": "q2", "created_at": None}]
+    await db.products.insert_many(docs)
+
+    seen, cursor = [], None
+    for _ in range(len(docs)):
+        page = await db.products.find(keyset_query({}, cursor), {"_id": 0}).sort(KEYSET_SORT).limit(4).to_list(4)
+        if not page:
+            break
+        seen += [doc["id"] for doc in page]
+        cursor = encode_cursor(page[-1]["created_at"], page[-1]["id"])
+
+    assert sorted(seen) == sorted(doc["id"] for doc in docs)
+    assert len(seen) == len(set(seen))
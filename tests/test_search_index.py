@@ -0,0 +1,68 @@
+import pytest
+
+from search_index import ProductSearchIndex, detransliterate, stem_russian, transliterate, word_terms
+from translit import slugify
+
+
+@pytest.mark.parametrize("forms", [
+    ("хоккейная", "хоккейное", "хоккейной"),
+    ("форма", "формы", "форму"),
+    ("гамаши", "гамаш"),
+])
+def test_inflected_forms_share_a_stem(forms):
+    assert len({stem_russian(word) for word in forms}) == 1
+
+
+def test_transliteration_round_trip():
+    assert transliterate("хоккейная") == "hokkeynaya"
+    assert detransliterate("hokkeynaya") == "хоккейная"
+
+
+def test_latin_and_cyrillic_words_share_terms():
+    assert word_terms("хоккейная") & word_terms("hokkeynaya")
+    assert word_terms("джерси") & word_terms("dzhersi")
+
+
+def test_slugify_uses_the_same_transliteration():
+    assert slugify("Хоккейное джерси 2024!") == "hokkeynoe-dzhersi-2024"
+
+
+@pytest.fixture
+def index():
+    index = ProductSearchIndex()
+    index.upsert({"id": "1", "name": "Хоккейное джерси", "description": "Игровая форма", "is_active": True})
+    index.upsert({"id": "2", "name": "Хоккейные гамаши", "description": "Для тренировок", "is_active": True})
+    index.upsert({"id": "3", "name": "Тренировочная форма", "is_active": False})
+    return index
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("джерси", ["1"]),
+    ("dzhersi", ["1"]),
+    ("хоккейная", ["1", "2"]),
+    ("hokkeynye gamashi", ["2"]),
+    ("хоккейное дж", ["1"]),
+])
+def test_search_matches_inflections_and_transliteration(index, query, expected):
+    assert sorted(card["id"] for card in index.search(query)) == expected
+
+
+def test_search_skips_inactive_products_unless_asked(index):
+    assert index.search("тренировочная") == []
+    assert [card["id"] for card in index.search("тренировочная", include_inactive=True)] == ["3"]
+
+
+def test_remove_drops_the_terms_of_a_product(index):
+    index.remove("1")
+    assert index.search("джерси") == []
+    assert all(index._postings[term] for term in index._terms)
+
+
+@pytest.mark.anyio
+async def test_rebuild_keeps_terms_sorted(db, index):
+    await db.products.insert_many([
+        {"id": str(i), "name": f"Джерси модель {i}", "is_active": True} for i in range(20)
+    ])
+    await index.rebuild(db)
+    assert index._terms == sorted(index._postings)
+    assert len(index.search("dzhersi", limit=50)) == 20
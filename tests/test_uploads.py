@@ -0,0 +1,66 @@
+import pytest
+
+from storage import LocalStorage
+from uploads import UploadStore, hash_file
+
+
+@pytest.fixture
+def store(db, tmp_path):
+    return UploadStore(db, LocalStorage(tmp_path / "uploads"), tmp_path / "tmp")
+
+
+def receive(store, content: bytes, name: str):
+    """A received upload of the given bytes, as receive_multipart_upload leaves it"""
+    store.temp_dir.mkdir(parents=True, exist_ok=True)
+    path = store.temp_dir / f"{name}.part"
+    path.write_bytes(content)
+    return hash_file(path)
+
+
+async def refcount(db, sha256):
+    blob = await db.upload_blobs.find_one({"_id": sha256})
+    return None if blob is None else blob["refcount"]
+
+
+@pytest.mark.anyio
+async def test_identical_content_is_stored_once(db, store):
+    first = await store.save(receive(store, b"same bytes", "a"), "a.txt", "a.txt")
+    second = await store.save(receive(store, b"same bytes", "b"), "b.txt", "b.txt")
+    other = await store.save(receive(store, b"other bytes", "c"), "c.txt", "c.txt")
+
+    assert first["sha256"] == second["sha256"] != other["sha256"]
+    assert await refcount(db, first["sha256"]) == 2
+    assert await refcount(db, other["sha256"]) == 1
+    assert await store.storage.exists(store.blob_key(first["sha256"]))
+    # The duplicate's temporary file is discarded instead of stored
+    assert list(store.temp_dir.iterdir()) == []
+    assert await store.resolve("a.txt") == await store.resolve("b.txt") == store.blob_key(first["sha256"])
+
+
+@pytest.mark.anyio
+async def test_blob_is_deleted_with_its_last_reference(db, store):
+    first = await store.save(receive(store, b"shared", "a"), "a.txt", "a.txt")
+    await store.save(receive(store, b"shared", "b"), "b.txt", "b.txt")
+    blob_key = store.blob_key(first["sha256"])
+
+    assert await store.delete("a.txt") is True
+    assert await refcount(db, first["sha256"]) == 1
+    assert await store.storage.exists(blob_key)
+    assert await store.resolve("a.txt") is None
+    assert await store.resolve("b.txt") == blob_key
+
+    assert await store.delete("b.txt") is True
+    assert await refcount(db, first["sha256"]) is None
+    assert not await store.storage.exists(blob_key)
+
+    assert await store.delete("b.txt") is False
+
+
+@pytest.mark.anyio
+async def test_content_can_be_uploaded_again_after_deletion(db, store):
+    first = await store.save(receive(store, b"revived", "a"), "a.txt", "a.txt")
+    await store.delete("a.txt")
+    await store.save(receive(store, b"revived", "b"), "b.txt", "b.txt")
+
+    assert await refcount(db, first["sha256"]) == 1
+    assert await store.storage.exists(store.blob_key(first["sha256"]))